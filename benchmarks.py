@@ -0,0 +1,200 @@
+# ~/Apps/genie/benchmarks.py
+from typing import Any, Callable, Dict, List
+from datetime import datetime, timezone
+import argparse
+import json
+import platform
+import random
+import subprocess
+import time
+import tracemalloc
+
+import numpy as np
+
+from models import Location, Lead, Partner
+from synthetic_data_seeder import SyntheticDataSeeder
+from business_filter import BusinessFilter
+from matchmaking_model import MatchMakingModel
+
+CENTER = Location(lat=28.65, lng=77.275)
+
+# Named scenarios: SyntheticDataSeeder knobs + how leads are scattered around the center.
+# Keep these stable; changing one invalidates every stored result for it.
+SCENARIOS: Dict[str, Dict[str, Any]] = {
+    'dense_urban': {
+        'radius': 1500.0,
+        'knobs': {
+            'num_partners': 60, 'customers': 6000, 'recent_lead_locations': 1500, 'splitter_locations': 1500,
+            'customer_cluster_sigma_m': 50.0, 'lead_cluster_sigma_m': 150.0, 'splitter_cluster_sigma_m': 80.0,
+            'outlier_rate': 0.02, 'special_outlier_rate': 0.10,
+        },
+        'lead_sigma_m': 750.0,
+    },
+    'sparse_rural': {
+        'radius': 8000.0,
+        'knobs': {
+            'num_partners': 30, 'customers': 1500, 'recent_lead_locations': 300, 'splitter_locations': 600,
+            'customer_cluster_sigma_m': 400.0, 'lead_cluster_sigma_m': 800.0, 'splitter_cluster_sigma_m': 600.0,
+            'outlier_rate': 0.05, 'special_outlier_rate': 0.10,
+        },
+        'lead_sigma_m': 4000.0,
+    },
+    'high_competition': {
+        'radius': 600.0,
+        'knobs': {
+            'num_partners': 60, 'customers': 4000, 'recent_lead_locations': 1000, 'splitter_locations': 800,
+            'customer_cluster_sigma_m': 60.0, 'lead_cluster_sigma_m': 100.0, 'splitter_cluster_sigma_m': 80.0,
+            'outlier_rate': 0.02, 'special_outlier_rate': 0.30,
+        },
+        'lead_sigma_m': 200.0,
+    },
+}
+
+def make_seeder(scenario: Dict[str, Any]) -> SyntheticDataSeeder:
+    seeder = SyntheticDataSeeder(center_lat=CENTER.lat, center_lng=CENTER.lng, radius=scenario['radius'])
+    for knob, value in scenario['knobs'].items():
+        setattr(seeder, knob, value)
+    return seeder
+
+def make_leads(scenario: Dict[str, Any], num_leads: int, seed: int) -> List[Lead]:
+    # Gaussian scatter around the center, from its own RNG so it doesn't depend on seeding
+    rng = random.Random(seed)
+    sigma_deg = scenario['lead_sigma_m'] / 111000
+    return [
+        Lead(mobile=f"+91{rng.randrange(10**9):09d}",
+             location=Location(lat=round(CENTER.lat + rng.gauss(0, sigma_deg), 6),
+                               lng=round(CENTER.lng + rng.gauss(0, sigma_deg), 6)))
+        for _ in range(num_leads)
+    ]
+
+def stage_stats(latencies: List[float], peak_mem: int) -> Dict[str, Any]:
+    lat_ms = np.array(latencies) * 1000
+    total = float(np.sum(latencies))
+    return {
+        'calls': len(latencies),
+        'total_s': total,
+        'throughput_per_s': len(latencies) / total if total > 0 else None,
+        'latency_ms': {
+            'mean': float(lat_ms.mean()),
+            'p50': float(np.percentile(lat_ms, 50)),
+            'p90': float(np.percentile(lat_ms, 90)),
+            'p99': float(np.percentile(lat_ms, 99)),
+            'max': float(lat_ms.max()),
+        },
+        'peak_mem_bytes': peak_mem,
+    }
+
+def timed(calls: List[Callable[[], Any]]) -> List[float]:
+    latencies = []
+    for call in calls:
+        start = time.perf_counter()
+        call()
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+def peak_memory(calls: List[Callable[[], Any]]) -> int:
+    # Separate pass: tracemalloc slows allocation down, so it never runs during timing
+    tracemalloc.start()
+    try:
+        for call in calls:
+            call()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def run_scenario(name: str, num_leads: int = 200, seed_repeats: int = 3, lead_seed: int = 7) -> Dict[str, Any]:
+    scenario = SCENARIOS[name]
+    # A fresh seeder per call, same as a real run (seeding is deterministic either way)
+    seed_latencies = timed([lambda: make_seeder(scenario).seed() for _ in range(seed_repeats)])
+    partners: List[Partner] = []
+    seed_peak = peak_memory([lambda: partners.extend(make_seeder(scenario).seed())])
+
+    leads = make_leads(scenario, num_leads, lead_seed)
+    start = time.perf_counter()
+    business_filter = BusinessFilter(partners)
+    setup_s = time.perf_counter() - start
+
+    notified: List[List[Partner]] = []
+    filter_calls = [lambda lead=lead: business_filter.notified_partners(lead) for lead in leads]
+    filter_latencies = timed(filter_calls)
+    filter_peak = peak_memory(filter_calls)
+    notified = [business_filter.notified_partners(lead) for lead in leads]
+
+    match_calls = [lambda lead=lead, n=n: MatchMakingModel(n).match(lead) for lead, n in zip(leads, notified)]
+    match_latencies = timed(match_calls)
+    match_peak = peak_memory(match_calls)
+
+    return {
+        'partners': len(partners),
+        'points': sum(len(p.active_customers) + len(p.inactive_but_geographically_relevant_customers) +
+                      len(p.recent_leads_interested_in) + len(p.splitters) for p in partners),
+        'leads': num_leads,
+        'mean_notified': float(np.mean([len(n) for n in notified])),
+        'filter_setup_s': setup_s,
+        'stages': {
+            'seed': stage_stats(seed_latencies, seed_peak),
+            'notified_partners': stage_stats(filter_latencies, filter_peak),
+            'match': stage_stats(match_latencies, match_peak),
+        },
+    }
+
+def environment() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'processor': platform.processor(),
+    }
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any]) -> List[str]:
+    # One line per scenario/stage in both runs: p50 latency and peak memory relative to the baseline
+    lines = []
+    for name, result in current['scenarios'].items():
+        base = baseline['scenarios'].get(name)
+        if base is None:
+            continue
+        for stage, stats in result['stages'].items():
+            old = base['stages'].get(stage)
+            if old is None:
+                continue
+            p50 = stats['latency_ms']['p50'] / old['latency_ms']['p50'] if old['latency_ms']['p50'] else float('nan')
+            mem = stats['peak_mem_bytes'] / old['peak_mem_bytes'] if old['peak_mem_bytes'] else float('nan')
+            lines.append(f"{name:18} {stage:18} p50 x{p50:6.2f}   peak mem x{mem:6.2f}")
+    return lines
+
+def run(scenarios: List[str], num_leads: int, seed_repeats: int) -> Dict[str, Any]:
+    return {
+        'environment': environment(),
+        'settings': {'num_leads': num_leads, 'seed_repeats': seed_repeats},
+        'scenarios': {name: run_scenario(name, num_leads, seed_repeats) for name in scenarios},
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Time seeding, filtering and matching on named synthetic scenarios")
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS), help="Repeatable; default: all")
+    parser.add_argument('--leads', type=int, default=200, help="Leads per scenario")
+    parser.add_argument('--seed-repeats', type=int, default=3, help="Timed seed() runs per scenario")
+    parser.add_argument('--out', help="Write the results here as JSON")
+    parser.add_argument('--compare', help="Earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    results = run(args.scenario or list(SCENARIOS), args.leads, args.seed_repeats)
+    for name, result in results['scenarios'].items():
+        print(f"{name}: {result['partners']} partners, {result['points']} points, {result['mean_notified']:.1f} notified/lead")
+        for stage, stats in result['stages'].items():
+            lat = stats['latency_ms']
+            print(f"  {stage:18} {stats['throughput_per_s'] or 0:10.1f}/s  p50 {lat['p50']:8.3f}ms  "
+                  f"p99 {lat['p99']:8.3f}ms  peak {stats['peak_mem_bytes'] / 1e6:7.2f}MB")
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            print("\nAgainst", args.compare)
+            print("\n".join(compare(json.load(f), results)))
@@ -1,22 +1,29 @@
-from typing import List
-from math import radians, sin, cos, sqrt, atan2
+from typing import Dict, List, Optional, Sequence, Tuple
 
-from models import Location, Lead, Customer, Partner
+from models import Location, Lead, Partner
+from distance import haversine, haversine_matrix, min_distance, to_arrays
+from spatial_index import GridIndex, min_by_owner, CUSTOMER_KINDS, REFERENCE_KINDS
+from distance_profile import DistanceProfile, PROFILE_RADIUS_M
+from metrics import current_trace
+from competition import CompetitionLayer, MAX_PARTNERS_200M, MIN_PARTNERS_100M
+
+# Cap on leads x points per distance matrix in the batch paths (~16MB per float64 temporary)
+MAX_MATRIX_ELEMS = 2_000_000
 
 class BusinessFilter:
-    def __init__(self, partners: List[Partner], x: int = 5) -> None:
+    def __init__(self, partners: Sequence[Partner], x: int = 5, cell_size_m: float = 250.0,
+                 index: Optional[GridIndex] = None, competition: Optional[CompetitionLayer] = None) -> None:
         self.partners = partners
         self.x = x
+        # Built once; every radius query below only touches nearby cells. Pass a prebuilt
+        # index over these partners (e.g. Snapshot.index) to skip building it.
+        self.index = index if index is not None else GridIndex(partners, cell_size_m=cell_size_m)
+        # Optional precomputed competition layer over self.index; leads it can settle skip the
+        # 200m/100m counting below
+        self.competition = competition
 
     def haversine(self, loc1: Location, loc2: Location) -> float:
-        R = 6371000  # Earth radius in meters
-        lat1, lon1 = radians(loc1.lat), radians(loc1.lng)
-        lat2, lon2 = radians(loc2.lat), radians(loc2.lng)
-        dlat = lat2 - lat1
-        dlon = lon2 - lon1
-        a = sin(dlat / 2)**2 + cos(lat1) * cos(lat2) * sin(dlon / 2)**2
-        c = 2 * atan2(sqrt(a), sqrt(1 - a))
-        return R * c
+        return haversine(loc1, loc2)
 
     def get_locations(self, partner: Partner) -> List[Location]:
         return (
@@ -26,48 +33,106 @@ class BusinessFilter:
         )
 
     def min_distance(self, lead_loc: Location, partner: Partner) -> float:
-        locs = self.get_locations(partner)
-        if not locs:
-            return float('inf')
-        return min(self.haversine(lead_loc, loc) for loc in locs)
+        return min_distance(lead_loc, *to_arrays(self.get_locations(partner)))
 
-    def notified_partners(self, lead: Lead) -> List[Partner]:
-        lead_loc = lead.location
-        # Eligible: partners with min_dist <= 500m (rule a)
-        eligible = [p for p in self.partners if self.min_distance(lead_loc, p) <= 500]
-        if not eligible:
-            return []
+    def min_distances_within(self, lead_loc: Location, radius: float, kinds: Sequence[int] = REFERENCE_KINDS) -> Dict[int, float]:
+        # Partner index -> min distance, only for partners with a point of the given kinds within radius
+        ids, dists = self.index.query(lead_loc, radius, kinds)
+        return min_by_owner(self.index.owners[ids], dists)
+
+    def distance_profile(self, lead: Lead) -> DistanceProfile:
+        # Every partner's nearest point within 500m, by kind, in one pass. Pass it to
+        # notified_partners and MatchMakingModel.match to share it between the two.
+        return DistanceProfile.from_index(self.index, lead)
+
+    def notified_partners(self, lead: Lead, profile: Optional[DistanceProfile] = None) -> List[Partner]:
+        if profile is None:
+            profile = self.distance_profile(lead)
+        # The competition level is counted in the trace; select() returns it too
+        notified, _ = self.select(profile)
+        return notified
 
-        # Check competition: unique partners with customers within 200m
-        unique_partner_ids = set()
-        for p in self.partners:
-            for c in p.active_customers + p.inactive_but_geographically_relevant_customers:
-                if self.haversine(lead_loc, c.location) <= 200:
-                    unique_partner_ids.add(p.long_lco_account_id)
-                    break  # No need to check further for this partner
+    def notified_partners_batch(self, leads: List[Lead], max_matrix_elems: int = MAX_MATRIX_ELEMS) -> List[List[Partner]]:
+        # Same rules as notified_partners for N leads. Leads are chunked by grid locality and
+        # each chunk gets one leads x candidate-points distance matrix.
+        trace = current_trace()
+        results: List[List[Partner]] = [[] for _ in leads]
+        locs = [lead.location for lead in leads]
+        for chunk, ids in self.index.chunk_queries(locs, PROFILE_RADIUS_M, max_matrix_elems):
+            if len(ids) == 0:
+                continue
+            lats, lngs = to_arrays(locs[j] for j in chunk)
+            dists = haversine_matrix(lats, lngs, self.index.lats[ids], self.index.lngs[ids])
+            if trace is not None:
+                trace.count('points_evaluated', dists.size)
+                trace.count('distance_computations', dists.size)
+                trace.mark('distance_matrix')
+            owners = self.index.owners[ids]
+            kinds = self.index.kinds[ids]
+            for row, j in zip(dists, chunk):
+                keep = row <= PROFILE_RADIUS_M
+                profile = DistanceProfile(self.index, leads[j], owners[keep], kinds[keep], row[keep])
+                results[j] = self.select(profile)[0]
+        return results
+
+    def select(self, profile: DistanceProfile) -> Tuple[List[Partner], Optional[bool]]:
+        # Apply the notification rules to a lead's distance profile. Returns (notified, high_comp);
+        # high_comp is None when nothing is eligible and the competition check never ran.
+        trace = current_trace()
+
+        # Eligible: partners with min_dist <= 500m (rule a)
+        within_500 = profile.within(500)
+        if trace is not None:
+            trace.count('partners_scanned', len(profile.partner_idx))
+        if not within_500:
+            if trace is not None:
+                trace.mark('eligibility')
+                trace.observe('notified', 0)
+            return [], None
+        eligible_idx = sorted(within_500)  # Keep the original partner order
+        eligible = [self.partners[i] for i in eligible_idx]
+        if trace is not None:
+            trace.mark('eligibility')
 
-        # Additional check: partners within 100m
-        partners_within_100 = [p for p in self.partners if self.min_distance(lead_loc, p) <= 100]
+        high_comp = self.competition.decide(profile.lead.location) if self.competition is not None else None
+        if trace is not None and self.competition is not None:
+            trace.count('competition_layer_hit' if high_comp is not None else 'competition_layer_fallback')
+        if high_comp is None:
+            # Check competition: unique partners with customers within 200m
+            customers_within_200 = profile.within(200, CUSTOMER_KINDS)
+            unique_partner_ids = {self.partners[i].long_lco_account_id for i in customers_within_200}
 
-        high_comp = (len(unique_partner_ids) > 5) or (len(partners_within_100) >= 3)
+            # Additional check: partners within 100m
+            partners_within_100 = [i for i in eligible_idx if within_500[i] <= 100]
 
-        # Print the competition level for this location
-        print(f"Location deemed {'high' if high_comp else 'low'} competition")
+            high_comp = (len(unique_partner_ids) > MAX_PARTNERS_200M) or (len(partners_within_100) >= MIN_PARTNERS_100M)
+        if trace is not None:
+            trace.count('high_competition' if high_comp else 'low_competition')
+            trace.mark('competition_check')
 
         if not high_comp:
             # Low comp: just return all eligible (no scoring here)
-            return eligible
+            if trace is not None:
+                trace.observe('notified', len(eligible))
+            return eligible, high_comp
 
         else:
             # High comp (rule b): all partners within 200m
-            within_200 = [p for p in eligible if self.min_distance(lead_loc, p) <= 200]
+            within_200_idx = [i for i in eligible_idx if within_500[i] <= 200]
+            within_200 = [self.partners[i] for i in within_200_idx]
             num_within = len(within_200)
             if num_within >= 10:
-                return within_200
+                if trace is not None:
+                    trace.mark('selection_200m')
+                    trace.observe('notified', num_within)
+                return within_200, high_comp
 
             # Less than 10: add up to x additional from remaining, sorted by min_dist
-            remaining = [p for p in eligible if p not in within_200]
-            remaining_sorted = sorted(remaining, key=lambda p: self.min_distance(lead_loc, p))
+            remaining_idx = [i for i in eligible_idx if within_500[i] > 200]
+            remaining_sorted = sorted(remaining_idx, key=lambda i: within_500[i])
             num_add = min(10 - num_within, self.x, len(remaining_sorted))
-            additional = remaining_sorted[:num_add]
-            return within_200 + additional
+            additional = [self.partners[i] for i in remaining_sorted[:num_add]]
+            if trace is not None:
+                trace.mark('selection_200m')
+                trace.observe('notified', num_within + num_add)
+            return within_200 + additional, high_comp
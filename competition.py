@@ -0,0 +1,170 @@
+# ~/Apps/genie/competition.py
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+from math import ceil, degrees, floor, sqrt
+
+import numpy as np
+
+from models import Location
+from distance import EARTH_RADIUS_M, haversine_pairs, haversine_matrix
+from spatial_index import GridIndex, CUSTOMER_KINDS, REFERENCE_KINDS, cap_extent, pack_cell
+from partner_portfolio import account_ids
+
+# BusinessFilter's high-competition rule: more than MAX_PARTNERS_200M unique partners (account
+# ids) with customers within 200m, or at least MIN_PARTNERS_100M partners within 100m
+MAX_PARTNERS_200M = 5
+MIN_PARTNERS_100M = 3
+
+class CellBounds(NamedTuple):
+    # Unique-partner counts that hold for every lead position inside the cell
+    lo_200: int
+    hi_200: int
+    lo_100: int
+    hi_100: int
+
+class CompetitionLayer:
+    # The high-competition decision precomputed over a fine lat/lng grid. For each cell, partners
+    # with a point within r - h of the cell centre are within r of any lead in the cell (lower
+    # bound), and any partner within r of such a lead has a point within r + h of the centre
+    # (upper bound); h is the cell's half-diagonal. decide() settles a lead from its cell's
+    # bounds and only returns None (do the exact check) where the bounds straddle a threshold.
+    # Cells with no partner in range aren't stored: they're low competition.
+    #
+    # Reads point positions from a GridIndex. It takes the same point deltas as a PointTable, so
+    # attach it to the PortfolioUpdater too; changes are queued and the cells around them are
+    # recomputed from the index on the next lookup.
+    def __init__(self, index: GridIndex, cell_size_m: float = 20.0) -> None:
+        self.index = index
+        self.cell_size_m = cell_size_m
+        self.cell_deg = degrees(cell_size_m / EARTH_RADIUS_M)
+        # Over-estimate (cos(lat) <= 1) plus a hair of slack for rounding, so bounds stay conservative
+        self.half_diag_m = cell_size_m * sqrt(2) / 2 * (1 + 1e-6) + 1e-3
+
+        # 200m rule counts account ids, 100m rule counts partner indices
+        # (from the columns, so a snapshot's lazy partners stay unbuilt)
+        ids = account_ids(index.partners)
+        _, accounts = np.unique(ids, return_inverse=True)
+        self.layers: List[Tuple[float, Tuple[int, ...], np.ndarray]] = [
+            (200.0, CUSTOMER_KINDS, accounts.astype(np.int64)),
+            (100.0, REFERENCE_KINDS, np.arange(len(ids), dtype=np.int64)),
+        ]
+        self._pending: List[Location] = []
+        self.cells: Dict[int, CellBounds] = {}
+        self._build()
+
+    def cell_of(self, loc: Location) -> int:
+        return pack_cell(floor(loc.lat / self.cell_deg), floor(loc.lng / self.cell_deg))
+
+    def bounds(self, loc: Location) -> CellBounds:
+        if self._pending:
+            self._flush()
+        return self.cells.get(self.cell_of(loc), CellBounds(0, 0, 0, 0))
+
+    def decide(self, loc: Location) -> Optional[bool]:
+        # True: high competition, False: low, None: too close to call from the cell alone
+        b = self.bounds(loc)
+        if b.lo_200 > MAX_PARTNERS_200M or b.lo_100 >= MIN_PARTNERS_100M:
+            return True
+        if b.hi_200 <= MAX_PARTNERS_200M and b.hi_100 < MIN_PARTNERS_100M:
+            return False
+        return None
+
+    # Point deltas, same signatures as PointTable so PortfolioUpdater can drive this
+    def add_point(self, partner_idx: int, kind: int, loc: Location) -> None:
+        self._pending.append(loc)
+
+    def remove_point(self, partner_idx: int, kind: int, loc: Location) -> None:
+        self._pending.append(loc)
+
+    def change_kind(self, partner_idx: int, old_kind: int, new_kind: int, loc: Location) -> None:
+        self._pending.append(loc)
+
+    def _centres(self, keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        rows = keys >> 32
+        cols = (keys & 0xFFFFFFFF) - (1 << 31)
+        return (rows + 0.5) * self.cell_deg, (cols + 0.5) * self.cell_deg
+
+    def _stencil(self, lats: np.ndarray, lngs: np.ndarray, reach_m: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        # (point position, packed cell key, distance) for every cell whose centre is within reach_m of a point
+        dlat, dlng = cap_extent(float(np.abs(lats).max()), reach_m)
+        k_row = ceil(dlat / self.cell_deg) + 1
+        k_col = ceil(dlng / self.cell_deg) + 1
+        d_row, d_col = np.meshgrid(np.arange(-k_row, k_row + 1), np.arange(-k_col, k_col + 1), indexing='ij')
+        d_row, d_col = d_row.ravel(), d_col.ravel()
+        rows = np.floor(lats / self.cell_deg).astype(np.int64)[:, None] + d_row
+        cols = np.floor(lngs / self.cell_deg).astype(np.int64)[:, None] + d_col
+        keys = (rows << 32) | (cols + (1 << 31))
+        c_lats, c_lngs = self._centres(keys)
+        dists = haversine_pairs(np.broadcast_to(lats[:, None], keys.shape), np.broadcast_to(lngs[:, None], keys.shape),
+                                c_lats, c_lngs)
+        pos, hit = np.nonzero(dists <= reach_m)
+        return pos, keys[pos, hit], dists[pos, hit]
+
+    def _build(self, chunk: int = 2048) -> None:
+        # Per layer: every (group, cell) pair within r +- h, deduplicated, counted per cell
+        index = self.index
+        live = np.flatnonzero(index.alive)
+        counts: List[Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]] = []
+        for radius, kinds, group_of in self.layers:
+            ids = live[np.isin(index.kinds[live], kinds)]
+            ids = ids[np.argsort(group_of[index.owners[ids]], kind='stable')]  # Keeps duplicates chunk-local
+            lo_pairs, hi_pairs = [], []
+            for start in range(0, len(ids), chunk):
+                block = ids[start:start + chunk]
+                pos, keys, dists = self._stencil(index.lats[block], index.lngs[block], radius + self.half_diag_m)
+                groups = group_of[index.owners[block]][pos]
+                lo = dists <= radius - self.half_diag_m
+                lo_pairs.append(_unique_pairs(groups[lo], keys[lo]))
+                hi_pairs.append(_unique_pairs(groups, keys))
+            counts.append((*_count_cells(lo_pairs), *_count_cells(hi_pairs)))
+
+        # Union of cells in range of anything; every lo set is inside its hi set
+        all_keys = np.union1d(counts[0][2], counts[1][2])
+        columns = [_lookup(all_keys, keys, n) for layer in counts for keys, n in (layer[:2], layer[2:])]
+        self.cells = {key: CellBounds(*b) for key, *b in zip(all_keys.tolist(), *(c.tolist() for c in columns))}
+
+    def _flush(self) -> None:
+        # Recompute every cell a changed point could reach, straight from the index's current state
+        pending, self._pending = self._pending, []
+        reach = max(radius for radius, _, _ in self.layers) + self.half_diag_m
+        done = set()
+        for loc in pending:
+            _, keys, _ = self._stencil(np.array([loc.lat]), np.array([loc.lng]), reach)
+            keys = np.array([k for k in keys.tolist() if k not in done], dtype=np.int64)
+            if len(keys) == 0:
+                continue
+            done.update(keys.tolist())
+            ids, _ = self.index.query(loc, 2 * reach)
+            c_lats, c_lngs = self._centres(keys)
+            dists = haversine_matrix(c_lats, c_lngs, self.index.lats[ids], self.index.lngs[ids])
+            columns = []
+            for radius, kinds, group_of in self.layers:
+                use = np.isin(self.index.kinds[ids], kinds)
+                groups = group_of[self.index.owners[ids[use]]]
+                for limit in (radius - self.half_diag_m, radius + self.half_diag_m):
+                    cell, pt = np.nonzero(dists[:, use] <= limit)
+                    pairs = _unique_pairs(groups[pt], cell)
+                    columns.append(np.bincount(pairs[1], minlength=len(keys)))
+            for key, *b in zip(keys.tolist(), *(c.tolist() for c in columns)):
+                if b[1] or b[3]:
+                    self.cells[key] = CellBounds(*b)
+                else:
+                    self.cells.pop(key, None)
+
+def _unique_pairs(groups: np.ndarray, keys: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    order = np.lexsort((keys, groups))
+    groups, keys = groups[order], keys[order]
+    first = np.concatenate(([True], (groups[1:] != groups[:-1]) | (keys[1:] != keys[:-1]))) if len(keys) else np.empty(0, dtype=bool)
+    return groups[first], keys[first]
+
+def _count_cells(pairs: Sequence[Tuple[np.ndarray, np.ndarray]]) -> Tuple[np.ndarray, np.ndarray]:
+    # (cell keys, unique groups per cell) from per-chunk (group, key) pairs
+    if not pairs:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    groups, keys = _unique_pairs(np.concatenate([g for g, _ in pairs]), np.concatenate([k for _, k in pairs]))
+    return np.unique(keys, return_counts=True)
+
+def _lookup(all_keys: np.ndarray, keys: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    # counts spread onto all_keys (a superset of keys), 0 where a key is missing
+    out = np.zeros(len(all_keys), dtype=np.int64)
+    out[np.searchsorted(all_keys, keys)] = counts
+    return out
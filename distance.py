@@ -0,0 +1,65 @@
+# ~/Apps/genie/distance.py
+from typing import Iterable, Tuple
+from math import radians, sin, cos, sqrt, atan2
+
+import numpy as np
+
+from models import Location
+
+EARTH_RADIUS_M = 6371000  # Earth radius in meters
+
+def haversine(loc1: Location, loc2: Location) -> float:
+    # Scalar version, for the odd one-off pair. Anything in a loop should use the array versions.
+    lat1, lon1 = radians(loc1.lat), radians(loc1.lng)
+    lat2, lon2 = radians(loc2.lat), radians(loc2.lng)
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = sin(dlat / 2)**2 + cos(lat1) * cos(lat2) * sin(dlon / 2)**2
+    c = 2 * atan2(sqrt(a), sqrt(1 - a))
+    return EARTH_RADIUS_M * c
+
+def to_arrays(locs: Iterable[Location]) -> Tuple[np.ndarray, np.ndarray]:
+    # Contiguous float64 lat/lng columns (degrees)
+    flat = np.array([(loc.lat, loc.lng) for loc in locs], dtype=np.float64).reshape(-1, 2)
+    return np.ascontiguousarray(flat[:, 0]), np.ascontiguousarray(flat[:, 1])
+
+def haversine_matrix(lats1: np.ndarray, lngs1: np.ndarray, lats2: np.ndarray, lngs2: np.ndarray) -> np.ndarray:
+    # m points against n points -> shape (m, n). Memory is m*n*8 bytes per temporary, so chunk m yourself.
+    lat1 = np.radians(lats1)[:, None]
+    lon1 = np.radians(lngs1)[:, None]
+    lat2 = np.radians(lats2)[None, :]
+    dlat = lat2 - lat1
+    dlon = np.radians(lngs2)[None, :] - lon1
+    a = np.sin(dlat / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2)**2
+    return EARTH_RADIUS_M * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+def haversine_pairs(lats1: np.ndarray, lngs1: np.ndarray, lats2: np.ndarray, lngs2: np.ndarray) -> np.ndarray:
+    # Element-wise: point i of the first set against point i of the second -> shape (n,)
+    lat1 = np.radians(lats1)
+    lat2 = np.radians(lats2)
+    dlat = lat2 - lat1
+    dlon = np.radians(lngs2) - np.radians(lngs1)
+    a = np.sin(dlat / 2)**2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2)**2
+    return EARTH_RADIUS_M * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+def haversine_many(loc: Location, lats: np.ndarray, lngs: np.ndarray) -> np.ndarray:
+    # One point against n points in a single NumPy pass -> shape (n,). Goes through
+    # haversine_matrix so single-lead and batched callers get bit-identical distances.
+    return haversine_matrix(np.array([loc.lat]), np.array([loc.lng]), lats, lngs)[0]
+
+def min_distance(loc: Location, lats: np.ndarray, lngs: np.ndarray) -> float:
+    if len(lats) == 0:
+        return float('inf')
+    return float(haversine_many(loc, lats, lngs).min())
+
+def bbox_min_distance(lat: float, lng: float, lat_lo: np.ndarray, lat_hi: np.ndarray,
+                      lng_lo: np.ndarray, lng_hi: np.ndarray) -> np.ndarray:
+    # Lower bound on the distance from one point to anything inside each lat/lng box, never above
+    # the haversine to any point in it: the lat and lng gaps are clamped to the box, and the cos
+    # factor uses the box edge furthest from the equator. NaN boxes (empty) give inf.
+    dlat = np.radians(np.maximum(np.maximum(lat_lo - lat, lat - lat_hi), 0))
+    dlng = np.radians(np.maximum(np.maximum(lng_lo - lng, lng - lng_hi), 0))
+    cos_min = np.cos(np.radians(lat)) * np.minimum(np.cos(np.radians(lat_lo)), np.cos(np.radians(lat_hi)))
+    a = np.minimum(np.sin(dlat / 2)**2 + cos_min * np.sin(dlng / 2)**2, 1.0)
+    d = EARTH_RADIUS_M * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a)) * (1 - 1e-9)  # Rounding slack
+    return np.where(np.isnan(d), np.inf, d)
@@ -0,0 +1,72 @@
+# ~/Apps/genie/distance_profile.py
+from typing import Dict, Sequence
+
+import numpy as np
+
+from models import Lead
+from distance import min_distance, to_arrays
+from spatial_index import GridIndex, ALL_KINDS, REFERENCE_KINDS, RECENT_LEAD
+from metrics import current_trace
+
+PROFILE_RADIUS_M = 500  # Widest radius any filter/model rule looks at
+
+class DistanceProfile:
+    # Nearest distance from one lead to each partner with a point within radius_m, split by
+    # point kind. Built from one index query; the filter rules and the model both read from
+    # it instead of re-running min_distance per partner per rule.
+    def __init__(self, index: GridIndex, lead: Lead, owners: np.ndarray, kinds: np.ndarray,
+                 dists: np.ndarray, radius_m: float = PROFILE_RADIUS_M) -> None:
+        self.index = index
+        self.lead = lead
+        self.radius_m = radius_m
+
+        # Min per (partner, kind): sort by a combined key and reduce each run
+        n_kinds = len(ALL_KINDS)
+        key = owners * n_kinds + kinds
+        order = np.argsort(key, kind='stable')
+        key = key[order]
+        starts = np.flatnonzero(np.concatenate(([True], key[1:] != key[:-1]))) if len(key) else np.empty(0, dtype=np.int64)
+        mins = np.minimum.reduceat(dists[order], starts) if len(key) else np.empty(0)
+        # partner_idx is sorted, so iterating it keeps the original partner order
+        self.partner_idx, rows = np.unique(key[starts] // n_kinds, return_inverse=True)
+        self.nearest = np.full((len(self.partner_idx), n_kinds), np.inf)
+        self.nearest[rows, key[starts] % n_kinds] = mins
+        self._rows: Dict[int, int] = dict(zip(self.partner_idx.tolist(), range(len(self.partner_idx))))
+
+    @classmethod
+    def from_index(cls, index: GridIndex, lead: Lead, radius_m: float = PROFILE_RADIUS_M) -> "DistanceProfile":
+        candidates = index.candidates(lead.location, radius_m)
+        ids, dists = index.within(lead.location, candidates, radius_m)
+        profile = cls(index, lead, index.owners[ids], index.kinds[ids], dists, radius_m)
+        trace = current_trace()
+        if trace is not None:
+            trace.count('points_evaluated', len(candidates))
+            trace.count('distance_computations', len(candidates))
+            trace.mark('distance_profile')
+        return profile
+
+    def within(self, radius_m: float, kinds: Sequence[int] = REFERENCE_KINDS) -> Dict[int, float]:
+        # Partner index -> nearest point of the given kinds, for partners with one within radius_m
+        if radius_m > self.radius_m:
+            raise ValueError(f"Profile only covers {self.radius_m}m, asked for {radius_m}m")
+        d = self.nearest[:, list(kinds)].min(axis=1)
+        keep = d <= radius_m
+        return dict(zip(self.partner_idx[keep].tolist(), d[keep].tolist()))
+
+    def nearest_for(self, partner_idx: int) -> np.ndarray:
+        # Per-kind nearest distances for one partner; all inf if nothing within radius_m
+        row = self._rows.get(partner_idx)
+        if row is None:
+            return np.full(len(ALL_KINDS), np.inf)
+        return self.nearest[row]
+
+    def recent_lead_distance(self, partner_idx: int) -> float:
+        # Exact nearest recent lead, even beyond radius_m (the model scores on it regardless of range)
+        d = self.nearest_for(partner_idx)[RECENT_LEAD]
+        if d <= self.radius_m:
+            return float(d)
+        recent_locs = [l.location for l in self.index.partners[partner_idx].recent_leads_interested_in]
+        trace = current_trace()
+        if trace is not None:
+            trace.count('distance_computations', len(recent_locs))
+        return min_distance(self.lead.location, *to_arrays(recent_locs))
@@ -0,0 +1,167 @@
+# ~/Apps/genie/lead_pipeline.py
+from typing import Any, Dict, IO, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+import argparse
+import csv
+import itertools
+import json
+import math
+import queue
+import sys
+import threading
+
+from models import Location, Lead, Partner
+from business_filter import BusinessFilter
+from matchmaking_model import MatchMakingModel
+from spatial_index import GridIndex
+
+# Offline re-scoring as a chain of generators: parse -> batch -> filter + match -> serialize.
+# Every stage pulls from the one before it, so at most a few batches are in memory at once
+# however long the input is; a slow writer stalls the reader instead of buffering behind it.
+
+# (line number, request id, lead) for a good line, (line number, None, error message) for a bad one
+Record = Tuple[int, Any, Union[Lead, str]]
+
+def make_lead(mobile: str, lat: Any, lng: Any) -> Lead:
+    # float() takes 'nan', 'inf' and '1e400'; those would only blow up later, in the index
+    location = Location(lat=float(lat), lng=float(lng))
+    if not (math.isfinite(location.lat) and math.isfinite(location.lng)):
+        raise ValueError(f"non-finite location {tuple(location)}")
+    return Lead(mobile=mobile, location=location)
+
+def parse_jsonl(lines: Iterable[str]) -> Iterator[Record]:
+    # {"id": ..., "mobile": ..., "lat": ..., "lng": ...} per line, like the matching service
+    for n, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+            yield n, row.get('id'), make_lead(str(row.get('mobile', '')), row['lat'], row['lng'])
+        except (ValueError, KeyError, TypeError, AttributeError) as e:
+            yield n, None, f"Bad line: {e}"
+
+def parse_csv(lines: Iterable[str]) -> Iterator[Record]:
+    # Header row with lat and lng columns; mobile and id are optional
+    for n, row in enumerate(csv.DictReader(lines), 2):
+        try:
+            yield n, row.get('id'), make_lead(row.get('mobile') or '', row['lat'], row['lng'])
+        except (ValueError, KeyError, TypeError) as e:
+            yield n, None, f"Bad line: {e}"
+
+def batched(records: Iterable[Record], size: int) -> Iterator[List[Record]]:
+    it = iter(records)
+    while True:
+        batch = list(itertools.islice(it, size))
+        if not batch:
+            return
+        yield batch
+
+def prefetch(items: Iterable[Any], depth: int) -> Iterator[Any]:
+    # Produce items on a background thread, at most depth ahead of the consumer. Overlaps
+    # parsing with matching; the bounded queue is the backpressure.
+    if depth <= 0:
+        yield from items
+        return
+    q: "queue.Queue[Tuple[bool, Any]]" = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def produce() -> None:
+        try:
+            for item in items:
+                while not stop.is_set():
+                    try:
+                        q.put((False, item), timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+            q.put((True, None))
+        except BaseException as e:
+            q.put((True, e))
+
+    thread = threading.Thread(target=produce, daemon=True)
+    thread.start()
+    try:
+        while True:
+            done, item = q.get()
+            if done:
+                if item is not None:
+                    raise item
+                return
+            yield item
+    finally:
+        stop.set()
+
+def match_batches(batches: Iterable[List[Record]], business_filter: BusinessFilter, model: MatchMakingModel,
+                  top_k: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+    # One notified_partners_batch + match_batch per batch; one result dict per input record, in order
+    for batch in batches:
+        good = [(n, rid, lead) for n, rid, lead in batch if isinstance(lead, Lead)]
+        leads = [lead for _, _, lead in good]
+        notified = business_filter.notified_partners_batch(leads)
+        matches = model.match_batch(leads, notified)
+        results = iter(zip(notified, matches))
+        for n, rid, lead in batch:
+            if not isinstance(lead, Lead):
+                yield {'line': n, 'error': lead}
+                continue
+            partners, ranked = next(results)
+            yield {
+                'id': rid,
+                'mobile': lead.mobile,
+                'notified': [p.long_lco_account_id for p in partners],
+                'matches': [{'partner_id': p.long_lco_account_id, 'score': score} for p, score in ranked[:top_k]],
+            }
+
+def write_jsonl(results: Iterable[Dict[str, Any]], out: IO[str], flush_every: int = 256) -> Dict[str, int]:
+    stats = {'leads': 0, 'errors': 0}
+    for i, result in enumerate(results, 1):
+        out.write(json.dumps(result) + '\n')
+        stats['errors' if 'error' in result else 'leads'] += 1
+        if i % flush_every == 0:
+            out.flush()  # Results show up downstream as they're made
+    out.flush()
+    return stats
+
+def run(lines: Iterable[str], out: IO[str], partners: Sequence[Partner], fmt: str = 'jsonl',
+        batch_size: int = 512, prefetch_batches: int = 2, top_k: Optional[int] = None,
+        index: Optional[GridIndex] = None) -> Dict[str, int]:
+    business_filter = BusinessFilter(partners, index=index)
+    model = MatchMakingModel(partners, business_filter.index)
+    records = parse_csv(lines) if fmt == 'csv' else parse_jsonl(lines)
+    batches = prefetch(batched(records, batch_size), prefetch_batches)
+    return write_jsonl(match_batches(batches, business_filter, model, top_k), out, flush_every=batch_size)
+
+if __name__ == "__main__":
+    from synthetic_data_seeder import SyntheticDataSeeder
+    from snapshot import Snapshot
+
+    parser = argparse.ArgumentParser(description="Stream leads (JSONL or CSV) through the filter and model, one JSON result per line")
+    parser.add_argument('input', nargs='?', default='-', help="Lead file, or - for stdin")
+    parser.add_argument('--format', choices=('jsonl', 'csv'), help="Default: from the file extension, else jsonl")
+    parser.add_argument('--out', help="Write results here instead of stdout")
+    parser.add_argument('--batch-size', type=int, default=512, help="Leads per filter/match batch")
+    parser.add_argument('--prefetch', type=int, default=2, help="Batches parsed ahead of matching (0: none)")
+    parser.add_argument('--top-k', type=int, help="Keep only the best k matches per lead")
+    parser.add_argument('--snapshot', help="Partner snapshot (see snapshot.py) instead of seeding one")
+    parser.add_argument('--center-lat', type=float, default=28.65)
+    parser.add_argument('--center-lng', type=float, default=77.275)
+    args = parser.parse_args()
+
+    fmt = args.format or ('csv' if args.input.endswith('.csv') else 'jsonl')
+    if args.snapshot:
+        snapshot = Snapshot(args.snapshot)
+        partners, index = snapshot.partners, snapshot.index
+    else:
+        partners, index = SyntheticDataSeeder(center_lat=args.center_lat, center_lng=args.center_lng).seed(), None
+
+    source = sys.stdin if args.input == '-' else open(args.input, newline='')
+    sink = sys.stdout if args.out is None else open(args.out, 'w')
+    try:
+        stats = run(source, sink, partners, fmt, args.batch_size, args.prefetch, args.top_k, index)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if sink is not sys.stdout:
+            sink.close()
+    print(f"{stats['leads']} leads matched, {stats['errors']} bad lines", file=sys.stderr)
@@ -0,0 +1,360 @@
+# ~/Apps/genie/loadgen.py
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, Sequence, Tuple
+import argparse
+import asyncio
+import json
+import resource
+import time
+
+import numpy as np
+
+from models import Location, Lead, Partner
+from business_filter import BusinessFilter
+from matchmaking_model import MatchMakingModel
+from spatial_index import GridIndex, PointTable, CUSTOMER_KINDS
+
+# Open-loop load: requests are sent on a fixed schedule whatever the latency, and each one's
+# latency is measured from when it was *due*, not when it was actually sent. A stall therefore
+# shows up in every request queued behind it instead of silently lowering the send rate
+# (coordinated omission), which is what a closed loop of "call, wait, call" would report.
+
+SUB_BUCKETS = 128  # Per power of two, so bucket edges are within 1/128 (< 1%) of any value
+
+class LatencyHistogram:
+    # Log-linear histogram of integer microseconds, HDR style: fixed memory and constant-time
+    # record however many values go in, percentiles to within a bucket (< 1% relative error).
+    # Values up to SUB_BUCKETS us get their own bucket.
+    def __init__(self, max_us: int = 60_000_000) -> None:
+        self.counts = np.zeros(self._bucket(max_us) + 1, dtype=np.int64)
+        self.max_us = max_us
+        self.total = 0
+        self.max_seen = 0
+        self.sum_us = 0
+
+    @staticmethod
+    def _bucket(us: int) -> int:
+        if us < SUB_BUCKETS:
+            return us
+        shift = us.bit_length() - SUB_BUCKETS.bit_length()
+        return (shift + 1) * SUB_BUCKETS + (us >> shift) - SUB_BUCKETS
+
+    @staticmethod
+    def _upper(bucket: int) -> int:
+        # Largest value that lands in bucket
+        if bucket < SUB_BUCKETS:
+            return bucket
+        shift = bucket // SUB_BUCKETS - 1
+        return ((bucket % SUB_BUCKETS + SUB_BUCKETS + 1) << shift) - 1
+
+    def record(self, seconds: float) -> None:
+        us = min(max(int(seconds * 1e6), 0), self.max_us)
+        self.counts[self._bucket(us)] += 1
+        self.total += 1
+        self.sum_us += us
+        self.max_seen = max(self.max_seen, us)
+
+    def merge(self, other: "LatencyHistogram") -> None:
+        self.counts[:len(other.counts)] += other.counts[:len(self.counts)]
+        self.total += other.total
+        self.sum_us += other.sum_us
+        self.max_seen = max(self.max_seen, other.max_seen)
+
+    def percentile(self, p: float) -> float:
+        # Milliseconds; the top of the bucket holding the p-th percentile value, capped at the max seen
+        if not self.total:
+            return 0.0
+        rank = max(1, int(np.ceil(p / 100 * self.total)))
+        bucket = int(np.searchsorted(np.cumsum(self.counts), rank))
+        return min(self._upper(bucket), self.max_seen) / 1000
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            'count': self.total,
+            'mean': self.sum_us / self.total / 1000 if self.total else 0.0,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'p999': self.percentile(99.9),
+            'max': self.max_seen / 1000,
+        }
+
+def rss_bytes() -> Tuple[int, int]:
+    # (current, peak) resident set size. Current comes from /proc (Linux); elsewhere it's the peak.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024  # KiB on Linux
+    try:
+        with open('/proc/self/statm') as f:
+            rss = int(f.read().split()[1]) * resource.getpagesize()
+        return rss, max(rss, peak)  # ru_maxrss lags a little behind statm
+    except OSError:
+        return peak, peak
+
+def cluster_centers(table: PointTable) -> Tuple[np.ndarray, np.ndarray]:
+    # (lat/lng of each partner's customer centroid, customer count per partner) for partners with
+    # customers. Leads show up where customers already are, so busy partners draw proportionally
+    # more of them. Straight from the index columns, so snapshot partners stay unbuilt.
+    live = table.alive & np.isin(table.kinds, list(CUSTOMER_KINDS))
+    owners = table.owners[live]
+    n = len(table.partners)
+    counts = np.bincount(owners, minlength=n)
+    has = counts > 0
+    lats = np.bincount(owners, weights=table.lats[live], minlength=n)[has] / counts[has]
+    lngs = np.bincount(owners, weights=table.lngs[live], minlength=n)[has] / counts[has]
+    return np.column_stack((lats, lngs)), counts[has].astype(np.float64)
+
+def lead_stream(table: PointTable, sigma_m: float = 200.0, background: float = 0.1,
+                background_center: Optional[Location] = None, background_sigma_m: float = 1000.0,
+                seed: int = 7, block: int = 4096) -> Iterator[Lead]:
+    # Endless leads: Gaussian around a customer-weighted pick of partner clusters, the same
+    # sampling as the seeder's generate_gaussian_locations (lng sigma widened by 1 / cos(lat)),
+    # plus a `background` share scattered around background_center (default: all clusters' mean).
+    rng = np.random.default_rng(seed)
+    centers, weights = cluster_centers(table)
+    if not len(centers):
+        raise ValueError("No partner has customers to cluster leads around")
+    probs = weights / weights.sum()
+    if background_center is None:
+        background_center = Location(*centers.mean(axis=0).tolist())
+    n = 0
+    while True:
+        picks = centers[rng.choice(len(centers), size=block, p=probs)]
+        is_background = rng.random(block) < background
+        picks[is_background] = (background_center.lat, background_center.lng)
+        sigma_lat = np.where(is_background, background_sigma_m, sigma_m) / 111000.0
+        sigma_lng = sigma_lat / np.cos(np.radians(picks[:, 0]))
+        lats = np.round(picks[:, 0] + rng.normal(0, 1, block) * sigma_lat, 6)
+        lngs = np.round(picks[:, 1] + rng.normal(0, 1, block) * sigma_lng, 6)
+        for lat, lng in zip(lats.tolist(), lngs.tolist()):
+            yield Lead(mobile=f"+91{n % 10**9:09d}", location=Location(lat=lat, lng=lng))
+            n += 1
+
+def schedule(rate: float, duration_s: float, poisson: bool = False, seed: int = 11) -> np.ndarray:
+    # Send offsets in seconds from the start: evenly spaced, or Poisson arrivals at the same mean rate
+    count = int(rate * duration_s)
+    if not poisson:
+        return np.arange(count) / rate
+    return np.cumsum(np.random.default_rng(seed).exponential(1 / rate, count))
+
+def report(hist: LatencyHistogram, sent: int, elapsed_s: float, target_rate: float, errors: int = 0) -> Dict[str, Any]:
+    rss, peak_rss = rss_bytes()
+    return {
+        'target_rate': target_rate,
+        'sent': sent,
+        'errors': errors,
+        'elapsed_s': elapsed_s,
+        'throughput_per_s': hist.total / elapsed_s if elapsed_s > 0 else 0.0,
+        'latency_ms': hist.summary(),
+        'rss_bytes': rss,
+        'peak_rss_bytes': peak_rss,
+    }
+
+def run_inprocess(partners: Sequence[Partner], leads: Iterator[Lead], rate: float, duration_s: float,
+                  poisson: bool = False, warmup: int = 100, index: Optional[GridIndex] = None) -> Dict[str, Any]:
+    # One thread calling notified_partners -> match per lead on schedule. When it falls behind,
+    # due requests run back to back and their queueing time is part of their latency.
+    business_filter = BusinessFilter(partners, index=index)
+
+    def call(lead: Lead) -> None:
+        profile = business_filter.distance_profile(lead)
+        notified = business_filter.notified_partners(lead, profile)
+        MatchMakingModel(notified).match(lead, profile)
+
+    for _ in range(warmup):
+        call(next(leads))
+    hist = LatencyHistogram()
+    offsets = schedule(rate, duration_s, poisson)
+    start = time.perf_counter()
+    for offset in offsets.tolist():
+        due = start + offset
+        wait = due - time.perf_counter()
+        if wait > 0:
+            time.sleep(wait)
+        call(next(leads))
+        hist.record(time.perf_counter() - due)
+    return report(hist, len(offsets), time.perf_counter() - start, rate)
+
+async def drive(send: Callable[[Lead], Awaitable[Any]], leads: Iterator[Lead], rate: float, duration_s: float,
+                poisson: bool = False, max_in_flight: int = 10_000) -> Tuple[LatencyHistogram, int, int, float]:
+    # Fire send(lead) as its own task at each scheduled time without waiting for earlier replies.
+    # Past max_in_flight outstanding requests, the remaining ones are counted as errors instead of sent.
+    loop = asyncio.get_running_loop()
+    hist = LatencyHistogram()
+    errors = 0
+    tasks = set()
+
+    async def one(lead: Lead, due: float) -> None:
+        nonlocal errors
+        try:
+            await send(lead)
+            hist.record(loop.time() - due)
+        except Exception:
+            errors += 1
+
+    offsets = schedule(rate, duration_s, poisson)
+    start = loop.time()
+    for offset in offsets.tolist():
+        due = start + offset
+        wait = due - loop.time()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        if len(tasks) >= max_in_flight:
+            errors += 1
+            continue
+        task = asyncio.create_task(one(next(leads), due))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.gather(*tasks)
+    return hist, len(offsets), errors, loop.time() - start
+
+async def run_service(partners: Sequence[Partner], leads: Iterator[Lead], rate: float, duration_s: float,
+                      poisson: bool = False, window_ms: float = 5.0, max_batch: int = 256,
+                      index: Optional[GridIndex] = None) -> Dict[str, Any]:
+    # Against a MatchingService in this process: same micro-batching and coalescing as the real
+    # server, minus the socket
+    from matching_service import MatchingService
+    service = MatchingService(partners, window_ms=window_ms, max_batch=max_batch, index=index)
+    service.start()
+    try:
+        hist, sent, errors, elapsed = await drive(service.match, leads, rate, duration_s, poisson)
+    finally:
+        await service.stop()
+    result = report(hist, sent, elapsed, rate, errors)
+    result['service'] = dict(service.stats)
+    return result
+
+async def run_remote(host: str, port: int, leads: Iterator[Lead], rate: float, duration_s: float,
+                     poisson: bool = False, connections: int = 4, timeout_s: float = 10.0) -> Dict[str, Any]:
+    # Against a running matching_service.py over its newline-delimited JSON protocol. Requests
+    # are spread round-robin over a few connections; replies are matched back on "id". A request
+    # with no reply within timeout_s counts as an error.
+    pending: Dict[int, asyncio.Future] = {}
+    late = {'replies': 0}
+    streams = [await asyncio.open_connection(host, port) for _ in range(connections)]
+
+    def fail_pending(error: Exception) -> None:
+        # Nothing can be matched any more (connection gone, or a reply we can't place), so
+        # everything outstanding fails rather than waiting forever
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(error)
+        pending.clear()
+
+    async def read_replies(reader: asyncio.StreamReader) -> None:
+        while True:
+            line = await reader.readline()
+            if not line:
+                fail_pending(ConnectionError("Server closed the connection"))
+                return
+            try:
+                reply = json.loads(line)
+                request_id = reply['id']
+            except (ValueError, KeyError, TypeError) as e:
+                fail_pending(ValueError(f"Unmatched reply {line[:200]!r}: {e!r}"))
+                continue
+            future = pending.pop(request_id, None)
+            if future is None:
+                # Its request already timed out (and counted as an error); the others are fine
+                late['replies'] += 1
+                continue
+            if not future.done():
+                if 'error' in reply:
+                    future.set_exception(ValueError(reply['error']))
+                else:
+                    future.set_result(reply)
+
+    readers = [asyncio.create_task(read_replies(reader)) for reader, _ in streams]
+    next_id = 0
+
+    async def send(lead: Lead) -> Any:
+        nonlocal next_id
+        request_id, next_id = next_id, next_id + 1
+        reader, writer = streams[request_id % connections]
+        if reader.at_eof():
+            raise ConnectionError("Server closed the connection")
+        future = asyncio.get_running_loop().create_future()
+        pending[request_id] = future
+        try:
+            writer.write(json.dumps({'id': request_id, 'mobile': lead.mobile, 'lat': lead.location.lat,
+                                     'lng': lead.location.lng}).encode() + b'\n')
+            await writer.drain()
+            return await asyncio.wait_for(future, timeout_s)
+        finally:
+            pending.pop(request_id, None)
+            if future.done() and not future.cancelled():
+                future.exception()  # Retrieved here if the write failed before anyone awaited it
+
+    try:
+        hist, sent, errors, elapsed = await drive(send, leads, rate, duration_s, poisson)
+    finally:
+        fail_pending(ConnectionError("Load generator shutting down"))
+        for task in readers:
+            task.cancel()
+        for _, writer in streams:
+            writer.close()
+    # RSS here is the load generator's own; the server's has to be read on its side
+    result = report(hist, sent, elapsed, rate, errors)
+    result['late_replies'] = late['replies']
+    return result
+
+def format_report(result: Dict[str, Any]) -> str:
+    lat = result['latency_ms']
+    return (f"rate {result['target_rate']:.0f}/s  sent {result['sent']}  done {lat['count']}  errors {result['errors']}  "
+            f"throughput {result['throughput_per_s']:.1f}/s\n"
+            f"  latency ms  p50 {lat['p50']:.3f}  p95 {lat['p95']:.3f}  p99 {lat['p99']:.3f}  "
+            f"p999 {lat['p999']:.3f}  max {lat['max']:.3f}\n"
+            f"  rss {result['rss_bytes'] / 1e6:.1f}MB  peak {result['peak_rss_bytes'] / 1e6:.1f}MB")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Open-loop load on notified_partners -> match, with latency percentiles")
+    parser.add_argument('--target', choices=('inprocess', 'service', 'remote'), default='inprocess',
+                        help="Direct calls, an in-process MatchingService, or a running matching_service.py")
+    parser.add_argument('--rate', type=float, action='append', help="Requests per second; repeat to step through rates")
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds per rate")
+    parser.add_argument('--poisson', action='store_true', help="Poisson arrivals instead of evenly spaced ones")
+    parser.add_argument('--lead-sigma', type=float, help="Lead scatter around each cluster (default: the seeder's lead_cluster_sigma_m)")
+    parser.add_argument('--background', type=float, default=0.1, help="Share of leads scattered over the whole area")
+    parser.add_argument('--scenario', help="Seed one of benchmarks.SCENARIOS instead of the default portfolio")
+    parser.add_argument('--snapshot', help="Partner snapshot (see snapshot.py) instead of seeding one")
+    parser.add_argument('--center-lat', type=float, default=28.65)
+    parser.add_argument('--center-lng', type=float, default=77.275)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--timeout', type=float, default=10.0, help="Per-request timeout for --target remote, in seconds")
+    parser.add_argument('--window-ms', type=float, default=5.0, help="Micro-batching window for --target service")
+    parser.add_argument('--seed', type=int, default=7, help="Lead stream seed")
+    parser.add_argument('--out', help="Write the results here as JSON")
+    args = parser.parse_args()
+
+    from synthetic_data_seeder import SyntheticDataSeeder
+    if args.snapshot:
+        from snapshot import Snapshot
+        seeder = SyntheticDataSeeder(center_lat=args.center_lat, center_lng=args.center_lng)
+        snapshot = Snapshot(args.snapshot)
+        partners, index = snapshot.partners, snapshot.index
+    else:
+        if args.scenario:
+            import benchmarks
+            seeder = benchmarks.make_seeder(benchmarks.SCENARIOS[args.scenario])
+        else:
+            seeder = SyntheticDataSeeder(center_lat=args.center_lat, center_lng=args.center_lng)
+        partners = seeder.seed()
+        index = GridIndex(partners)  # Built once, shared by the lead stream and the matcher
+    sigma = args.lead_sigma if args.lead_sigma is not None else seeder.lead_cluster_sigma_m
+    background_sigma = seeder.radius / 2
+
+    results = []
+    for rate in args.rate or [100.0]:
+        leads = lead_stream(index, sigma, args.background, Location(seeder.center_lat, seeder.center_lng),
+                            background_sigma, seed=args.seed)
+        if args.target == 'inprocess':
+            result = run_inprocess(partners, leads, rate, args.duration, args.poisson, index=index)
+        elif args.target == 'service':
+            result = asyncio.run(run_service(partners, leads, rate, args.duration, args.poisson, args.window_ms, index=index))
+        else:
+            result = asyncio.run(run_remote(args.host, args.port, leads, rate, args.duration, args.poisson,
+                                            timeout_s=args.timeout))
+        print(format_report(result))
+        results.append(result)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'target': args.target, 'runs': results}, f, indent=2)
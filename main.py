@@ -1,90 +1,112 @@
 # ~/Apps/genie/main.py
-from typing import List, Tuple
-from datetime import date, timedelta
-from math import radians, sin, cos, sqrt, atan2
-from pprint import pprint
-import random
-
-from models import Location, Lead, Customer, Partner
-from synthetic_data_seeder import SyntheticDataSeeder
-from output_visualizer import OutputVisualizer
-from business_filter import BusinessFilter
-from synthetic_data_partner_portfolio_visualizer import SyntheticDataPartnerPortfolioVisualizer
-
-class MatchMakingModel:
-    def __init__(self, partners: List[Partner]) -> None:
-        self.partners = partners
-
-    def match(self, lead: Lead) -> List[Tuple[Partner, float]]:
-        def haversine(loc1: Location, loc2: Location) -> float:
-            R = 6371000  # Earth radius in meters
-            lat1, lon1 = radians(loc1.lat), radians(loc1.lng)
-            lat2, lon2 = radians(loc2.lat), radians(loc2.lng)
-            dlat = lat2 - lat1
-            dlon = lon2 - lon1
-            a = sin(dlat / 2)**2 + cos(lat1) * cos(lat2) * sin(dlon / 2)**2
-            c = 2 * atan2(sqrt(a), sqrt(1 - a))
-            return R * c
-
-        candidates = []
-        for partner in self.partners:
-            all_locations = (
-                [c.location for c in partner.active_customers] +
-                [c.location for c in partner.inactive_but_geographically_relevant_customers] +
-                [l.location for l in partner.recent_leads_interested_in] +
-                partner.splitters
-            )
-            if not all_locations:
-                continue  # Skip partners with no reference locations
-
-            min_dist_all = min(haversine(lead.location, loc) for loc in all_locations)
-            if min_dist_all > 500:
-                continue  # Not within 500m
-
-            # Compute score: prefer closest recent lead, fallback to closest customer or splitter
-            recent_locs = [l.location for l in partner.recent_leads_interested_in]
-            customer_locs = (
-                [c.location for c in partner.active_customers] +
-                [c.location for c in partner.inactive_but_geographically_relevant_customers] +
-                partner.splitters
-            )
-            if recent_locs:
-                min_dist = min(haversine(lead.location, loc) for loc in recent_locs)
-            elif customer_locs:
-                min_dist = min(haversine(lead.location, loc) for loc in customer_locs)
-            else:
-                continue  # Shouldn't reach here due to all_locations check
-
-            score = 1 / (1 + min_dist / 500)  # Normalize; tweak divisor if you want different sensitivity
-
-            candidates.append((partner, score))
-
-        # Sort by score descending
-        candidates.sort(key=lambda x: x[1], reverse=True)
-        return candidates
-
-# Example usage to test
-if __name__ == "__main__":
-
-    # Instantiate with center coords (old East Delhi average)
-    lead_lat=28.65
-    lead_lng=77.275
-    lead_mobile="+91333333333"
-
-    seeder = SyntheticDataSeeder(center_lat=lead_lat, center_lng=lead_lng)
-    partners = seeder.seed()
+from typing import TYPE_CHECKING, List, Optional, Sequence, Tuple
+import argparse
+import json
+import sys
+
+from models import Location, Lead, Partner
+
+if TYPE_CHECKING:
+    from spatial_index import GridIndex
+    from synthetic_data_seeder import SyntheticDataSeeder
+
+# Subcommands: seed, match, render, bench, and demo (the default: seed + maps + match + lead plot).
+# Seeding and plotting modules are imported inside the commands that need them, so `match`
+# against a snapshot never loads matplotlib or the seeders.
+
+# Old East Delhi average
+DEFAULT_LAT = 28.65
+DEFAULT_LNG = 77.275
+DEFAULT_MOBILE = "+91333333333"
+
+def make_seeder(center_lat: float, center_lng: float, engine: str = 'classic') -> "SyntheticDataSeeder":
+    if engine == 'numpy':
+        from numpy_seeder import NumpySyntheticDataSeeder
+        return NumpySyntheticDataSeeder(center_lat=center_lat, center_lng=center_lng)
+    from synthetic_data_seeder import SyntheticDataSeeder
+    return SyntheticDataSeeder(center_lat=center_lat, center_lng=center_lng)
+
+def seed_partners(center_lat: float, center_lng: float, engine: str = 'classic', workers: Optional[int] = 1) -> List[Partner]:
+    return make_seeder(center_lat, center_lng, engine).seed(workers=workers)
+
+def load_partners(args: argparse.Namespace) -> Tuple[Sequence[Partner], Optional["GridIndex"]]:
+    # The snapshot's partners + prebuilt index if one was given, else a freshly seeded portfolio
+    if args.snapshot:
+        from snapshot import Snapshot
+        snapshot = Snapshot(args.snapshot)
+        return snapshot.partners, snapshot.index
+    return seed_partners(args.lat, args.lng, args.engine), None
+
+def cmd_seed(args: argparse.Namespace) -> None:
+    if args.per_file:
+        # Streamed straight to disk, a few chunks in memory at a time
+        seeder = make_seeder(args.lat, args.lng, args.engine)
+        paths = seeder.seed_to_disk(args.out, args.per_file, args.workers)
+        print(f"Seeded {seeder.num_partners} partners around ({args.lat}, {args.lng}) into {len(paths)} snapshots in {args.out}")
+        return
+    from snapshot import save_partners
+    partners = seed_partners(args.lat, args.lng, args.engine, args.workers)
+    save_partners(args.out, partners)
+    print(f"Seeded {len(partners)} partners around ({args.lat}, {args.lng}) into {args.out}")
+
+def cmd_match(args: argparse.Namespace) -> None:
+    from business_filter import BusinessFilter
+    from matchmaking_model import MatchMakingModel
+
+    partners, index = load_partners(args)
+    lead = Lead(mobile=args.mobile, location=Location(lat=args.lat, lng=args.lng))
+    business_filter = BusinessFilter(partners, index=index)
+    # One distance pass for the lead, shared by the filter rules and the model
+    profile = business_filter.distance_profile(lead)
+    notified, _ = business_filter.select(profile)
+    matches = MatchMakingModel(notified).match(lead, profile)[:args.top_k]
+    print(json.dumps({
+        'mobile': lead.mobile,
+        'notified': [p.long_lco_account_id for p in notified],
+        'matches': [{'partner_id': p.long_lco_account_id, 'score': score} for p, score in matches],
+    }))
+
+def cmd_render(args: argparse.Namespace) -> None:
+    from output_visualizer import OutputVisualizer
+    from synthetic_data_partner_portfolio_visualizer import SyntheticDataPartnerPortfolioVisualizer
+
+    partners, index = load_partners(args)
+    lead = Lead(mobile=args.mobile, location=Location(lat=args.lat, lng=args.lng))
+    if args.maps_dir:
+        SyntheticDataPartnerPortfolioVisualizer(partners).visualize(lead, args.maps_dir, workers=args.workers)
+    OutputVisualizer(partners, index=index).visualize(lead, args.lead_plot, open_viewer=args.open)
+
+def cmd_bench(args: argparse.Namespace) -> None:
+    import benchmarks
+    results = benchmarks.run(args.scenario or list(benchmarks.SCENARIOS), args.leads, args.seed_repeats)
+    for name, result in results['scenarios'].items():
+        print(f"{name}: {result['partners']} partners, {result['points']} points, {result['mean_notified']:.1f} notified/lead")
+        for stage, stats in result['stages'].items():
+            print(f"  {stage:18} {stats['throughput_per_s'] or 0:10.1f}/s  p50 {stats['latency_ms']['p50']:8.3f}ms")
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump(results, f, indent=2)
+
+def cmd_demo(args: argparse.Namespace) -> None:
+    # The original walkthrough: seed, draw every partner's map, filter + match the sample lead, plot it
+    from pprint import pprint
+    from business_filter import BusinessFilter
+    from matchmaking_model import MatchMakingModel
+    from output_visualizer import OutputVisualizer
+    from synthetic_data_partner_portfolio_visualizer import SyntheticDataPartnerPortfolioVisualizer
+
+    partners = seed_partners(args.lat, args.lng, args.engine)
+    sample_lead = Lead(mobile=args.mobile, location=Location(lat=args.lat, lng=args.lng))
 
     # Invoke the portfolio visualizer after seeding
-    portfolio_visualizer = SyntheticDataPartnerPortfolioVisualizer(partners)
-    sample_location = Location(lat=lead_lat, lng=lead_lng)
-    sample_lead = Lead(mobile=lead_mobile, location=sample_location)
-    portfolio_visualizer.visualize(sample_lead)
+    SyntheticDataPartnerPortfolioVisualizer(partners).visualize(sample_lead)
 
     business_filter = BusinessFilter(partners)
-    # Sample lead near center
-    notifiable = business_filter.notified_partners(sample_lead)
-    model = MatchMakingModel(notifiable)
-    matches = model.match(sample_lead)
+    profile = business_filter.distance_profile(sample_lead)
+    notifiable, high_comp = business_filter.select(profile)
+    if high_comp is not None:
+        print(f"Location deemed {'high' if high_comp else 'low'} competition")
+    matches = MatchMakingModel(notifiable).match(sample_lead, profile)
     pprint(matches)  # Pretty print the full matches
 
     # Simple list of partners and their probability scores
@@ -95,5 +117,59 @@ if __name__ == "__main__":
     print("\nSimple list of partners and scores:")
     pprint(simple_list)
 
-    visualizer = OutputVisualizer(partners)
-    visualizer.visualize(sample_lead)
+    OutputVisualizer(partners, index=business_filter.index).visualize(sample_lead, open_viewer=not args.no_open)
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Partner notification + matchmaking on synthetic or snapshotted portfolios")
+    sub = parser.add_subparsers(dest='command')
+
+    def lead_args(p: argparse.ArgumentParser, snapshot: bool = True) -> None:
+        p.add_argument('--lat', type=float, default=DEFAULT_LAT, help="Lead latitude (also the seeding center)")
+        p.add_argument('--lng', type=float, default=DEFAULT_LNG, help="Lead longitude (also the seeding center)")
+        p.add_argument('--mobile', default=DEFAULT_MOBILE)
+        p.add_argument('--engine', choices=('classic', 'numpy'), default='classic', help="Seeder to use when seeding")
+        if snapshot:
+            p.add_argument('--snapshot', help="Use this partner snapshot instead of seeding")
+
+    p = sub.add_parser('seed', help="Seed a synthetic portfolio and save it as a snapshot")
+    lead_args(p, snapshot=False)
+    p.add_argument('--out', required=True, help="Snapshot path to write")
+    p.add_argument('--workers', type=int, default=1, help="Processes for the classic seeder (0: all cores; numpy takes 1 only); same output for any count")
+    p.add_argument('--per-file', type=int, help="Stream into a directory of snapshots with this many partners each")
+    p.set_defaults(func=cmd_seed)
+
+    p = sub.add_parser('match', help="Notified partners + ranking for one lead, as JSON")
+    lead_args(p)
+    p.add_argument('--top-k', type=int, help="Keep only the best k matches")
+    p.set_defaults(func=cmd_match)
+
+    p = sub.add_parser('render', help="Draw the lead plot (and optionally every partner's map)")
+    lead_args(p)
+    p.add_argument('--lead-plot', default='lead_plot.png', help="Where to write the lead plot")
+    p.add_argument('--maps-dir', help="Also draw partner portfolio maps into this directory")
+    p.add_argument('--workers', type=int, help="Processes for the partner maps")
+    p.add_argument('--open', action='store_true', help="Open the lead plot with xdg-open")
+    p.set_defaults(func=cmd_render)
+
+    p = sub.add_parser('bench', help="Run the benchmark scenarios (see benchmarks.py for the full CLI)")
+    p.add_argument('--scenario', action='append', help="Repeatable; default: all")
+    p.add_argument('--leads', type=int, default=200)
+    p.add_argument('--seed-repeats', type=int, default=3)
+    p.add_argument('--out', help="Write the results here as JSON")
+    p.set_defaults(func=cmd_bench)
+
+    p = sub.add_parser('demo', help="Seed, draw partner maps, match the sample lead and plot it (the default)")
+    lead_args(p, snapshot=False)
+    p.add_argument('--no-open', action='store_true', help="Don't open the lead plot")
+    p.set_defaults(func=cmd_demo)
+    return parser
+
+def main(argv: Optional[List[str]] = None) -> None:
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or (argv[0].startswith('-') and argv[0] not in ('-h', '--help')):
+        argv = ['demo'] + argv  # Plain `python main.py` still runs the walkthrough
+    args = build_parser().parse_args(argv)
+    args.func(args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+# ~/Apps/genie/matching_service.py
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+import argparse
+import asyncio
+import json
+import math
+
+from models import Location, Lead, Partner
+from business_filter import BusinessFilter
+from matchmaking_model import MatchMakingModel
+from spatial_index import GridIndex
+from metrics import Metrics, json_lines_hook
+
+Result = Tuple[List[Partner], List[Tuple[Partner, float]]]
+
+class MatchingService:
+    # Long-running matcher: partners and indexes stay resident, requests that land within
+    # window_ms of each other are run as one notified_partners_batch + match_batch call, and
+    # concurrent requests for the same lead location share a single computation.
+    def __init__(self, partners: Sequence[Partner], window_ms: float = 5.0, max_batch: int = 256,
+                 index: Optional[GridIndex] = None, metrics: Optional[Metrics] = None) -> None:
+        self.partners = partners
+        self.metrics = metrics if metrics is not None else Metrics(enabled=False)
+        self.business_filter = BusinessFilter(partners, index=index)
+        self.model = MatchMakingModel(partners, self.business_filter.index)
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.queue: "asyncio.Queue[Tuple[Lead, asyncio.Future]]" = asyncio.Queue()
+        self.in_flight: Dict[Location, asyncio.Future] = {}  # Coalescing: location -> pending result
+        self.stats = {'requests': 0, 'coalesced': 0, 'batches': 0, 'computed': 0}
+        self._batcher: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._batcher = asyncio.get_running_loop().create_task(self._run_batches())
+
+    async def stop(self) -> None:
+        if self._batcher is not None:
+            self._batcher.cancel()
+            try:
+                await self._batcher
+            except asyncio.CancelledError:
+                pass
+
+    async def match(self, lead: Lead) -> Result:
+        self.stats['requests'] += 1
+        # Rejected here so a bad lead never reaches (and fails) a shared batch
+        if not (math.isfinite(lead.location.lat) and math.isfinite(lead.location.lng)):
+            raise ValueError(f"Non-finite location {tuple(lead.location)}")
+        future = self.in_flight.get(lead.location)
+        if future is not None:
+            self.stats['coalesced'] += 1
+        else:
+            # Results only depend on the location, so one computation serves every lead at it
+            future = asyncio.get_running_loop().create_future()
+            self.in_flight[lead.location] = future
+            await self.queue.put((lead, future))
+        return await asyncio.shield(future)
+
+    async def _run_batches(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            leads = [lead for lead, _ in batch]
+            try:
+                # Off the event loop, so new requests keep queueing while this batch runs
+                results = await loop.run_in_executor(None, self._compute, leads)
+            except Exception:
+                # One bad lead mustn't fail everyone batched with it: retry them one by one
+                results = await loop.run_in_executor(None, self._compute_each, leads)
+            self.stats['batches'] += 1
+            self.stats['computed'] += len(batch)
+            for (lead, future), result in zip(batch, results):
+                del self.in_flight[lead.location]
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def _compute(self, leads: List[Lead]) -> List[Result]:
+        with self.metrics.trace(name='batch') as trace:
+            notified = self.business_filter.notified_partners_batch(leads)
+            matches = self.model.match_batch(leads, notified)
+            if trace is not None:
+                trace.observe('batch_size', len(leads))
+        return list(zip(notified, matches))
+
+    def _compute_each(self, leads: List[Lead]) -> List[Union[Result, Exception]]:
+        results: List[Union[Result, Exception]] = []
+        for lead in leads:
+            try:
+                results.extend(self._compute([lead]))
+            except Exception as e:
+                results.append(e)
+        return results
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        # Newline-delimited JSON: {"id": ..., "mobile": ..., "lat": ..., "lng": ...} per line.
+        # Lines are served concurrently, so replies can come back out of order; match them on "id".
+        lock = asyncio.Lock()
+        tasks = set()
+
+        async def reply_to(line: bytes) -> None:
+            request_id = None
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise ValueError("expected a JSON object")
+                request_id = request.get('id')
+                lead = Lead(mobile=str(request.get('mobile', '')),
+                            location=Location(lat=float(request['lat']), lng=float(request['lng'])))
+            except (ValueError, KeyError, TypeError) as e:
+                reply = {'id': request_id, 'error': f"Bad request: {e}"}
+            else:
+                try:
+                    notified, matches = await self.match(lead)
+                    reply = {
+                        'id': request_id,
+                        'mobile': lead.mobile,
+                        'notified': [p.long_lco_account_id for p in notified],
+                        'matches': [{'partner_id': p.long_lco_account_id, 'score': score} for p, score in matches],
+                    }
+                except ValueError as e:
+                    reply = {'id': request_id, 'error': f"Bad request: {e}"}
+                except Exception as e:
+                    # Every request gets an answer, whatever went wrong matching it
+                    reply = {'id': request_id, 'error': f"Match failed: {e!r}"}
+            async with lock:
+                writer.write(json.dumps(reply).encode() + b'\n')
+                await writer.drain()
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                if line.strip():
+                    task = asyncio.create_task(reply_to(line))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        finally:
+            writer.close()
+
+async def serve(partners: Sequence[Partner], host: str = '127.0.0.1', port: int = 8765,
+                unix_path: Optional[str] = None, window_ms: float = 5.0, max_batch: int = 256,
+                index: Optional[GridIndex] = None, metrics: Optional[Metrics] = None) -> None:
+    service = MatchingService(partners, window_ms=window_ms, max_batch=max_batch, index=index, metrics=metrics)
+    service.start()
+    if unix_path:
+        server = await asyncio.start_unix_server(service.handle_connection, path=unix_path)
+    else:
+        server = await asyncio.start_server(service.handle_connection, host, port)
+    print(f"Matching service listening on {unix_path or f'{host}:{port}'} with {len(partners)} partners")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.stop()
+
+if __name__ == "__main__":
+    from synthetic_data_seeder import SyntheticDataSeeder
+    from snapshot import Snapshot
+
+    parser = argparse.ArgumentParser(description="Serve notified partners + rankings over newline-delimited JSON")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--unix', help="Listen on this Unix socket path instead of TCP")
+    parser.add_argument('--window-ms', type=float, default=5.0, help="Micro-batching window")
+    parser.add_argument('--max-batch', type=int, default=256)
+    parser.add_argument('--center-lat', type=float, default=28.65)
+    parser.add_argument('--center-lng', type=float, default=77.275)
+    parser.add_argument('--snapshot', help="Serve this partner snapshot (see snapshot.py) instead of seeding one")
+    parser.add_argument('--metrics-log', help="Append one JSON line of stage timings and counters per batch here")
+    parser.add_argument('--metrics-sample', type=int, default=1, help="Trace every Nth batch")
+    parser.add_argument('--profile', help="cProfile traced batches and write the stats here on shutdown")
+    args = parser.parse_args()
+
+    metrics = None
+    if args.metrics_log or args.profile:
+        metrics = Metrics(sample_every=args.metrics_sample, profile=bool(args.profile))
+        if args.metrics_log:
+            metrics.add_hook(json_lines_hook(open(args.metrics_log, 'a', buffering=1)))
+
+    if args.snapshot:
+        snapshot = Snapshot(args.snapshot)
+        partners, index = snapshot.partners, snapshot.index
+    else:
+        # Freshly seeded synthetic portfolio, same as main.py
+        partners, index = SyntheticDataSeeder(center_lat=args.center_lat, center_lng=args.center_lng).seed(), None
+    try:
+        asyncio.run(serve(partners, args.host, args.port, args.unix, args.window_ms, args.max_batch, index, metrics))
+    finally:
+        if args.profile:
+            metrics.dump_profile(args.profile)
@@ -0,0 +1,293 @@
+# ~/Apps/genie/matchmaking_model.py
+from typing import Dict, Iterator, List, Optional, Tuple
+import heapq
+
+import numpy as np
+
+from models import Lead, Partner
+from distance import bbox_min_distance, min_distance, to_arrays
+from spatial_index import PointTable, ACTIVE_CUSTOMER, INACTIVE_CUSTOMER, RECENT_LEAD, SPLITTER
+from distance_profile import DistanceProfile
+from metrics import LeadTrace, current_trace
+from partner_features import PartnerFeatures, ScoreWeights, score
+
+# Cap on leads x points per distance matrix in match_batch (~16MB per float64 temporary)
+MAX_MATRIX_ELEMS = 2_000_000
+
+class MatchMakingModel:
+    def __init__(self, partners: List[Partner], table: Optional[PointTable] = None,
+                 features: Optional[PartnerFeatures] = None, weights: ScoreWeights = ScoreWeights()) -> None:
+        self.partners = partners
+        # Point table for the batch path. Pass BusinessFilter.index to share it (and its
+        # incremental updates); otherwise one is built from partners on the first batch call.
+        self._table = table
+        # For match_scored: features over the same partner list as the table/index (attach them
+        # to the PortfolioUpdater too), built on first use if not given
+        self.features = features
+        self.weights = weights
+        # Per-partner bounding boxes for match_topk, valid for one table layout
+        self._bounds: Optional[Tuple[np.ndarray, np.ndarray, np.ndarray]] = None
+        self._bounds_layout: Optional[np.ndarray] = None
+
+    def match(self, lead: Lead, profile: Optional[DistanceProfile] = None) -> List[Tuple[Partner, float]]:
+        # With a profile from BusinessFilter.distance_profile, distances are read from it
+        # instead of being recomputed per partner
+        trace = current_trace()
+        if trace is not None:
+            trace.skip()  # Whatever ran between the filter and here isn't scoring
+            trace.count('partners_scanned', len(self.partners))
+        candidates = []
+        for partner in self.partners:
+            if profile is not None and id(partner) in profile.index.position:
+                min_dist = self.profile_min_dist(profile, profile.index.position[id(partner)])
+            else:
+                min_dist = self.partner_min_dist(lead, partner, trace)
+            if min_dist is None:
+                continue
+
+            score = 1 / (1 + min_dist / 500)  # Normalize; tweak divisor if you want different sensitivity
+
+            candidates.append((partner, score))
+        if trace is not None:
+            trace.mark('scoring')
+
+        # Sort by score descending
+        candidates.sort(key=lambda x: x[1], reverse=True)
+        if trace is not None:
+            trace.mark('sort')
+            trace.observe('matched', len(candidates))
+        return candidates
+
+    def partner_min_dist(self, lead: Lead, partner: Partner, trace: Optional[LeadTrace] = None) -> Optional[float]:
+        # Distance the score is based on, or None if the partner isn't within 500m
+        all_locations = (
+            [c.location for c in partner.active_customers] +
+            [c.location for c in partner.inactive_but_geographically_relevant_customers] +
+            [l.location for l in partner.recent_leads_interested_in] +
+            partner.splitters
+        )
+        if not all_locations:
+            return None  # Skip partners with no reference locations
+
+        min_dist_all = min_distance(lead.location, *to_arrays(all_locations))
+        if trace is not None:
+            trace.count('points_evaluated', len(all_locations))
+            trace.count('distance_computations', len(all_locations))
+        if min_dist_all > 500:
+            return None  # Not within 500m
+
+        # Prefer closest recent lead, fallback to closest customer or splitter
+        recent_locs = [l.location for l in partner.recent_leads_interested_in]
+        customer_locs = (
+            [c.location for c in partner.active_customers] +
+            [c.location for c in partner.inactive_but_geographically_relevant_customers] +
+            partner.splitters
+        )
+        if trace is not None:
+            trace.count('distance_computations', len(recent_locs) or len(customer_locs))
+        if recent_locs:
+            return min_distance(lead.location, *to_arrays(recent_locs))
+        elif customer_locs:
+            return min_distance(lead.location, *to_arrays(customer_locs))
+        return None  # Shouldn't reach here due to all_locations check
+
+    def profile_min_dist(self, profile: DistanceProfile, partner_idx: int) -> Optional[float]:
+        # Same as partner_min_dist, read from the lead's distance profile
+        nearest = profile.nearest_for(partner_idx)
+        if nearest.min() > 500:
+            return None  # Not within 500m (the profile is inf for anything further)
+        if profile.index.partners[partner_idx].recent_leads_interested_in:
+            return profile.recent_lead_distance(partner_idx)
+        return float(nearest[[ACTIVE_CUSTOMER, INACTIVE_CUSTOMER, SPLITTER]].min())
+
+    def match_scored(self, lead: Lead, profile: Optional[DistanceProfile] = None,
+                     weights: Optional[ScoreWeights] = None) -> List[Tuple[Partner, float]]:
+        # match() with the multi-factor score: the same candidates and scoring distances, found
+        # for all partners at once (from the profile if given, else one distance matrix), then
+        # scored together with the cached partner features in one array expression.
+        # The default weights give exactly match()'s scores and order.
+        trace = current_trace()
+        if trace is not None:
+            trace.skip()
+            trace.count('partners_scanned', len(self.partners))
+        if profile is not None:
+            table: PointTable = profile.index
+            idx = np.array([table.position[id(p)] for p in self.partners], dtype=np.int64)
+            # Profile rows are sorted by partner index; partners outside it stay inf
+            nearest = np.full((len(idx), 4), np.inf)
+            if len(profile.partner_idx):
+                rows = np.minimum(np.searchsorted(profile.partner_idx, idx), len(profile.partner_idx) - 1)
+                found = profile.partner_idx[rows] == idx
+                nearest[found] = profile.nearest[rows[found]]
+        else:
+            if self._table is None:
+                self._table = PointTable(self.partners)
+            table = self._table
+            idx = np.array([table.position[id(p)] for p in self.partners], dtype=np.int64)
+            nearest = table.nearest_by_kind(np.array([lead.location.lat]), np.array([lead.location.lng]), idx)[0]
+            if trace is not None:
+                points = int(np.diff(table.point_start)[idx].sum())
+                trace.count('points_evaluated', points)
+                trace.count('distance_computations', points)
+
+        within = np.flatnonzero(nearest.min(axis=1) <= 500)
+        has_recent = np.array([bool(self.partners[j].recent_leads_interested_in) for j in within.tolist()], dtype=bool)
+        # Prefer closest recent lead, fallback to closest customer or splitter
+        dists = np.where(has_recent, nearest[within, RECENT_LEAD],
+                         nearest[within][:, [ACTIVE_CUSTOMER, INACTIVE_CUSTOMER, SPLITTER]].min(axis=1))
+        if profile is not None:
+            for pos in np.flatnonzero(has_recent & np.isinf(dists)).tolist():
+                dists[pos] = profile.recent_lead_distance(int(idx[within[pos]]))
+
+        if self.features is None:
+            self.features = PartnerFeatures(table.partners)
+        scores = score(dists, idx[within], self.features, weights or self.weights)
+        order = np.argsort(-scores, kind='stable')  # Ties keep partner order, like match's sort
+        if trace is not None:
+            trace.mark('scoring')
+            trace.observe('matched', len(order))
+        return [(self.partners[j], s) for j, s in zip(within[order].tolist(), scores[order].tolist())]
+
+    def match_topk(self, lead: Lead, k: int = 10, block: int = 16) -> List[Tuple[Partner, float]]:
+        # Same as match(lead)[:k], ties included. Partners are visited in order of a lower bound on
+        # their scoring distance (from their bounding boxes), with partners whose box is entirely
+        # beyond 500m dropped up front. Exact distances are computed block by block, and the scan
+        # stops as soon as the next partner's best possible score can't beat the current k-th.
+        if k <= 0:
+            return []
+        table = self._topk_table()
+        box_all, box_recent, has_recent = self._bounds
+        idx = np.array([table.position[id(p)] for p in self.partners], dtype=np.int64)
+        loc = lead.location
+        lb_all = bbox_min_distance(loc.lat, loc.lng, *box_all[idx].T)
+        # Partners with recent leads are scored on the nearest of those, wherever it is
+        lb_recent = bbox_min_distance(loc.lat, loc.lng, *box_recent[idx].T)
+        lb_score = np.where(has_recent[idx], lb_recent, lb_all)
+
+        trace = current_trace()
+        if trace is not None:
+            trace.skip()
+            trace.count('partners_scanned', len(self.partners))
+        pos = np.flatnonzero(lb_all <= 500)
+        pos = pos[np.lexsort((pos, lb_score[pos]))]  # Best bound first, ties in partner order
+        best_scores = 1 / (1 + lb_score[pos] / 500)
+
+        heap: List[Tuple[float, int]] = []  # (score, -position): heap[0] is the current k-th
+        visited = 0
+        for start in range(0, len(pos), block):
+            if len(heap) == k and best_scores[start] < heap[0][0]:
+                break  # Bounds are sorted, so nobody after this can make the cut
+            chunk = pos[start:start + block]
+            nearest = table.nearest_by_kind(np.array([loc.lat]), np.array([loc.lng]), idx[chunk])[0]
+            visited += len(chunk)
+            if trace is not None:
+                points = int(np.diff(table.point_start)[idx[chunk]].sum())
+                trace.count('points_evaluated', points)
+                trace.count('distance_computations', points)
+            for p, row in zip(chunk.tolist(), nearest):
+                if row.min() > 500:
+                    continue
+                if has_recent[idx[p]]:
+                    min_dist = float(row[RECENT_LEAD])
+                else:
+                    min_dist = float(row[[ACTIVE_CUSTOMER, INACTIVE_CUSTOMER, SPLITTER]].min())
+                entry = (1 / (1 + min_dist / 500), -p)
+                if len(heap) < k:
+                    heapq.heappush(heap, entry)
+                elif entry > heap[0]:
+                    heapq.heapreplace(heap, entry)
+
+        top = sorted(heap, reverse=True)
+        if trace is not None:
+            trace.count('partners_pruned', len(self.partners) - visited)
+            trace.mark('scoring')
+            trace.observe('matched', len(top))
+        return [(self.partners[-p], score) for score, p in top]
+
+    def _topk_table(self) -> PointTable:
+        # The point table plus bounding boxes for its current layout, rebuilt after any update
+        if self._table is None:
+            self._table = PointTable(self.partners)
+        table = self._table
+        table.ensure_layout()
+        if self._bounds is None or self._bounds_layout is not table.layout_ids:
+            box_recent = table.partner_bounds((RECENT_LEAD,))
+            self._bounds = (table.partner_bounds(), box_recent, ~np.isnan(box_recent[:, 0]))
+            self._bounds_layout = table.layout_ids
+        return table
+
+    def match_batch(self, leads: List[Lead], notified: Optional[List[List[Partner]]] = None,
+                    max_matrix_elems: int = MAX_MATRIX_ELEMS) -> List[List[Tuple[Partner, float]]]:
+        # Same scoring as match for N leads. If notified is given, lead j is only scored against
+        # notified[j] (same objects as self.partners, e.g. BusinessFilter.notified_partners_batch
+        # output), exactly like MatchMakingModel(notified[j]).match(leads[j]).
+        # Partner numbers below are positions in table.partners.
+        if self._table is None:
+            self._table = PointTable(self.partners)
+        table = self._table
+
+        if notified is None:
+            # Everyone is scored against every lead: fixed-size chunks, no per-lead bookkeeping
+            everyone = np.array([table.position[id(p)] for p in self.partners], dtype=np.int64)
+            allowed = [everyone] * len(leads)
+            step = max(1, max_matrix_elems // max(1, int(table.alive.sum())))
+            chunks = ((list(range(s, min(s + step, len(leads)))), everyone) for s in range(0, len(leads), step))
+        else:
+            allowed = [np.array([table.position[id(p)] for p in partners], dtype=np.int64) for partners in notified]
+            chunks = self._chunks(allowed, max_matrix_elems)
+
+        trace = current_trace()
+        if trace is not None:
+            trace.skip()
+        results: List[List[Tuple[Partner, float]]] = [[] for _ in leads]
+        for chunk, partner_idx in chunks:
+            lats, lngs = to_arrays(leads[j].location for j in chunk)
+            nearest = table.nearest_by_kind(lats, lngs, partner_idx)
+            if trace is not None:
+                points = len(chunk) * int(np.diff(table.point_start)[partner_idx].sum())
+                trace.count('points_evaluated', points)
+                trace.count('distance_computations', points)
+                trace.mark('distance_matrix')
+            nearest_all = nearest.min(axis=2)
+            nearest_other = nearest[:, :, [ACTIVE_CUSTOMER, INACTIVE_CUSTOMER, SPLITTER]].min(axis=2)
+            # Position of every partner id inside this chunk's partner_idx
+            local = np.empty(len(table.partners), dtype=np.int64)
+            local[partner_idx] = np.arange(len(partner_idx))
+            for row, j in enumerate(chunk):
+                lis = local[allowed[j]]
+                within = nearest_all[row, lis] <= 500  # Also drops partners with no reference locations
+                candidates = []
+                for p, li in zip(allowed[j][within].tolist(), lis[within].tolist()):
+                    # Prefer closest recent lead, fallback to closest customer or splitter
+                    if table.partners[p].recent_leads_interested_in:
+                        min_dist = float(nearest[row, li, RECENT_LEAD])
+                    else:
+                        min_dist = float(nearest_other[row, li])
+                    candidates.append((table.partners[p], 1 / (1 + min_dist / 500)))
+                candidates.sort(key=lambda x: x[1], reverse=True)
+                results[j] = candidates
+            if trace is not None:
+                trace.mark('scoring')
+        return results
+
+    def _chunks(self, allowed: List[np.ndarray], max_matrix_elems: int) -> Iterator[Tuple[List[int], np.ndarray]]:
+        # Greedy chunks of lead positions whose (leads x points of the partners they need) stays under budget
+        self._table.ensure_layout()
+        counts = np.diff(self._table.point_start).tolist()
+        chunk: List[int] = []
+        needed: Dict[int, None] = {}
+        size = 0
+        for j, partner_idx in enumerate(allowed):
+            partner_idx = list(dict.fromkeys(partner_idx.tolist()))
+            new = [p for p in partner_idx if p not in needed]
+            new_size = size + sum(counts[p] for p in new)
+            if chunk and (len(chunk) + 1) * new_size > max_matrix_elems:
+                yield chunk, np.array(list(needed), dtype=np.int64)
+                chunk, needed, size = [], {}, 0
+                new = partner_idx
+                new_size = sum(counts[p] for p in new)
+            chunk.append(j)
+            needed.update(dict.fromkeys(new))
+            size = new_size
+        if chunk:
+            yield chunk, np.array(list(needed), dtype=np.int64)
@@ -0,0 +1,157 @@
+# ~/Apps/genie/metrics.py
+from typing import TYPE_CHECKING, Any, Callable, Dict, IO, Iterator, List, NamedTuple, Optional
+from contextlib import contextmanager
+from contextvars import ContextVar
+import io
+import json
+import time
+
+from models import Lead
+
+if TYPE_CHECKING:
+    import cProfile
+
+# The trace of the lead currently being processed, if it's being traced. Hot paths read this once
+# per call and skip every metric when it's None, so untraced leads cost one ContextVar.get.
+_current: ContextVar[Optional["LeadTrace"]] = ContextVar('current_trace', default=None)
+
+def current_trace() -> Optional["LeadTrace"]:
+    return _current.get()
+
+class Summary(NamedTuple):
+    count: int
+    total: float
+    max: float
+
+    def add(self, value: float) -> "Summary":
+        return Summary(self.count + 1, self.total + value, max(self.max, value))
+
+class LeadTrace:
+    # Where one lead's (or one batch's) time went: seconds per stage, in the order the stages
+    # first ran, plus counters and observed values. Stages are timed back to back, so mark(stage)
+    # charges everything since the previous mark to that stage; repeated marks accumulate.
+    __slots__ = ('name', 'lead', 'stages', 'counters', 'values', 'started', 'elapsed', '_last')
+
+    def __init__(self, name: str, lead: Optional[Lead]) -> None:
+        self.name = name
+        self.lead = lead
+        self.stages: Dict[str, float] = {}
+        self.counters: Dict[str, int] = {}
+        self.values: Dict[str, float] = {}
+        self.started = self._last = time.perf_counter()
+        self.elapsed = 0.0
+
+    def mark(self, stage: str) -> None:
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + (now - self._last)
+        self._last = now
+
+    def skip(self) -> None:
+        # Leave the time since the last mark unattributed (e.g. work that isn't a pipeline stage)
+        self._last = time.perf_counter()
+
+    def count(self, name: str, n: int = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name: str, value: float) -> None:
+        self.values[name] = value
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'mobile': self.lead.mobile if self.lead else None,
+            'lat': self.lead.location.lat if self.lead else None,
+            'lng': self.lead.location.lng if self.lead else None,
+            'elapsed_ms': self.elapsed * 1000,
+            'stages_ms': {stage: s * 1000 for stage, s in self.stages.items()},
+            'counters': self.counters,
+            'values': self.values,
+        }
+
+class Metrics:
+    # Registry for the matching pipeline's instrumentation. Wrap a lead's work in trace(lead);
+    # BusinessFilter, DistanceProfile and MatchMakingModel record stage timings and counters
+    # into it, and finished traces are folded into the totals here and passed to every hook.
+    # enabled=False (or leads skipped by sample_every) costs next to nothing. With profile=True
+    # every traced lead also runs under one cumulative cProfile profiler.
+    def __init__(self, enabled: bool = True, sample_every: int = 1, profile: bool = False) -> None:
+        self.enabled = enabled
+        self.sample_every = max(1, sample_every)
+        self.hooks: List[Callable[[LeadTrace], None]] = []
+        self.profiler: Optional["cProfile.Profile"] = None
+        if profile:
+            import cProfile  # Only when asked for; keeps the import off the match path
+            self.profiler = cProfile.Profile()
+        self._seen = 0
+        self.reset()
+
+    def reset(self) -> None:
+        self.traces = 0
+        self.stages: Dict[str, Summary] = {}
+        self.counters: Dict[str, int] = {}
+        self.values: Dict[str, Summary] = {}
+        self.elapsed: Dict[str, Summary] = {}  # Trace name -> end-to-end time
+
+    def add_hook(self, hook: Callable[[LeadTrace], None]) -> None:
+        self.hooks.append(hook)
+
+    @contextmanager
+    def trace(self, lead: Optional[Lead] = None, name: str = 'lead') -> Iterator[Optional[LeadTrace]]:
+        self._seen += 1
+        if not self.enabled or (self._seen - 1) % self.sample_every or _current.get() is not None:
+            yield None  # Not sampled, or already inside a trace (which keeps collecting)
+            return
+        trace = LeadTrace(name, lead)
+        token = _current.set(trace)
+        if self.profiler is not None:
+            self.profiler.enable()
+        try:
+            yield trace
+        finally:
+            if self.profiler is not None:
+                self.profiler.disable()
+            _current.reset(token)
+            trace.elapsed = time.perf_counter() - trace.started
+            self.record(trace)
+
+    def record(self, trace: LeadTrace) -> None:
+        self.traces += 1
+        self.elapsed[trace.name] = self.elapsed.get(trace.name, Summary(0, 0.0, 0.0)).add(trace.elapsed)
+        for stage, seconds in trace.stages.items():
+            self.stages[stage] = self.stages.get(stage, Summary(0, 0.0, 0.0)).add(seconds)
+        for name, n in trace.counters.items():
+            self.counters[name] = self.counters.get(name, 0) + n
+        for name, value in trace.values.items():
+            self.values[name] = self.values.get(name, Summary(0, 0.0, 0.0)).add(value)
+        for hook in self.hooks:
+            hook(trace)
+
+    def summary(self) -> Dict[str, Any]:
+        def summarize(s: Summary, scale: float) -> Dict[str, float]:
+            return {'count': s.count, 'total': s.total * scale, 'mean': s.total * scale / s.count, 'max': s.max * scale}
+        return {
+            'traces': self.traces,
+            'elapsed_ms': {name: summarize(s, 1000) for name, s in self.elapsed.items()},
+            'stages_ms': {stage: summarize(s, 1000) for stage, s in self.stages.items()},
+            'counters': dict(self.counters),
+            'values': {name: summarize(s, 1) for name, s in self.values.items()},
+        }
+
+    def profile_stats(self, sort: str = 'cumulative', limit: int = 25) -> str:
+        if self.profiler is None:
+            return ''
+        import pstats
+        out = io.StringIO()
+        pstats.Stats(self.profiler, stream=out).sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+
+    def dump_profile(self, path: str) -> None:
+        # For snakeviz / pstats
+        if self.profiler is not None:
+            self.profiler.dump_stats(path)
+
+def json_lines_hook(stream: IO[str]) -> Callable[[LeadTrace], None]:
+    # Hook writing one JSON object per finished trace, e.g. to a log file
+    def hook(trace: LeadTrace) -> None:
+        stream.write(json.dumps(trace.to_dict()) + '\n')
+    return hook
@@ -0,0 +1,337 @@
+# ~/Apps/genie/numpy_seeder.py
+from typing import Callable, Iterator, List, NamedTuple, Optional, Tuple
+from math import radians, cos, pi
+import os
+
+import numpy as np
+
+from models import Location, Partner
+from distance import haversine_many, haversine_pairs
+from spatial_index import ACTIVE_CUSTOMER, INACTIVE_CUSTOMER, RECENT_LEAD, SPLITTER
+from synthetic_data_seeder import CURRENT_DATE, SyntheticDataSeeder, check_ring_capacity
+from partner_portfolio import NO_STRING, PartnerPortfolio, StringTable
+
+M_PER_DEG = 111000.0  # Same flat conversion the scalar seeder uses
+STREAM_CHUNK = 1024  # Partners materialized at a time by iter_partners
+
+# Cell keys pack (group, row, col) into one int64: 21 bits each, rows/cols relative to the center cell
+_FIELD_BITS = 21
+_FIELD_HALF = 1 << (_FIELD_BITS - 1)
+_NEIGHBOUR_OFFSETS = np.array([(dy << _FIELD_BITS) + dx for dy in range(-2, 3) for dx in range(-2, 3)], dtype=np.int64)
+_PROBE_BLOCK = 1 << 16  # Candidates probed per searchsorted call (25 probes each)
+
+Draw = Callable[[np.ndarray], Tuple[np.ndarray, np.ndarray]]
+
+class SeededArrays(NamedTuple):
+    # One row per point (customers, recent leads and splitters alike). Customer-only columns
+    # are 0 for the other kinds. tenure is per partner.
+    partner: np.ndarray      # int64 partner index
+    kind: np.ndarray         # int8, spatial_index point kinds
+    lat: np.ndarray
+    lng: np.ndarray
+    expiry_day: np.ndarray   # int64 date ordinal of plan_expiry_dt
+    install_hrs: np.ndarray  # int64
+    mobile: np.ndarray       # int64, the 9 digits after +91
+    tenure: np.ndarray       # int64, one per partner
+
+class NumpySyntheticDataSeeder(SyntheticDataSeeder):
+    # Same knobs as SyntheticDataSeeder (num_partners, customers, the sigmas, outlier rates, ...)
+    # but every draw is an array draw, min_dist spacing is enforced with vectorized cell-hash
+    # dart throwing and customers are tracked by integer id, so outlier relocation is O(n).
+    # Statistically equivalent to the scalar seeder, not draw-for-draw identical.
+    def __init__(self, center_lat: float, center_lng: float, radius: float = 1000.0, seed: int = 42):
+        super().__init__(center_lat, center_lng, radius, seed)
+        self.rng = np.random.default_rng(seed)
+
+    # workers is only there to keep the SyntheticDataSeeder signatures: the draws are whole-array
+    # ops on one rng stream, which doesn't split across processes, so anything but 1 is refused
+    def seed(self, workers: Optional[int] = 1) -> List[Partner]:
+        check_workers(workers)
+        return to_partners(self.seed_arrays())
+
+    def iter_partners(self, workers: Optional[int] = 1) -> Iterator[Partner]:
+        # Same partners as seed(). The arrays are drawn whole (a few dozen bytes a point); only
+        # the Partner objects are built a chunk at a time.
+        check_workers(workers)
+        for first, chunk in split_arrays(self.seed_arrays(), STREAM_CHUNK):
+            yield from to_partners(chunk, first)
+
+    def seed_to_disk(self, directory: str, partners_per_file: int = 10_000, workers: Optional[int] = 1) -> List[str]:
+        # Same files as SyntheticDataSeeder.seed_to_disk, but each portfolio is built straight
+        # from its slice of the arrays, with no Partner objects in between
+        from snapshot import write_snapshot
+        check_workers(workers)
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for first, chunk in split_arrays(self.seed_arrays(), partners_per_file):
+            path = os.path.join(directory, f"part-{len(paths):05d}.snap")
+            write_snapshot(path, to_portfolio(chunk, first))
+            paths.append(path)
+        return paths
+
+    def seed_arrays(self) -> SeededArrays:
+        # A fresh generator from the root seed on every call (like stream() in the scalar
+        # seeder), so repeated calls give the same arrays
+        self.rng = rng = np.random.default_rng(self.root_seed)
+        n = self.num_partners
+
+        # Random % of partners with centers outside the inner radius
+        num_outside = round(n * int(rng.integers(0, 51)) / 100)
+        outside = np.zeros(n, dtype=bool)
+        outside[rng.permutation(n)[:num_outside]] = True
+        center_lats, center_lngs = np.empty(n), np.empty(n)
+        for mask, r_min, r_max in ((~outside, 0.0, self.radius), (outside, self.radius, self.outer_radius)):
+            k = int(mask.sum())
+            check_ring_capacity(k, r_min, r_max, 100.0)
+            center_lats[mask], center_lngs[mask] = self.place(np.zeros(k, dtype=np.int64), self.ring_draw(r_min, r_max), 100.0)
+
+        # Points per partner, each group clustered around its partner's center
+        groups = {}
+        for kind, total, sigma in (
+            (RECENT_LEAD, self.recent_lead_locations, self.lead_cluster_sigma_m),
+            (SPLITTER, self.splitter_locations, self.splitter_cluster_sigma_m),
+            (ACTIVE_CUSTOMER, self.customers, self.customer_cluster_sigma_m),
+        ):
+            owner = np.repeat(np.arange(n), self.counts(total, n))
+            lats, lngs = self.place(owner, self.gaussian_draw(owner, center_lats, center_lngs, sigma), 5.0)
+            groups[kind] = (owner, lats, lngs)
+        cust_owner, cust_lats, cust_lngs = groups[ACTIVE_CUSTOMER]
+        num_cust = len(cust_owner)
+
+        # Uneven active/inactive split per partner: roughly half, but varied
+        per_partner = np.bincount(cust_owner, minlength=n)
+        base = per_partner // 2
+        variation = np.maximum(1, base // 2)
+        num_active = np.where(per_partner > 0, rng.integers(np.maximum(0, base - variation), np.minimum(per_partner, base + variation) + 1), 0)
+        order = np.lexsort((rng.random(num_cust), cust_owner))  # Random order within each partner
+        cust_start = np.concatenate(([0], np.cumsum(per_partner)))
+        rank = np.empty(num_cust, dtype=np.int64)
+        rank[order] = np.arange(num_cust) - cust_start[cust_owner[order]]
+        active = rank < num_active[cust_owner]
+        cust_kind = np.where(active, ACTIVE_CUSTOMER, INACTIVE_CUSTOMER).astype(np.int8)
+        expiry_day = CURRENT_DATE.toordinal() + np.where(active, rng.integers(1, 731, num_cust), -rng.integers(1, 366, num_cust))
+        install_hrs = rng.integers(2, 151, num_cust)
+
+        # Natural candidates: partners with any point <= 500m from the lead (the seeder center)
+        lead_loc = Location(lat=self.center_lat, lng=self.center_lng)
+        nearest = np.full(n, np.inf)
+        for owner, lats, lngs in groups.values():
+            np.minimum.at(nearest, owner, haversine_many(lead_loc, lats, lngs))
+        n_natural = int((nearest <= 500).sum())
+        if n_natural == 0:
+            num_special = 0
+        else:
+            num_special = max(1, int((self.special_outlier_rate * n_natural) / (1 - self.special_outlier_rate)))
+        non_candidates = np.flatnonzero(nearest > 500)
+        num_special = min(num_special, len(non_candidates))
+        special = rng.choice(non_candidates, num_special, replace=False) if num_special > 0 else np.empty(0, dtype=np.int64)
+
+        # Special outliers: one customer per special partner moved within 100m of the lead
+        special = special[per_partner[special] > 0]
+        moved = cust_start[special] + (rng.random(len(special)) * per_partner[special]).astype(np.int64)
+        cust_lats[moved], cust_lngs[moved] = self.ring_draw(0.0, 100.0)(moved)
+
+        # Regular outliers: the rest of outlier_rate moved 2-10km out
+        remaining = round(self.outlier_rate * num_cust) - len(moved)
+        if remaining > 0:
+            possible = np.setdiff1d(np.arange(num_cust), moved)
+            selected = rng.choice(possible, min(remaining, len(possible)), replace=False)
+            cust_lats[selected], cust_lngs[selected] = self.ring_draw(2000.0, 10000.0)(selected)
+
+        lead_owner, lead_lats, lead_lngs = groups[RECENT_LEAD]
+        split_owner, split_lats, split_lngs = groups[SPLITTER]
+        num_other = len(lead_owner) + len(split_owner)
+        zeros = np.zeros(num_other, dtype=np.int64)
+        return SeededArrays(
+            partner=np.concatenate((cust_owner, lead_owner, split_owner)),
+            kind=np.concatenate((cust_kind, np.full(len(lead_owner), RECENT_LEAD, dtype=np.int8), np.full(len(split_owner), SPLITTER, dtype=np.int8))),
+            lat=np.concatenate((cust_lats, lead_lats, split_lats)),
+            lng=np.concatenate((cust_lngs, lead_lngs, split_lngs)),
+            expiry_day=np.concatenate((expiry_day, zeros)),
+            install_hrs=np.concatenate((install_hrs, zeros)),
+            mobile=np.concatenate((rng.integers(0, 10**9, num_cust), rng.integers(0, 10**9, len(lead_owner)), zeros[:len(split_owner)])),
+            tenure=rng.integers(1, 11, n),
+        )
+
+    def counts(self, total: int, n: int) -> np.ndarray:
+        # Uneven counts summing to total (last one absorbs the rest, floored at 0)
+        if total == 0 or n == 0:
+            return np.zeros(n, dtype=np.int64)
+        base = total // n
+        variation = max(1, base // 2)
+        counts = np.empty(n, dtype=np.int64)
+        counts[:-1] = self.rng.integers(max(0, base - variation), base + variation + 1, n - 1)
+        counts[-1] = max(0, total - counts[:-1].sum())
+        return counts
+
+    def ring_draw(self, r_min: float, r_max: float) -> Draw:
+        # Uniform over the annulus around the seeder center, same projection as generate_locations
+        center_lat_rad = radians(self.center_lat)
+
+        def draw(slots: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+            k = len(slots)
+            theta = self.rng.uniform(0, 2 * pi, k)
+            r = np.sqrt(self.rng.uniform(0, 1, k) * (r_max**2 - r_min**2) + r_min**2)
+            lats = np.round(self.center_lat + r * np.sin(theta) / M_PER_DEG, 6)
+            lngs = np.round(self.center_lng + r * np.cos(theta) / (M_PER_DEG * cos(center_lat_rad)), 6)
+            return lats, lngs
+        return draw
+
+    def gaussian_draw(self, owner: np.ndarray, center_lats: np.ndarray, center_lngs: np.ndarray, sigma_m: float) -> Draw:
+        # Gaussian around each slot's partner center, same projection as generate_gaussian_locations
+        sigma_lat = sigma_m / M_PER_DEG
+        cos_lat = np.cos(np.radians(center_lats))
+        sigma_lngs = np.where(cos_lat != 0, sigma_lat / np.where(cos_lat != 0, cos_lat, 1), sigma_lat)
+
+        def draw(slots: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+            g = owner[slots]
+            lats = np.round(center_lats[g] + self.rng.normal(0, sigma_lat, len(slots)), 6)
+            lngs = np.round(center_lngs[g] + self.rng.normal(0, 1, len(slots)) * sigma_lngs[g], 6)
+            return lats, lngs
+        return draw
+
+    def place(self, group: np.ndarray, draw: Draw, min_dist: float) -> Tuple[np.ndarray, np.ndarray]:
+        # Fill one point per slot, keeping points of the same group >= min_dist apart. Each round
+        # draws a candidate for every open slot and rejects those within min_dist of an accepted
+        # point or of an earlier candidate. Cells are a bit over min_dist/2 wide: at most one
+        # accepted point fits in a cell, and anything within min_dist is in the 5x5 cells around
+        # a candidate even with the flat projection's error.
+        m = len(group)
+        if m == 0:
+            return np.empty(0), np.empty(0)
+        if min_dist <= 0:
+            return draw(np.arange(m))
+
+        cell = min_dist * 0.51
+        lat_scale = M_PER_DEG / cell
+        lng_scale = M_PER_DEG * cos(radians(self.center_lat)) / cell
+        row0 = int(np.floor(self.center_lat * lat_scale))
+        col0 = int(np.floor(self.center_lng * lng_scale))
+
+        def cell_keys(g: np.ndarray, lats: np.ndarray, lngs: np.ndarray) -> np.ndarray:
+            rows = np.floor(lats * lat_scale).astype(np.int64) - row0 + _FIELD_HALF
+            cols = np.floor(lngs * lng_scale).astype(np.int64) - col0 + _FIELD_HALF
+            if rows.min() < 2 or cols.min() < 2 or rows.max() >= 2 * _FIELD_HALF - 2 or cols.max() >= 2 * _FIELD_HALF - 2:
+                raise ValueError("Points spread too far from the seeder center for the cell-key encoding")
+            return (g << (2 * _FIELD_BITS)) | (rows << _FIELD_BITS) | cols
+
+        def conflicts(keys: np.ndarray, lats: np.ndarray, lngs: np.ndarray, ref_keys: np.ndarray,
+                      ref_lats: np.ndarray, ref_lngs: np.ndarray, ref_rank: Optional[np.ndarray] = None) -> np.ndarray:
+            # True where a point has a ref point (sorted by key, one per key) within min_dist. With
+            # ref_rank, only ref points ranked before the point (its position in keys) count.
+            hit_any = np.zeros(len(keys), dtype=bool)
+            if len(ref_keys) == 0:
+                return hit_any
+            # Probing in key order, offset by offset, keeps searchsorted walking ref_keys sequentially
+            order = np.argsort(keys)
+            for start in range(0, len(order), _PROBE_BLOCK):
+                block = order[start:start + _PROBE_BLOCK]
+                probe = (_NEIGHBOUR_OFFSETS[:, None] + keys[block]).ravel()
+                pos = np.minimum(np.searchsorted(ref_keys, probe), len(ref_keys) - 1)
+                idx = np.flatnonzero(ref_keys[pos] == probe)
+                pts, pos = block[idx % len(block)], pos[idx]
+                if ref_rank is not None:
+                    earlier = ref_rank[pos] < pts
+                    pts, pos = pts[earlier], pos[earlier]
+                close = haversine_pairs(lats[pts], lngs[pts], ref_lats[pos], ref_lngs[pos]) < min_dist
+                hit_any[pts[close]] = True
+            return hit_any
+
+        lats, lngs = np.empty(m), np.empty(m)
+        placed = np.zeros(m, dtype=bool)
+        # Accepted points, sorted by key: a big level plus a small recent one merged into it
+        # once it grows, so the tail rounds (a few stragglers each) don't re-sort everything
+        levels = [(np.empty(0, dtype=np.int64), np.empty(0), np.empty(0)) for _ in range(2)]
+        stalled = 0  # Candidates rejected since the last round that placed anything
+        open_slots = np.arange(m)
+        while len(open_slots):
+            slots = open_slots
+            c_lats, c_lngs = draw(slots)
+            keys = cell_keys(group[slots], c_lats, c_lngs)
+
+            # One candidate per cell (the earliest slot wins)
+            _, first = np.unique(keys, return_index=True)
+            first.sort()
+            slots, c_lats, c_lngs, keys = slots[first], c_lats[first], c_lngs[first], keys[first]
+
+            # Against accepted points (always "earlier"), then against earlier candidates
+            bad = np.zeros(len(slots), dtype=bool)
+            for acc_keys, acc_lats, acc_lngs in levels:
+                bad |= conflicts(keys, c_lats, c_lngs, acc_keys, acc_lats, acc_lngs)
+            by_key = np.argsort(keys)
+            bad |= conflicts(keys, c_lats, c_lngs, keys[by_key], c_lats[by_key], c_lngs[by_key], by_key)
+
+            ok = ~bad
+            if not ok.any():
+                stalled += len(slots)
+                if stalled >= self.max_rejections:
+                    raise ValueError(
+                        f"Gave up after {stalled} rejected candidates in a row with {int(placed.sum())}/{m} points placed; "
+                        f"min_dist={min_dist}m is too dense for this area"
+                    )
+                continue
+            stalled = 0
+            placed[slots[ok]] = True
+            lats[slots[ok]], lngs[slots[ok]] = c_lats[ok], c_lngs[ok]
+            open_slots = open_slots[~placed[open_slots]]
+
+            big, recent = levels
+            recent = tuple(np.concatenate((a, b[ok])) for a, b in zip(recent, (keys, c_lats, c_lngs)))
+            if len(recent[0]) * 4 > len(big[0]):
+                merged = tuple(np.concatenate(pair) for pair in zip(big, recent))
+                by_key = np.argsort(merged[0])
+                levels = [tuple(a[by_key] for a in merged), tuple(a[:0] for a in recent)]
+            else:
+                by_key = np.argsort(recent[0])
+                levels = [big, tuple(a[by_key] for a in recent)]
+        return lats, lngs
+
+def check_workers(workers: Optional[int]) -> None:
+    if workers != 1:
+        raise ValueError(f"NumpySyntheticDataSeeder runs in one process; got workers={workers!r}, use the classic seeder for more")
+
+def split_arrays(arrays: SeededArrays, size: int) -> Iterator[Tuple[int, SeededArrays]]:
+    # Runs of size partners with their points, as (first partner index, arrays). Partner indices
+    # stay global; each point keeps its draw order within its partner.
+    n = len(arrays.tenure)
+    order = np.argsort(arrays.partner, kind='stable')
+    bounds = np.searchsorted(arrays.partner[order], np.arange(0, n + size, size))
+    for k, first in enumerate(range(0, n, size)):
+        rows = order[bounds[k]:bounds[k + 1]]
+        point_cols = (col[rows] for col in arrays[:-1])
+        yield first, SeededArrays(*point_cols, tenure=arrays.tenure[first:first + size])
+
+def to_portfolio(arrays: SeededArrays, first: int = 0) -> PartnerPortfolio:
+    # Columnar store straight from the arrays, no per-point objects. The arrays may hold a run of
+    # partners from split_arrays, starting at partner index first.
+    n = len(arrays.tenure)
+    strings = StringTable()
+    order = np.lexsort((arrays.kind, arrays.partner))  # Stable: keeps each group's draw order
+    partner, kind = arrays.partner[order] - first, arrays.kind[order]
+    is_customer = kind <= INACTIVE_CUSTOMER
+    has_mobile = kind <= RECENT_LEAD
+    mobile = np.full(len(order), NO_STRING, dtype=np.int32)
+    mobile[has_mobile] = [strings.intern(f"+91{m:09d}") for m in arrays.mobile[order][has_mobile].tolist()]
+    address = np.full(len(order), NO_STRING, dtype=np.int32)
+    address[is_customer] = [
+        strings.intern(f"Partner {first + i} {'Active' if k == ACTIVE_CUSTOMER else 'Inactive'} Location")
+        for i, k in zip(partner[is_customer].tolist(), kind[is_customer].tolist())
+    ]
+    columns = {
+        'partner': partner.astype(np.int32),
+        'kind': kind.astype(np.int8),
+        'lat': arrays.lat[order],
+        'lng': arrays.lng[order],
+        'expiry_day': arrays.expiry_day[order].astype(np.int32),
+        'install_hrs': arrays.install_hrs[order].astype(np.int32),
+        'mobile': mobile,
+        'address': address,
+        'account_id': np.arange(first + 1, first + n + 1, dtype=np.int64),
+        'zone': np.array([strings.intern(f"Zone{i+1}") for i in range(first, first + n)], dtype=np.int32),
+        'tenure': arrays.tenure.astype(np.int32),
+    }
+    return PartnerPortfolio(columns, strings)
+
+def to_partners(arrays: SeededArrays, first: int = 0) -> List[Partner]:
+    # Materialize the models.py types, in the same shape SyntheticDataSeeder.seed returns
+    return to_portfolio(arrays, first).to_partners()
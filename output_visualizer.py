@@ -1,158 +1,180 @@
-from typing import List
-from math import radians, sin, cos, sqrt, atan2
-import matplotlib.pyplot as plt
-from matplotlib.patches import Circle
+from typing import Dict, List, Optional, Sequence, Tuple
+from math import ceil, sqrt
+import io
+import shutil
 import subprocess
 
+import numpy as np
+from matplotlib.axes import Axes
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.patches import Circle
+
 from models import Partner, Lead, Location
+from distance import haversine
+from spatial_index import GridIndex, CUSTOMER_KINDS, REFERENCE_KINDS, RECENT_LEAD
+
+PLOT_RADIUS_M = 1000  # Points further than this from the lead aren't plotted
+VIEW_M = 750  # Half-width of the plotted square
+
+Points = Tuple[np.ndarray, np.ndarray]  # (xs, ys) in meters east/north of the lead
 
 class OutputVisualizer:
-    def __init__(self, partners: List[Partner]) -> None:
+    # Plots the customers, recent leads and each partner's nearest point within 1000m of a lead.
+    # Everything renders on headless Agg figures: to_png gives the PNG bytes, visualize writes a
+    # file (and only opens a viewer if asked and one exists), render_panels puts many leads in
+    # one image. Layers with more than max_points points are drawn as a hexbin instead.
+    def __init__(self, partners: List[Partner], max_points: int = 20000, index: Optional[GridIndex] = None) -> None:
         self.partners = partners
+        self.max_points = max_points
+        self._index = index  # e.g. the BusinessFilter's or a snapshot's, so it isn't built twice
 
-    def haversine(self, loc1: Location, loc2: Location) -> float:
-        R = 6371000  # Earth radius in meters
-        lat1, lon1 = radians(loc1.lat), radians(loc1.lng)
-        lat2, lon2 = radians(loc2.lat), radians(loc2.lng)
-        dlat = lat2 - lat1
-        dlon = lon2 - lon1
-        a = sin(dlat / 2)**2 + cos(lat1) * cos(lat2) * sin(dlon / 2)**2
-        c = 2 * atan2(sqrt(a), sqrt(1 - a))
-        return R * c
-
-    def visualize(self, lead: Lead) -> None:
-        # Collect unique customer locations (active + inactive)
-        customer_locations = set()
-        for partner in self.partners:
-            for customer in partner.active_customers:
-                customer_locations.add(customer.location)
-            for customer in partner.inactive_but_geographically_relevant_customers:
-                customer_locations.add(customer.location)
-
-        # Collect unique recent lead locations
-        recent_lead_locations = set()
-        for partner in self.partners:
-            for l in partner.recent_leads_interested_in:
-                recent_lead_locations.add(l.location)
-
-        customer_locations = list(customer_locations)
-        recent_lead_locations = list(recent_lead_locations)
-
-        # Compute distances for customers
-        customer_dists = [self.haversine(lead.location, loc) for loc in customer_locations]
-        # Filter close customers (within 1000m)
-        close_customer_indices = [i for i, dist in enumerate(customer_dists) if dist <= 1000]
-        close_customers = [customer_locations[i] for i in close_customer_indices]
-        close_customer_dists = [customer_dists[i] for i in close_customer_indices]
-
-        # Compute distances for recent leads
-        recent_dists = [self.haversine(lead.location, loc) for loc in recent_lead_locations]
-        # Filter close recent leads (within 1000m)
-        close_recent_indices = [i for i, dist in enumerate(recent_dists) if dist <= 1000]
-        close_recent = [recent_lead_locations[i] for i in close_recent_indices]
-        close_recent_dists = [recent_dists[i] for i in close_recent_indices]
-
-        # Collect nearest location per partner within 1000m
-        nearest_locations = []
-        for partner in self.partners:
-            all_locs = (
-                [c.location for c in partner.active_customers] +
-                [c.location for c in partner.inactive_but_geographically_relevant_customers] +
-                [l.location for l in partner.recent_leads_interested_in]
-            )
-            if not all_locs:
-                continue
-            dists = [self.haversine(lead.location, loc) for loc in all_locs]
-            min_dist = min(dists)
-            if min_dist > 1000:
-                continue
-            min_index = dists.index(min_dist)
-            nearest_loc = all_locs[min_index]
-            nearest_locations.append(nearest_loc)
+    @property
+    def index(self) -> GridIndex:
+        # Built on first use; every plot after that is one radius query
+        if self._index is None:
+            self._index = GridIndex(self.partners)
+        return self._index
 
-        if not close_customer_indices and not close_recent_indices and not nearest_locations:
-            print("No locations within 1000m. Nothing to plot.")
-            return
+    def haversine(self, loc1: Location, loc2: Location) -> float:
+        return haversine(loc1, loc2)
+
+    def layers(self, lead: Lead) -> Optional[Dict[str, Points]]:
+        # Unique customer locations, unique recent lead locations and the nearest customer/recent
+        # lead of every partner, all within 1000m and projected around the lead. None if empty.
+        index = self.index
+        ids, dists = index.query(lead.location, PLOT_RADIUS_M, REFERENCE_KINDS)
+        if len(ids) == 0:
+            return None
+        kinds = index.kinds[ids]
+
+        # Nearest point per partner: sort by (partner, distance) and take each partner's first
+        order = np.lexsort((dists, index.owners[ids]))
+        owners = index.owners[ids[order]]
+        first = order[np.concatenate(([True], owners[1:] != owners[:-1]))]
 
         # Project to meters, with lead at (0,0)
-        ref_lat_rad = radians(lead.location.lat)
         deg_to_m_lat = 111000  # approx meters per degree lat
-        deg_to_m_lng = 111000 * cos(ref_lat_rad)  # meters per degree lng at this lat
-
-        # Project customers
-        customer_xs = []
-        customer_ys = []
-        for loc in close_customers:
-            delta_lat = loc.lat - lead.location.lat
-            delta_lng = loc.lng - lead.location.lng
-            x = delta_lng * deg_to_m_lng
-            y = delta_lat * deg_to_m_lat
-            customer_xs.append(x)
-            customer_ys.append(y)
-
-        # Project recent leads
-        recent_xs = []
-        recent_ys = []
-        for loc in close_recent:
-            delta_lat = loc.lat - lead.location.lat
-            delta_lng = loc.lng - lead.location.lng
-            x = delta_lng * deg_to_m_lng
-            y = delta_lat * deg_to_m_lat
-            recent_xs.append(x)
-            recent_ys.append(y)
-
-        # Project nearest partner locations
-        nearest_xs = []
-        nearest_ys = []
-        for loc in nearest_locations:
-            delta_lat = loc.lat - lead.location.lat
-            delta_lng = loc.lng - lead.location.lng
-            x = delta_lng * deg_to_m_lng
-            y = delta_lat * deg_to_m_lat
-            nearest_xs.append(x)
-            nearest_ys.append(y)
-
-        # Plot
-        fig, ax = plt.subplots()
-
-        # Plot customers in green
-        if customer_xs:
-            ax.scatter(customer_xs, customer_ys, c='green', alpha=0.6, s=20, label='Customers')
-
-        # Plot recent leads in blue
-        if recent_xs:
-            ax.scatter(recent_xs, recent_ys, c='blue', alpha=0.6, s=20, label='Recent Leads')
-
-        # Plot nearest partner locations in red
-        if nearest_xs:
-            ax.scatter(nearest_xs, nearest_ys, c='red', alpha=0.6, s=30, label='Nearest Partner Locs')
-
-        # Plot central lead in red star (keep it distinct)
+        deg_to_m_lng = 111000 * np.cos(np.radians(lead.location.lat))  # meters per degree lng at this lat
+
+        def project(point_ids: np.ndarray, unique: bool) -> Points:
+            coords = np.column_stack((index.lats[point_ids], index.lngs[point_ids]))
+            if unique:
+                coords = np.unique(coords, axis=0)
+            return ((coords[:, 1] - lead.location.lng) * deg_to_m_lng, (coords[:, 0] - lead.location.lat) * deg_to_m_lat)
+
+        return {
+            'customers': project(ids[np.isin(kinds, CUSTOMER_KINDS)], unique=True),
+            'recent': project(ids[kinds == RECENT_LEAD], unique=True),
+            'nearest': project(ids[first], unique=False),
+        }
+
+    def draw(self, ax: Axes, lead: Lead, title: Optional[str] = None, legend: bool = True) -> bool:
+        # Draw one lead's map on ax; False (and an empty, labelled panel) if nothing is in range
+        layers = self.layers(lead)
+        ax.set_aspect('equal')
+        ax.set_xlim(-VIEW_M, VIEW_M)
+        ax.set_ylim(-VIEW_M, VIEW_M)
+        if title is not None:
+            ax.set_title(title)
+        if layers is None:
+            ax.text(0, 0, f"Nothing within {PLOT_RADIUS_M}m", ha='center', va='center')
+            return False
+
+        for name, color, size, label in (
+            ('customers', 'green', 20, 'Customers'),
+            ('recent', 'blue', 20, 'Recent Leads'),
+            ('nearest', 'red', 30, 'Nearest Partner Locs'),
+        ):
+            xs, ys = layers[name]
+            if len(xs) == 0:
+                continue
+            if len(xs) > self.max_points:
+                # Level of detail: density instead of overplotting
+                ax.hexbin(xs, ys, gridsize=60, extent=(-VIEW_M, VIEW_M, -VIEW_M, VIEW_M),
+                          cmap='Greens' if color == 'green' else 'Blues' if color == 'blue' else 'Reds',
+                          mincnt=1, alpha=0.6, label=label)
+            else:
+                ax.scatter(xs, ys, c=color, alpha=0.6, s=size, label=label)
+
+        # Central lead in red star (keep it distinct)
         ax.scatter(0, 0, c='red', marker='*', s=200, label='New Lead')
 
-        # Add 500m circle
-        circle_500 = Circle((0, 0), 500, color='black', fill=False, linewidth=2)
-        ax.add_patch(circle_500)
-
-        # Add thin 200m circle
-        circle_200 = Circle((0, 0), 200, color='black', fill=False, linewidth=1, linestyle='--')
-        ax.add_patch(circle_200)
-
-        # Add thin 100m circle
-        circle_100 = Circle((0, 0), 100, color='black', fill=False, linewidth=1, linestyle='--')
-        ax.add_patch(circle_100)
-
+        # 500m circle, thin 200m and 100m circles
+        ax.add_patch(Circle((0, 0), 500, color='black', fill=False, linewidth=2))
+        ax.add_patch(Circle((0, 0), 200, color='black', fill=False, linewidth=1, linestyle='--'))
+        ax.add_patch(Circle((0, 0), 100, color='black', fill=False, linewidth=1, linestyle='--'))
+        if legend:
+            ax.legend()
+        return True
+
+    def figure(self, lead: Lead) -> Optional[Figure]:
+        fig = Figure()
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot()
         ax.set_xlabel('Meters East')
         ax.set_ylabel('Meters North')
-        ax.set_title('Map of Coordinates around Lead (customers green, recent leads blue, nearest partner locs red)')
-        ax.set_aspect('equal')
-        ax.set_xlim(-750, 750)
-        ax.set_ylim(-750, 750)
-        ax.legend()
-
-        # Save to PNG instead of showing, because non-interactive backends are trash
-        fig.savefig('lead_plot.png')
-        print("Plot saved to lead_plot.png. Opening it with xdg-open...")
-
-        # Open with xdg-open; if this fails, your env is broken—fix it
-        subprocess.call(['xdg-open', 'lead_plot.png'])
+        title = 'Map of Coordinates around Lead (customers green, recent leads blue, nearest partner locs red)'
+        return fig if self.draw(ax, lead, title) else None
+
+    def to_png(self, lead: Lead, dpi: int = 100) -> Optional[bytes]:
+        # PNG bytes of the lead's map, or None if nothing is within 1000m
+        fig = self.figure(lead)
+        if fig is None:
+            return None
+        buf = io.BytesIO()
+        fig.savefig(buf, format='png', dpi=dpi)
+        return buf.getvalue()
+
+    def visualize(self, lead: Lead, path: str = 'lead_plot.png', open_viewer: bool = False) -> Optional[str]:
+        # Writes the map to path. open_viewer launches xdg-open (when there is one) without waiting on it.
+        fig = self.figure(lead)
+        if fig is None:
+            print("No locations within 1000m. Nothing to plot.")
+            return None
+        fig.savefig(path)
+        print(f"Plot saved to {path}")
+        if open_viewer and shutil.which('xdg-open'):
+            subprocess.Popen(['xdg-open', path], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        return path
+
+    def render_panels(self, leads: Sequence[Lead], path: Optional[str] = None, cols: Optional[int] = None,
+                      panel_in: float = 3.0, dpi: int = 80) -> bytes:
+        # One image with a small map per lead, for QA over many leads. Returns the PNG bytes
+        # (and writes them to path if given).
+        cols = cols or max(1, ceil(sqrt(len(leads))))
+        rows = max(1, ceil(len(leads) / cols))
+        fig = Figure(figsize=(cols * panel_in, rows * panel_in + 0.5))
+        FigureCanvasAgg(fig)
+        axes = fig.subplots(rows, cols, squeeze=False)
+        legend_ax = None
+        for ax, lead in zip(axes.flat, leads):
+            title = lead.mobile or f"{lead.location.lat:.5f}, {lead.location.lng:.5f}"
+            if self.draw(ax, lead, title, legend=False) and legend_ax is None:
+                legend_ax = ax
+            ax.set_xticks([])
+            ax.set_yticks([])
+            ax.title.set_fontsize(8)
+        for ax in axes.flat[len(leads):]:
+            ax.set_axis_off()
+        if legend_ax is not None:
+            handles, labels = legend_ax.get_legend_handles_labels()
+            fig.legend(handles, labels, loc='upper center', ncol=len(labels))
+        fig.tight_layout(rect=(0, 0, 1, 1 - 0.5 / (rows * panel_in + 0.5)))
+
+        buf = io.BytesIO()
+        fig.savefig(buf, format='png', dpi=dpi)
+        if path is not None:
+            with open(path, 'wb') as f:
+                f.write(buf.getvalue())
+        return buf.getvalue()
+
+    def render_pages(self, leads: Sequence[Lead], path_pattern: str = 'lead_panels_{page:03d}.png',
+                     per_page: int = 100, **panel_args) -> List[str]:
+        # render_panels over pages of per_page leads; path_pattern gets the page number
+        paths = []
+        for page, start in enumerate(range(0, len(leads), per_page)):
+            path = path_pattern.format(page=page)
+            self.render_panels(leads[start:start + per_page], path, **panel_args)
+            paths.append(path)
+        return paths
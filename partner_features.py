@@ -0,0 +1,129 @@
+# ~/Apps/genie/partner_features.py
+from typing import Dict, NamedTuple, Sequence, Set
+
+import numpy as np
+
+from models import Location, Partner
+from partner_portfolio import LazyPartners, PartnerPortfolio
+from spatial_index import ACTIVE_CUSTOMER, INACTIVE_CUSTOMER, SPLITTER
+
+FEATURES = ('active', 'inactive_ratio', 'mean_install_hrs', 'median_install_hrs', 'tenure', 'splitter_density')
+
+class ScoreWeights(NamedTuple):
+    # Relative weights of each score term. The defaults are plain inverse distance, i.e. exactly
+    # MatchMakingModel.match's score; every term is in [0, 1] and the result is their weighted mean.
+    distance: float = 1.0
+    tenure: float = 0.0
+    install_speed: float = 0.0
+    active_ratio: float = 0.0
+    splitter_density: float = 0.0
+
+class PartnerFeatures:
+    # Per-partner aggregates for scoring, one float64 column per FEATURES name, indexed like the
+    # partner list: active customer count, share of customers that are inactive, mean/median
+    # installation_speed_in_hrs over all customers, tenure, and splitters per customer.
+    # Takes the same point deltas as a PointTable, so attach it to the PortfolioUpdater; a
+    # changed partner is only marked stale and recomputed from its lists on the next read.
+    def __init__(self, partners: Sequence[Partner]) -> None:
+        self.partners = partners
+        self.columns: Dict[str, np.ndarray] = {name: np.zeros(len(partners)) for name in FEATURES}
+        self._stale: Set[int] = set(range(len(partners)))
+        self.refresh()
+
+    @classmethod
+    def from_portfolio(cls, portfolio: PartnerPortfolio, partners: Sequence[Partner]) -> "PartnerFeatures":
+        # All columns straight from the portfolio's columns, no partner objects touched.
+        # partners must be the portfolio's own (e.g. portfolio.lazy_partners()).
+        n = len(portfolio)
+        starts = portfolio.group_start[:-1].reshape(n, -1)
+        ends = portfolio.group_start[1:].reshape(n, -1)
+        counts = (ends - starts).astype(np.float64)
+        active, inactive, splitters = counts[:, ACTIVE_CUSTOMER], counts[:, INACTIVE_CUSTOMER], counts[:, SPLITTER]
+        customers = active + inactive
+
+        # Customers of a partner are its kind 0 and 1 groups, which are adjacent rows
+        is_customer = np.isin(portfolio.kind, (ACTIVE_CUSTOMER, INACTIVE_CUSTOMER))
+        owner = portfolio.partner[is_customer].astype(np.int64)
+        hrs = portfolio.install_hrs[is_customer].astype(np.float64)
+        total = np.bincount(owner, weights=hrs, minlength=n)
+
+        # Median per partner: sort install hours within each partner and average the middle pair
+        order = np.lexsort((hrs, owner))
+        hrs = hrs[order]
+        first = np.concatenate(([0], np.cumsum(customers))).astype(np.int64)[:-1]
+        size = customers.astype(np.int64)
+        has = size > 0
+        lo = first[has] + (size[has] - 1) // 2
+        hi = first[has] + size[has] // 2
+        median = np.zeros(n)
+        median[has] = (hrs[lo] + hrs[hi]) / 2
+
+        store = cls.__new__(cls)
+        store.partners = partners
+        store._stale = set()
+        with np.errstate(invalid='ignore', divide='ignore'):
+            store.columns = {
+                'active': active,
+                'inactive_ratio': np.where(has, inactive / customers, 0.0),
+                'mean_install_hrs': np.where(has, total / customers, 0.0),
+                'median_install_hrs': median,
+                'tenure': portfolio.tenure.astype(np.float64),
+                'splitter_density': np.where(has, splitters / customers, 0.0),
+            }
+        return store
+
+    @classmethod
+    def from_partners(cls, partners: Sequence[Partner]) -> "PartnerFeatures":
+        # From the portfolio columns when partners is a snapshot's LazyPartners (nothing gets
+        # built), else from the partner objects
+        if isinstance(partners, LazyPartners):
+            return cls.from_portfolio(partners.portfolio, partners)
+        return cls(partners)
+
+    def refresh(self) -> Dict[str, np.ndarray]:
+        # Recompute stale partners; returns the (now current) columns
+        for i in self._stale:
+            partner = self.partners[i]
+            active = len(partner.active_customers)
+            inactive = len(partner.inactive_but_geographically_relevant_customers)
+            hrs = [c.installation_speed_in_hrs for c in partner.active_customers]
+            hrs += [c.installation_speed_in_hrs for c in partner.inactive_but_geographically_relevant_customers]
+            customers = active + inactive
+            self.columns['active'][i] = active
+            self.columns['inactive_ratio'][i] = inactive / customers if customers else 0.0
+            self.columns['mean_install_hrs'][i] = np.mean(hrs) if hrs else 0.0
+            self.columns['median_install_hrs'][i] = np.median(hrs) if hrs else 0.0
+            self.columns['tenure'][i] = partner.tenure
+            self.columns['splitter_density'][i] = len(partner.splitters) / customers if customers else 0.0
+        self._stale.clear()
+        return self.columns
+
+    def invalidate(self, partner_idx: int) -> None:
+        self._stale.add(partner_idx)
+
+    # Point deltas, same signatures as PointTable so PortfolioUpdater can drive this
+    def add_point(self, partner_idx: int, kind: int, loc: Location) -> None:
+        self._stale.add(partner_idx)
+
+    def remove_point(self, partner_idx: int, kind: int, loc: Location) -> None:
+        self._stale.add(partner_idx)
+
+    def change_kind(self, partner_idx: int, old_kind: int, new_kind: int, loc: Location) -> None:
+        self._stale.add(partner_idx)
+
+def score(dists: np.ndarray, partner_idx: np.ndarray, features: PartnerFeatures,
+          weights: ScoreWeights = ScoreWeights()) -> np.ndarray:
+    # Scores for a whole candidate set at once: dists[j] is the scoring distance of partner
+    # partner_idx[j] (as in MatchMakingModel.match). Feature terms are squashed into [0, 1].
+    cols = features.refresh()
+    terms = (
+        (weights.distance, 1 / (1 + dists / 500)),
+        (weights.tenure, cols['tenure'][partner_idx] / (cols['tenure'][partner_idx] + 3)),
+        (weights.install_speed, 1 / (1 + cols['median_install_hrs'][partner_idx] / 48)),
+        (weights.active_ratio, 1 - cols['inactive_ratio'][partner_idx]),
+        (weights.splitter_density, cols['splitter_density'][partner_idx] / (1 + cols['splitter_density'][partner_idx])),
+    )
+    total = sum(w for w, _ in terms if w)
+    if not total:
+        return np.zeros(len(dists))
+    return sum(w * term for w, term in terms if w) / total
@@ -0,0 +1,257 @@
+# ~/Apps/genie/partner_portfolio.py
+from typing import Dict, List, MutableMapping, Optional, Sequence, Tuple
+from datetime import date
+
+import numpy as np
+
+from models import Location, Lead, Customer, Partner
+from spatial_index import GridIndex, Cell, ACTIVE_CUSTOMER, RECENT_LEAD, SPLITTER, ALL_KINDS, point_groups
+
+NO_STRING = -1  # String id for "no value" (e.g. a splitter's mobile)
+
+class StringTable:
+    # Interned strings: every distinct string is stored once and referenced by an int32 id.
+    # encode() packs the table into a utf-8 blob plus offsets, so it can sit in flat arrays
+    # next to the other columns.
+    def __init__(self, strings: Sequence[str] = ()) -> None:
+        self.strings: List[str] = []
+        self.ids: Dict[str, int] = {}
+        for s in strings:
+            self.intern(s)
+
+    def intern(self, s: str) -> int:
+        i = self.ids.get(s)
+        if i is None:
+            i = self.ids[s] = len(self.strings)
+            self.strings.append(s)
+        return i
+
+    def __getitem__(self, i: int) -> str:
+        return self.strings[i]
+
+    def __len__(self) -> int:
+        return len(self.strings)
+
+    def encode(self) -> Tuple[np.ndarray, np.ndarray]:
+        # (offsets, blob): string i is blob[offsets[i]:offsets[i+1]]
+        encoded = [s.encode() for s in self.strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(b) for b in encoded], out=offsets[1:])
+        return offsets, np.frombuffer(b''.join(encoded), dtype=np.uint8)
+
+    @classmethod
+    def decode(cls, offsets: np.ndarray, blob: np.ndarray) -> "StringTable":
+        data = blob.tobytes()
+        bounds = offsets.tolist()
+        return cls([data[a:b].decode() for a, b in zip(bounds[:-1], bounds[1:])])
+
+class PackedStrings(StringTable):
+    # A StringTable still in its encoded (offsets, blob) form, e.g. mapped from a snapshot.
+    # Strings are decoded one at a time as they're read; the first intern() unpacks it all.
+    def __init__(self, offsets: np.ndarray, blob: np.ndarray) -> None:
+        super().__init__()
+        self.offsets = offsets
+        self.blob = blob
+        self._view = memoryview(blob)
+        self._packed = True
+
+    def _unpack(self) -> None:
+        if self._packed:
+            self.strings = StringTable.decode(self.offsets, self.blob).strings
+            self.ids = {s: i for i, s in enumerate(self.strings)}
+            self._packed = False
+
+    def intern(self, s: str) -> int:
+        self._unpack()
+        return super().intern(s)
+
+    def __getitem__(self, i: int) -> str:
+        if not self._packed:
+            return self.strings[i]
+        return str(self._view[self.offsets[i]:self.offsets[i + 1]], 'utf-8')
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1 if self._packed else len(self.strings)
+
+    def encode(self) -> Tuple[np.ndarray, np.ndarray]:
+        return (self.offsets, self.blob) if self._packed else super().encode()
+
+class PartnerPortfolio:
+    # Columnar copy of a partner list: one row per point (customers, recent leads, splitters),
+    # ordered by partner and then by kind, plus per-partner columns. Strings (mobiles, addresses,
+    # zones) are ids into one StringTable. Converts to and from the models.py types losslessly.
+    #
+    # Point columns: partner (int32), kind (int8), lat/lng (float64), expiry_day (int32 date
+    # ordinal), install_hrs (int32), mobile/address (int32 string ids). Columns that don't apply
+    # to a kind hold 0 / NO_STRING.
+    # Partner columns: account_id (int64), zone (int32 string id), tenure (int32).
+    # Kind k of partner i is rows group_start[i*4+k]:group_start[i*4+k+1].
+    POINT_COLUMNS = ('partner', 'kind', 'lat', 'lng', 'expiry_day', 'install_hrs', 'mobile', 'address')
+    PARTNER_COLUMNS = ('account_id', 'zone', 'tenure')
+
+    def __init__(self, columns: Dict[str, np.ndarray], strings: StringTable,
+                 group_start: Optional[np.ndarray] = None) -> None:
+        self.partner = columns['partner']
+        self.kind = columns['kind']
+        self.lat = columns['lat']
+        self.lng = columns['lng']
+        self.expiry_day = columns['expiry_day']
+        self.install_hrs = columns['install_hrs']
+        self.mobile = columns['mobile']
+        self.address = columns['address']
+        self.account_id = columns['account_id']
+        self.zone = columns['zone']
+        self.tenure = columns['tenure']
+        self.strings = strings
+
+        if group_start is None:
+            key = self.partner.astype(np.int64) * len(ALL_KINDS) + self.kind
+            if len(key) and (np.diff(key) < 0).any():
+                raise ValueError("Portfolio points must be ordered by partner and then by kind")
+            counts = np.bincount(key, minlength=len(self.account_id) * len(ALL_KINDS))
+            group_start = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        self.group_start = group_start
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        return {name: getattr(self, name) for name in self.POINT_COLUMNS + self.PARTNER_COLUMNS}
+
+    def __len__(self) -> int:
+        return len(self.account_id)
+
+    @property
+    def num_points(self) -> int:
+        return len(self.lat)
+
+    @property
+    def nbytes(self) -> int:
+        offsets, blob = self.strings.encode()
+        return sum(col.nbytes for col in self.columns().values()) + self.group_start.nbytes + offsets.nbytes + blob.nbytes
+
+    def rows(self, partner_idx: int, kind: int) -> slice:
+        g = partner_idx * len(ALL_KINDS) + kind
+        return slice(int(self.group_start[g]), int(self.group_start[g + 1]))
+
+    def locations(self, partner_idx: int, kind: int) -> List[Location]:
+        rows = self.rows(partner_idx, kind)
+        return [Location(lat, lng) for lat, lng in zip(self.lat[rows].tolist(), self.lng[rows].tolist())]
+
+    @classmethod
+    def from_partners(cls, partners: List[Partner]) -> "PartnerPortfolio":
+        strings = StringTable()
+        point_cols: Dict[str, list] = {name: [] for name in cls.POINT_COLUMNS}
+        for i, partner in enumerate(partners):
+            for kind, locs in point_groups(partner):
+                point_cols['partner'].extend([i] * len(locs))
+                point_cols['kind'].extend([kind] * len(locs))
+                point_cols['lat'].extend(loc.lat for loc in locs)
+                point_cols['lng'].extend(loc.lng for loc in locs)
+            customers = partner.active_customers + partner.inactive_but_geographically_relevant_customers
+            point_cols['expiry_day'].extend(c.plan_expiry_dt.toordinal() for c in customers)
+            point_cols['install_hrs'].extend(c.installation_speed_in_hrs for c in customers)
+            point_cols['mobile'].extend(strings.intern(c.mobile) for c in customers)
+            point_cols['address'].extend(strings.intern(c.address) for c in customers)
+            leads = partner.recent_leads_interested_in
+            point_cols['expiry_day'].extend([0] * len(leads))
+            point_cols['install_hrs'].extend([0] * len(leads))
+            point_cols['mobile'].extend(strings.intern(l.mobile) for l in leads)
+            point_cols['address'].extend([NO_STRING] * len(leads))
+            for name, fill in (('expiry_day', 0), ('install_hrs', 0), ('mobile', NO_STRING), ('address', NO_STRING)):
+                point_cols[name].extend([fill] * len(partner.splitters))
+
+        dtypes = {'partner': np.int32, 'kind': np.int8, 'lat': np.float64, 'lng': np.float64,
+                  'expiry_day': np.int32, 'install_hrs': np.int32, 'mobile': np.int32, 'address': np.int32}
+        columns = {name: np.array(values, dtype=dtypes[name]) for name, values in point_cols.items()}
+        columns['account_id'] = np.array([p.long_lco_account_id for p in partners], dtype=np.int64)
+        columns['zone'] = np.array([strings.intern(p.zone) for p in partners], dtype=np.int32)
+        columns['tenure'] = np.array([p.tenure for p in partners], dtype=np.int32)
+        return cls(columns, strings)
+
+    def to_partners(self) -> List[Partner]:
+        return self._build(range(len(self)), slice(0, self.num_points))
+
+    def build_partner(self, partner_idx: int) -> Partner:
+        # Materialize a single partner from its rows
+        start, end = self.group_start[partner_idx * len(ALL_KINDS)], self.group_start[(partner_idx + 1) * len(ALL_KINDS)]
+        return self._build([partner_idx], slice(int(start), int(end)))[0]
+
+    def _build(self, partner_idx: Sequence[int], rows: slice) -> List[Partner]:
+        # Partner objects for partner_idx, filled from rows (which must hold exactly their points)
+        strings = self.strings
+        partners = [
+            Partner(
+                long_lco_account_id=int(self.account_id[i]),
+                zone=strings[int(self.zone[i])],
+                active_customers=[],
+                inactive_but_geographically_relevant_customers=[],
+                recent_leads_interested_in=[],
+                splitters=[],
+                tenure=int(self.tenure[i]),
+            )
+            for i in partner_idx
+        ]
+        first = partner_idx[0] if len(partner_idx) else 0
+        days: Dict[int, date] = {}
+        for i, kind, lat, lng, day, hrs, mobile, address in zip(
+            self.partner[rows].tolist(), self.kind[rows].tolist(), self.lat[rows].tolist(), self.lng[rows].tolist(),
+            self.expiry_day[rows].tolist(), self.install_hrs[rows].tolist(), self.mobile[rows].tolist(), self.address[rows].tolist(),
+        ):
+            loc = Location(lat=lat, lng=lng)
+            partner = partners[i - first]
+            if kind == SPLITTER:
+                partner.splitters.append(loc)
+            elif kind == RECENT_LEAD:
+                partner.recent_leads_interested_in.append(Lead(mobile=strings[mobile], location=loc))
+            else:
+                if day not in days:
+                    days[day] = date.fromordinal(day)
+                customer = Customer(
+                    mobile=strings[mobile],
+                    address=strings[address],
+                    plan_expiry_dt=days[day],
+                    location=loc,
+                    installation_speed_in_hrs=hrs,
+                )
+                if kind == ACTIVE_CUSTOMER:
+                    partner.active_customers.append(customer)
+                else:
+                    partner.inactive_but_geographically_relevant_customers.append(customer)
+        return partners
+
+    def lazy_partners(self) -> "LazyPartners":
+        return LazyPartners(self)
+
+    def grid_index(self, partners: Optional[Sequence[Partner]] = None, cell_size_m: float = 250.0,
+                   cells: Optional[MutableMapping[Cell, np.ndarray]] = None) -> GridIndex:
+        # GridIndex straight over the portfolio columns (same point ids as GridIndex(to_partners()))
+        if partners is None:
+            partners = self.lazy_partners()
+        return GridIndex.from_columns(partners, self.lat, self.lng, self.partner, self.kind, cell_size_m, cells)
+
+def account_ids(partners: Sequence[Partner]) -> np.ndarray:
+    # long_lco_account_id per partner; read off the columns for a LazyPartners, so nothing gets built
+    if isinstance(partners, LazyPartners):
+        return partners.portfolio.account_id.astype(np.int64)
+    return np.array([p.long_lco_account_id for p in partners], dtype=np.int64)
+
+class LazyPartners(Sequence):
+    # Partner list view over a portfolio: each Partner is only built the first time it's indexed,
+    # then kept, so the same index always gives the same object. position (object id -> index)
+    # fills in as partners are built; PointTable picks it up instead of walking the list.
+    def __init__(self, portfolio: PartnerPortfolio) -> None:
+        self.portfolio = portfolio
+        self._built: Dict[int, Partner] = {}
+        self.position: Dict[int, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.portfolio)
+
+    def __getitem__(self, i: int) -> Partner:
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError(i)
+        partner = self._built.get(i)
+        if partner is None:
+            partner = self._built[i] = self.portfolio.build_partner(i)
+            self.position[id(partner)] = i
+        return partner
@@ -0,0 +1,119 @@
+# ~/Apps/genie/portfolio_updates.py
+from typing import Dict, List, Tuple
+from datetime import date
+import heapq
+
+from models import Location, Lead, Customer, Partner
+from spatial_index import PointTable, ACTIVE_CUSTOMER, INACTIVE_CUSTOMER, RECENT_LEAD, SPLITTER
+
+class PortfolioUpdater:
+    # Applies portfolio changes in place: the partner lists stay the source of truth and every
+    # attached PointTable/GridIndex (e.g. BusinessFilter.index) gets the matching point delta,
+    # so nothing has to be rebuilt. Customers are keyed by (partner index, mobile).
+    # List removals swap the last element into the hole, so list order isn't preserved
+    # (nothing downstream depends on it).
+    def __init__(self, partners: List[Partner], *tables: PointTable) -> None:
+        self.partners = partners
+        self.tables: List[PointTable] = list(tables)
+        self.version = 0  # Bumped on every change; caches key on it
+
+        # (partner index, mobile) -> (kind, position in that partner's customer list)
+        self._slots: Dict[Tuple[int, str], Tuple[int, int]] = {}
+        # Active customers by expiry date; stale entries are skipped when popped
+        self._expiries: List[Tuple[date, int, str]] = []
+        for i, partner in enumerate(partners):
+            for kind, customers in ((ACTIVE_CUSTOMER, partner.active_customers),
+                                    (INACTIVE_CUSTOMER, partner.inactive_but_geographically_relevant_customers)):
+                for pos, c in enumerate(customers):
+                    # A second slot for the same key would strand the first customer's points
+                    if (i, c.mobile) in self._slots:
+                        raise ValueError(f"Partner index {i} has customer {c.mobile} more than once")
+                    self._slots[(i, c.mobile)] = (kind, pos)
+                    if kind == ACTIVE_CUSTOMER:
+                        self._expiries.append((c.plan_expiry_dt, i, c.mobile))
+        heapq.heapify(self._expiries)
+
+    def attach(self, table: PointTable) -> None:
+        # The table must have been built from this same partner list, before any updates
+        self.tables.append(table)
+
+    def customer_list(self, partner_idx: int, kind: int) -> List[Customer]:
+        partner = self.partners[partner_idx]
+        if kind == ACTIVE_CUSTOMER:
+            return partner.active_customers
+        return partner.inactive_but_geographically_relevant_customers
+
+    def get_customer(self, partner_idx: int, mobile: str) -> Customer:
+        kind, pos = self._slots[(partner_idx, mobile)]
+        return self.customer_list(partner_idx, kind)[pos]
+
+    def add_customer(self, partner_idx: int, customer: Customer, active: bool = True) -> None:
+        if (partner_idx, customer.mobile) in self._slots:
+            raise ValueError(f"Partner index {partner_idx} already has customer {customer.mobile}")
+        kind = ACTIVE_CUSTOMER if active else INACTIVE_CUSTOMER
+        customers = self.customer_list(partner_idx, kind)
+        self._slots[(partner_idx, customer.mobile)] = (kind, len(customers))
+        customers.append(customer)
+        if active:
+            heapq.heappush(self._expiries, (customer.plan_expiry_dt, partner_idx, customer.mobile))
+        for table in self.tables:
+            table.add_point(partner_idx, kind, customer.location)
+        self.version += 1
+
+    def remove_customer(self, partner_idx: int, mobile: str) -> Customer:
+        kind, _ = self._slots[(partner_idx, mobile)]
+        customer = self._detach(partner_idx, mobile)
+        for table in self.tables:
+            table.remove_point(partner_idx, kind, customer.location)
+        self.version += 1
+        return customer
+
+    def mark_expired(self, partner_idx: int, mobile: str) -> Customer:
+        # Active -> inactive_but_geographically_relevant; the point stays put, only its kind changes
+        kind, _ = self._slots[(partner_idx, mobile)]
+        if kind != ACTIVE_CUSTOMER:
+            raise ValueError(f"Customer {mobile} of partner index {partner_idx} is not active")
+        customer = self._detach(partner_idx, mobile)
+        inactive = self.customer_list(partner_idx, INACTIVE_CUSTOMER)
+        self._slots[(partner_idx, mobile)] = (INACTIVE_CUSTOMER, len(inactive))
+        inactive.append(customer)
+        for table in self.tables:
+            table.change_kind(partner_idx, ACTIVE_CUSTOMER, INACTIVE_CUSTOMER, customer.location)
+        self.version += 1
+        return customer
+
+    def expire_customers(self, today: date) -> List[Tuple[int, Customer]]:
+        # Expire every active customer whose plan_expiry_dt is before today, O(log n) each
+        expired = []
+        while self._expiries and self._expiries[0][0] < today:
+            expiry, partner_idx, mobile = heapq.heappop(self._expiries)
+            slot = self._slots.get((partner_idx, mobile))
+            if slot is None or slot[0] != ACTIVE_CUSTOMER:
+                continue  # Removed or already expired since it was pushed
+            if self.get_customer(partner_idx, mobile).plan_expiry_dt != expiry:
+                continue  # Re-added with a different plan; its own entry is still queued
+            expired.append((partner_idx, self.mark_expired(partner_idx, mobile)))
+        return expired
+
+    def add_recent_lead(self, partner_idx: int, lead: Lead) -> None:
+        self.partners[partner_idx].recent_leads_interested_in.append(lead)
+        for table in self.tables:
+            table.add_point(partner_idx, RECENT_LEAD, lead.location)
+        self.version += 1
+
+    def add_splitter(self, partner_idx: int, loc: Location) -> None:
+        self.partners[partner_idx].splitters.append(loc)
+        for table in self.tables:
+            table.add_point(partner_idx, SPLITTER, loc)
+        self.version += 1
+
+    def _detach(self, partner_idx: int, mobile: str) -> Customer:
+        # O(1) removal from the partner's list: move the last customer into the hole
+        kind, pos = self._slots.pop((partner_idx, mobile))
+        customers = self.customer_list(partner_idx, kind)
+        customer = customers[pos]
+        last = customers.pop()
+        if pos < len(customers):
+            customers[pos] = last
+            self._slots[(partner_idx, last.mobile)] = (kind, pos)
+        return customer
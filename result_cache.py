@@ -0,0 +1,157 @@
+# ~/Apps/genie/result_cache.py
+from typing import List, Optional, Tuple
+from collections import OrderedDict
+from math import degrees, floor, sqrt
+import time
+
+import numpy as np
+
+from models import Location, Lead, Partner
+from distance import EARTH_RADIUS_M
+from business_filter import BusinessFilter
+from matchmaking_model import MatchMakingModel
+from distance_profile import DistanceProfile, PROFILE_RADIUS_M
+from partner_features import PartnerFeatures
+from partner_portfolio import account_ids
+from competition import MAX_PARTNERS_200M, MIN_PARTNERS_100M
+from portfolio_updates import PortfolioUpdater
+from spatial_index import Cell, CUSTOMER_KINDS, REFERENCE_KINDS
+
+Result = Tuple[List[Partner], List[Tuple[Partner, float]]]
+
+class ResultCache:
+    # Caches notified_partners per lat/lng grid cell (cell_size_m) and portfolio version.
+    # A cell is only cached when its notified list is provably the same for every lead inside
+    # it: a partner's nearest distance moves by at most h (the cell's half-diagonal) across the
+    # cell, so the list computed at the cell centre holds everywhere unless some partner is within
+    # h of a 100/200/500m threshold (or of the next pick in the high-competition top-up). Such
+    # cells are remembered as unstable and their leads always get the exact computation.
+    # Scores depend on the exact lead position, so match() re-scores the (few) notified partners
+    # per lead in one vectorized pass; results are exactly notified_partners +
+    # MatchMakingModel(notified).match.
+    #
+    # Eviction is LRU, bounded by max_entries and an approximate max_bytes, plus an optional TTL.
+    # With an updater, any portfolio change (updater.version) drops every entry.
+    def __init__(self, business_filter: BusinessFilter, cell_size_m: float = 10.0, max_entries: int = 100_000,
+                 max_bytes: int = 64 << 20, ttl_s: Optional[float] = None,
+                 updater: Optional[PortfolioUpdater] = None) -> None:
+        self.business_filter = business_filter
+        self.cell_size_m = cell_size_m
+        self.cell_deg = degrees(cell_size_m / EARTH_RADIUS_M)
+        self.half_diag_m = cell_size_m * sqrt(2) / 2 * (1 + 1e-6) + 1e-3  # Over-estimate, cos(lat) <= 1
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self.updater = updater
+        # cell -> (notified partner indices, or None if the cell is unstable; expiry; size estimate)
+        self.entries: "OrderedDict[Cell, Tuple[Optional[Tuple[int, ...]], float, int]]" = OrderedDict()
+        self.nbytes = 0
+        self.version = updater.version if updater is not None else 0
+        # match_scored with default weights is match()'s score; the features just have to exist
+        self.features = PartnerFeatures.from_partners(business_filter.index.partners)
+        self.account_ids = account_ids(business_filter.index.partners)
+        if updater is not None:
+            updater.attach(self.features)
+        self.stats = {'hits': 0, 'misses': 0, 'unstable': 0, 'evicted_lru': 0, 'evicted_ttl': 0,
+                      'evicted_bytes': 0, 'invalidations': 0}
+
+    def hit_rate(self) -> float:
+        lookups = self.stats['hits'] + self.stats['misses'] + self.stats['unstable']
+        return self.stats['hits'] / lookups if lookups else 0.0
+
+    def cell_of(self, loc: Location) -> Cell:
+        return (floor(loc.lat / self.cell_deg), floor(loc.lng / self.cell_deg))
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.nbytes = 0
+
+    def match(self, lead: Lead) -> Result:
+        notified = self.notified_partners(lead)
+        model = MatchMakingModel(notified, self.business_filter.index, self.features)
+        return notified, model.match_scored(lead)
+
+    def notified_partners(self, lead: Lead) -> List[Partner]:
+        if self.updater is not None and self.updater.version != self.version:
+            self.version = self.updater.version
+            self.stats['invalidations'] += 1
+            self.clear()
+
+        cell = self.cell_of(lead.location)
+        now = time.monotonic()
+        entry = self.entries.get(cell)
+        if entry is not None and entry[1] < now:
+            self._drop(cell)
+            self.stats['evicted_ttl'] += 1
+            entry = None
+        if entry is None:
+            self.stats['misses'] += 1
+            notified_idx = self._stable_notified(cell)
+            size = 96 + 8 * len(notified_idx or ())  # Rough footprint of key, tuple and bookkeeping
+            self.entries[cell] = (notified_idx, now + self.ttl_s if self.ttl_s is not None else float('inf'), size)
+            self.nbytes += size
+            self._evict()
+        else:
+            self.entries.move_to_end(cell)
+            notified_idx = entry[0]
+            if notified_idx is None:
+                self.stats['unstable'] += 1
+            else:
+                self.stats['hits'] += 1
+
+        if notified_idx is None:
+            return self.business_filter.select(self.business_filter.distance_profile(lead))[0]
+        partners = self.business_filter.partners
+        return [partners[i] for i in notified_idx]
+
+    def _drop(self, cell: Cell) -> None:
+        self.nbytes -= self.entries.pop(cell)[2]
+
+    def _evict(self) -> None:
+        while len(self.entries) > self.max_entries:
+            self._drop(next(iter(self.entries)))
+            self.stats['evicted_lru'] += 1
+        while self.nbytes > self.max_bytes and len(self.entries) > 1:
+            self._drop(next(iter(self.entries)))
+            self.stats['evicted_bytes'] += 1
+
+    def _stable_notified(self, cell: Cell) -> Optional[Tuple[int, ...]]:
+        # The cell centre's notified partner indices if they hold for the whole cell, else None
+        bf = self.business_filter
+        h = self.half_diag_m
+        centre = Lead(mobile='', location=Location((cell[0] + 0.5) * self.cell_deg, (cell[1] + 0.5) * self.cell_deg))
+        profile = DistanceProfile.from_index(bf.index, centre, PROFILE_RADIUS_M + h)
+        notified, high_comp = bf.select(profile)
+
+        ref = profile.nearest[:, list(REFERENCE_KINDS)].min(axis=1)
+        cust = profile.nearest[:, list(CUSTOMER_KINDS)].min(axis=1)
+
+        def straddles(d: np.ndarray, threshold: float) -> bool:
+            # Some partner is within threshold for part of the cell and beyond it for the rest
+            return bool(np.any((d - h <= threshold) & (d + h > threshold)))
+
+        if straddles(ref, 500):
+            return None
+        # The competition decision only has to hold, not the counts behind it: count partners
+        # surely in range (d + h) and possibly in range (d - h)
+        accounts = self.account_ids[profile.partner_idx]
+        sure_200 = len(set(accounts[cust + h <= 200].tolist())) > MAX_PARTNERS_200M
+        maybe_200 = len(set(accounts[cust - h <= 200].tolist())) > MAX_PARTNERS_200M
+        sure_100 = int(np.sum(ref + h <= 100)) >= MIN_PARTNERS_100M
+        maybe_100 = int(np.sum(ref - h <= 100)) >= MIN_PARTNERS_100M
+        if (sure_200 or sure_100) != (maybe_200 or maybe_100):
+            return None
+        if high_comp:
+            if straddles(ref, 200):
+                return None
+            # The top-up picks the nearest partners past 200m: the picks and their order must
+            # not be able to swap anywhere in the cell
+            within_200 = int(np.sum(ref <= 200))
+            rest = np.sort(ref[(ref > 200) & (ref <= 500)])
+            picks = min(10 - within_200, bf.x, len(rest)) if within_200 < 10 else 0
+            gaps = np.diff(rest[:picks + 1])
+            if np.any(gaps <= 2 * h):
+                return None
+
+        position = bf.index.position
+        return tuple(position[id(p)] for p in notified)
@@ -0,0 +1,183 @@
+# ~/Apps/genie/scenario_sweep.py
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import csv
+import itertools
+import json
+import os
+import time
+
+import numpy as np
+
+from models import Location, Lead
+from synthetic_data_seeder import SyntheticDataSeeder
+from numpy_seeder import NumpySyntheticDataSeeder
+from business_filter import BusinessFilter
+from matchmaking_model import MatchMakingModel
+
+CENTER = Location(lat=28.65, lng=77.275)
+# Seeder constructor arguments; every other grid key is one of the seeder's knobs (attributes)
+CONSTRUCTOR_KEYS = ('center_lat', 'center_lng', 'radius')
+CAP = 10  # High-competition notified lists stop topping up at 10 partners
+
+def expand_grid(grid: Dict[str, Sequence[Any]]) -> List[Dict[str, Any]]:
+    # Every combination of the grid's values, in a stable order
+    names = list(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+def make_seeder(params: Dict[str, Any], engine: str, seed: int) -> SyntheticDataSeeder:
+    args = {'center_lat': CENTER.lat, 'center_lng': CENTER.lng}
+    args.update({k: v for k, v in params.items() if k in CONSTRUCTOR_KEYS})
+    engine_cls = NumpySyntheticDataSeeder if engine == 'numpy' else SyntheticDataSeeder
+    seeder = engine_cls(**args, seed=seed)
+    for knob, value in params.items():
+        if knob in CONSTRUCTOR_KEYS:
+            continue
+        if not hasattr(seeder, knob):
+            raise ValueError(f"Unknown seeder knob {knob!r}")
+        setattr(seeder, knob, value)
+    return seeder
+
+def make_leads(center: Location, sigma_m: float, num_leads: int, seed: int) -> List[Lead]:
+    # Gaussian scatter around the seeding center, from its own RNG
+    rng = np.random.default_rng(seed)
+    offsets = rng.normal(0, sigma_m / 111000, (num_leads, 2))
+    return [Lead(mobile=f"+91{i:09d}", location=Location(lat=center.lat + dlat, lng=center.lng + dlng))
+            for i, (dlat, dlng) in enumerate(offsets.tolist())]
+
+def run_scenario(job: Tuple[int, Dict[str, Any], int, float, str, int]) -> Dict[str, Any]:
+    # seed -> filter -> match for one parameter set; returns one table row
+    scenario_id, params, num_leads, lead_sigma_frac, engine, seed = job
+    started = time.perf_counter()
+    seeder = make_seeder(params, engine, seed)
+    try:
+        partners = seeder.seed()
+    except ValueError as e:
+        return {'scenario': scenario_id, **params, 'error': str(e)}
+    seed_s = time.perf_counter() - started
+
+    center = Location(seeder.center_lat, seeder.center_lng)
+    leads = make_leads(center, seeder.radius * lead_sigma_frac, num_leads, seed + scenario_id)
+    business_filter = BusinessFilter(partners)
+    sizes, high, eligible, capped, top_scores = [], 0, 0, 0, []
+    for lead in leads:
+        profile = business_filter.distance_profile(lead)
+        notified, high_comp = business_filter.select(profile)
+        matches = MatchMakingModel(notified).match(lead, profile)
+        sizes.append(len(notified))
+        if high_comp is not None:
+            eligible += 1
+        if high_comp:
+            high += 1
+            capped += len(notified) >= CAP
+        if matches:
+            top_scores.append(matches[0][1])
+    sizes_arr = np.array(sizes)
+    return {
+        'scenario': scenario_id,
+        **params,
+        'partners': len(partners),
+        'leads': num_leads,
+        'eligible_frac': eligible / num_leads,
+        'high_comp_frac': high / num_leads,
+        'cap_hit_rate': capped / high if high else 0.0,  # Share of high-competition leads at the cap
+        'notified_mean': float(sizes_arr.mean()),
+        'notified_p50': float(np.percentile(sizes_arr, 50)),
+        'notified_p90': float(np.percentile(sizes_arr, 90)),
+        'notified_max': int(sizes_arr.max()),
+        'notified_hist': np.bincount(sizes_arr).tolist(),  # Leads by notified-set size 0, 1, 2, ...
+        'top_score_mean': float(np.mean(top_scores)) if top_scores else 0.0,
+        'seed_s': seed_s,
+        'total_s': time.perf_counter() - started,
+    }
+
+def sweep(grid: Dict[str, Sequence[Any]], num_leads: int = 200, lead_sigma_frac: float = 0.5,
+          engine: str = 'numpy', repeats: int = 1, workers: Optional[int] = None, seed: int = 42) -> List[Dict[str, Any]]:
+    # One row per (grid point, repeat), in grid order. Repeats differ in seeder seed and lead
+    # positions. Runs fan out over a process pool; workers=1 runs in-process.
+    jobs = [(i * repeats + r, params, num_leads, lead_sigma_frac, engine, seed + r)
+            for i, params in enumerate(expand_grid(grid)) for r in range(repeats)]
+    workers = min(workers or os.cpu_count() or 1, len(jobs)) or 1
+    if workers == 1:
+        return [run_scenario(job) for job in jobs]
+    # Small chunks: scenario costs vary a lot with density
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(run_scenario, jobs, chunksize=max(1, len(jobs) // (8 * workers))))
+
+def parse_grid(specs: Sequence[str]) -> Dict[str, List[Any]]:
+    # "num_partners=10,30,60" -> {'num_partners': [10, 30, 60]}; numbers are parsed as such
+    def value(text: str) -> Any:
+        for cast in (int, float):
+            try:
+                return cast(text)
+            except ValueError:
+                pass
+        return text
+    grid: Dict[str, List[Any]] = {}
+    for spec in specs:
+        name, _, values = spec.partition('=')
+        if not values:
+            raise ValueError(f"Grid spec {spec!r} should look like knob=v1,v2,...")
+        grid[name.strip()] = [value(v.strip()) for v in values.split(',')]
+    return grid
+
+def write_table(rows: List[Dict[str, Any]], path: str) -> None:
+    if path.endswith('.json'):
+        with open(path, 'w') as f:
+            json.dump(rows, f, indent=2)
+        return
+    columns: Dict[str, None] = {}
+    for row in rows:
+        columns.update(dict.fromkeys(row))
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=list(columns))
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({k: json.dumps(v) if isinstance(v, list) else v for k, v in row.items()})
+
+def summarize(rows: List[Dict[str, Any]], grid_names: Sequence[str]) -> List[Dict[str, Any]]:
+    # Repeats of one grid point folded into one row: numeric columns averaged, max kept as max
+    groups: Dict[Tuple[Any, ...], List[Dict[str, Any]]] = {}
+    for row in rows:
+        if 'error' not in row:
+            groups.setdefault(tuple(row[name] for name in grid_names), []).append(row)
+    summary = []
+    for key, group in groups.items():
+        row = {'scenario': group[0]['scenario'], **dict(zip(grid_names, key)), 'runs': len(group)}
+        for column, value in group[0].items():
+            if column in row or isinstance(value, list):
+                continue
+            values = [r[column] for r in group]
+            row[column] = max(values) if column == 'notified_max' else float(np.mean(values))
+        summary.append(row)
+    return summary
+
+def format_table(rows: List[Dict[str, Any]], grid_names: Sequence[str]) -> Iterator[str]:
+    columns = ['scenario', *grid_names, 'partners', 'high_comp_frac', 'cap_hit_rate', 'notified_mean', 'notified_p90', 'total_s']
+    yield '  '.join(f"{c:>14}" for c in columns)
+    for row in rows:
+        if 'error' in row:
+            yield '  '.join(f"{str(row.get(c, '')):>14}" for c in ['scenario', *grid_names]) + f"  error: {row['error']}"
+            continue
+        yield '  '.join(f"{row[c]:>14.3f}" if isinstance(row[c], float) else f"{row[c]:>14}" for c in columns)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweep seeder density knobs: seed -> filter -> match per grid point, in parallel")
+    parser.add_argument('--grid', action='append', default=[], metavar='KNOB=V1,V2,...',
+                        help="Repeatable, e.g. --grid num_partners=10,30,60 --grid customer_cluster_sigma_m=50,200")
+    parser.add_argument('--leads', type=int, default=200, help="Lead positions per scenario")
+    parser.add_argument('--lead-sigma', type=float, default=0.5, help="Lead scatter sigma, as a fraction of the seeding radius")
+    parser.add_argument('--engine', choices=('numpy', 'classic'), default='numpy')
+    parser.add_argument('--repeats', type=int, default=1, help="Runs per grid point, with different seeds")
+    parser.add_argument('--workers', type=int, help="Processes (default: all cores)")
+    parser.add_argument('--out', help="Write the full table here (.csv or .json)")
+    args = parser.parse_args()
+
+    grid = parse_grid(args.grid) or {'num_partners': [10]}
+    started = time.perf_counter()
+    rows = sweep(grid, args.leads, args.lead_sigma, args.engine, args.repeats, args.workers)
+    print("\n".join(format_table(summarize(rows, list(grid)) if args.repeats > 1 else rows, list(grid))))
+    print(f"{len(rows)} scenarios in {time.perf_counter() - started:.1f}s")
+    if args.out:
+        write_table(rows, args.out)
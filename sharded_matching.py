@@ -0,0 +1,107 @@
+# ~/Apps/genie/sharded_matching.py
+from typing import Dict, List, Optional, Set, Tuple
+from concurrent.futures import ProcessPoolExecutor
+from math import degrees, floor
+import heapq
+import os
+
+from models import Lead, Partner
+from business_filter import BusinessFilter
+from matchmaking_model import MatchMakingModel
+from distance_profile import PROFILE_RADIUS_M
+from spatial_index import EARTH_RADIUS_M, Cell, cells_within, point_groups
+
+# Per-process shard state, set up once by _init_shard in each worker
+_shard: Optional[Tuple[List[int], BusinessFilter, MatchMakingModel]] = None
+
+def _init_shard(global_idx: List[int], partners: List[Partner], x: int) -> None:
+    global _shard
+    business_filter = BusinessFilter(partners, x=x)
+    _shard = (global_idx, business_filter, MatchMakingModel(partners, business_filter.index))
+
+def _run_shard(leads: List[Lead]) -> List[Tuple[List[int], List[Tuple[int, float]]]]:
+    # Filter + match a batch of leads in this shard. Partners go back as global indices,
+    # so only ints and floats cross the process boundary.
+    global_idx, business_filter, model = _shard
+    position = business_filter.index.position
+    notified = business_filter.notified_partners_batch(leads)
+    matches = model.match_batch(leads, notified)
+    return [
+        ([global_idx[position[id(p)]] for p in n], [(global_idx[position[id(p)]], score) for p, score in m])
+        for n, m in zip(notified, matches)
+    ]
+
+class ShardedMatcher:
+    # Runs BusinessFilter + MatchMakingModel over geographic tiles spread across worker
+    # processes. Every partner with a point within 500m of a tile (the widest rule radius)
+    # is replicated into that tile's shard, so a lead only needs the one shard owning its
+    # tile and the output is identical to the single-process path.
+    # Tiles rather than Partner.zone: a zone doesn't bound where a partner's points are,
+    # so it can't tell which shard a lead needs.
+    def __init__(self, partners: List[Partner], num_shards: Optional[int] = None,
+                 tile_size_m: float = 2000.0, x: int = 5) -> None:
+        self.partners = partners
+        self.num_shards = num_shards or os.cpu_count() or 1
+        self.tile_deg = degrees(tile_size_m / EARTH_RADIUS_M)
+
+        # Tile -> partners with a point within the halo of it
+        tile_partners: Dict[Cell, Set[int]] = {}
+        for i, partner in enumerate(partners):
+            for _, group in point_groups(partner):
+                for loc in group:
+                    for tile in cells_within(loc, PROFILE_RADIUS_M, self.tile_deg):
+                        tile_partners.setdefault(tile, set()).add(i)
+
+        # Longest-processing-time packing of tiles onto shards, weighted by replicated partners
+        loads = [(0, s) for s in range(self.num_shards)]
+        shard_partners: List[Set[int]] = [set() for _ in range(self.num_shards)]
+        self.tile_shard: Dict[Cell, int] = {}
+        for tile, members in sorted(tile_partners.items(), key=lambda kv: -len(kv[1])):
+            load, s = heapq.heappop(loads)
+            self.tile_shard[tile] = s
+            shard_partners[s].update(members)
+            heapq.heappush(loads, (load + len(members), s))
+
+        self.executors: List[Optional[ProcessPoolExecutor]] = []
+        for members in shard_partners:
+            if not members:
+                self.executors.append(None)
+                continue
+            global_idx = sorted(members)  # Global order, so the shard's rules see partners in the same order
+            self.executors.append(ProcessPoolExecutor(
+                max_workers=1, initializer=_init_shard,
+                initargs=(global_idx, [partners[i] for i in global_idx], x),
+            ))
+
+    def tile_of(self, lead: Lead) -> Cell:
+        return (floor(lead.location.lat / self.tile_deg), floor(lead.location.lng / self.tile_deg))
+
+    def notify_and_match(self, leads: List[Lead]) -> List[Tuple[List[Partner], List[Tuple[Partner, float]]]]:
+        # Per lead: (notified partners, ranked matches among them), as BusinessFilter.notified_partners
+        # followed by MatchMakingModel(notified).match would give
+        routed: Dict[int, List[int]] = {}
+        for j, lead in enumerate(leads):
+            s = self.tile_shard.get(self.tile_of(lead))
+            if s is not None:  # No shard means no partner within 500m: nothing to notify
+                routed.setdefault(s, []).append(j)
+
+        futures = {s: self.executors[s].submit(_run_shard, [leads[j] for j in js]) for s, js in routed.items()}
+        results: List[Tuple[List[Partner], List[Tuple[Partner, float]]]] = [([], []) for _ in leads]
+        for s, future in futures.items():
+            for j, (notified, matches) in zip(routed[s], future.result()):
+                results[j] = (
+                    [self.partners[i] for i in notified],
+                    [(self.partners[i], score) for i, score in matches],
+                )
+        return results
+
+    def close(self) -> None:
+        for executor in self.executors:
+            if executor is not None:
+                executor.shutdown()
+
+    def __enter__(self) -> "ShardedMatcher":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
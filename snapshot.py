@@ -0,0 +1,107 @@
+# ~/Apps/genie/snapshot.py
+from typing import Dict, List, Optional
+from math import degrees
+import json
+import mmap
+import os
+import struct
+
+import numpy as np
+
+from models import Partner
+from distance import EARTH_RADIUS_M
+from partner_portfolio import PartnerPortfolio, PackedStrings, LazyPartners
+from spatial_index import GridIndex, CellMap, build_cells
+
+# File layout: MAGIC, format version (u32), header length (u32), JSON header, then every array
+# at an ALIGN-byte boundary. The header maps array name -> dtype/shape/offset plus metadata.
+MAGIC = b'GENIESNP'
+FORMAT_VERSION = 1
+ALIGN = 64
+_PREFIX = struct.Struct('<8sII')
+
+def write_snapshot(path: str, portfolio: PartnerPortfolio, cell_size_m: float = 250.0, version: int = 0) -> None:
+    # version is the data version (e.g. PortfolioUpdater.version) the snapshot was taken at.
+    # Written to a temp file and renamed, so readers never see a half-written snapshot.
+    offsets, blob = portfolio.strings.encode()
+    keys, start, points = build_cells(portfolio.lat, portfolio.lng, degrees(cell_size_m / EARTH_RADIUS_M))
+    arrays = dict(portfolio.columns())
+    arrays.update({
+        'group_start': portfolio.group_start, 'string_offsets': offsets, 'string_blob': blob,
+        'cell_keys': keys, 'cell_start': start, 'cell_points': points,
+    })
+
+    entries: Dict[str, dict] = {}
+    pos = 0
+    for name, arr in arrays.items():
+        arr = np.ascontiguousarray(arr)
+        arrays[name] = arr
+        entries[name] = {'dtype': arr.dtype.str, 'shape': list(arr.shape), 'offset': pos}
+        pos += -(-arr.nbytes // ALIGN) * ALIGN
+    header = json.dumps({
+        'version': version,
+        'cell_size_m': cell_size_m,
+        'num_partners': len(portfolio),
+        'num_points': portfolio.num_points,
+        'arrays': entries,
+    }).encode()
+    data_start = -(-(_PREFIX.size + len(header)) // ALIGN) * ALIGN
+
+    tmp = f"{path}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(_PREFIX.pack(MAGIC, FORMAT_VERSION, len(header)))
+        f.write(header)
+        for name, arr in arrays.items():
+            f.seek(data_start + entries[name]['offset'])
+            f.write(arr.tobytes())
+        f.truncate(data_start + pos)
+    os.replace(tmp, path)
+
+class Snapshot:
+    # A snapshot file mapped into memory. Arrays are views straight onto the mapping, so opening
+    # costs one header parse no matter the size, and processes mapping the same file share the
+    # page cache. The mapping is copy-on-write: in-place updates (e.g. a PortfolioUpdater on
+    # .index) stay private to this process and never reach the file.
+    def __init__(self, path: str) -> None:
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+        magic, format_version, header_len = _PREFIX.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a partner snapshot")
+        if format_version != FORMAT_VERSION:
+            raise ValueError(f"{path} is snapshot format v{format_version}, this build reads v{FORMAT_VERSION}")
+        header = json.loads(self._mmap[_PREFIX.size:_PREFIX.size + header_len])
+        data_start = -(-(_PREFIX.size + header_len) // ALIGN) * ALIGN
+
+        self.version: int = header['version']
+        self.cell_size_m: float = header['cell_size_m']
+        self.arrays: Dict[str, np.ndarray] = {}
+        for name, entry in header['arrays'].items():
+            dtype = np.dtype(entry['dtype'])
+            count = int(np.prod(entry['shape']))
+            self.arrays[name] = np.frombuffer(self._mmap, dtype, count, data_start + entry['offset']).reshape(entry['shape'])
+
+        columns = {name: self.arrays[name] for name in PartnerPortfolio.POINT_COLUMNS + PartnerPortfolio.PARTNER_COLUMNS}
+        strings = PackedStrings(self.arrays['string_offsets'], self.arrays['string_blob'])
+        self.portfolio = PartnerPortfolio(columns, strings, self.arrays['group_start'])
+        self._partners: Optional[LazyPartners] = None
+        self._index: Optional[GridIndex] = None
+
+    @property
+    def partners(self) -> LazyPartners:
+        # Partner objects, built only for the partners something actually looks at
+        if self._partners is None:
+            self._partners = self.portfolio.lazy_partners()
+        return self._partners
+
+    @property
+    def index(self) -> GridIndex:
+        # The prebuilt grid, over self.partners; pass it to BusinessFilter / MatchMakingModel
+        if self._index is None:
+            cells = CellMap(self.arrays['cell_keys'], self.arrays['cell_start'], self.arrays['cell_points'])
+            self._index = self.portfolio.grid_index(self.partners, self.cell_size_m, cells)
+        return self._index
+
+def save_partners(path: str, partners: List[Partner], cell_size_m: float = 250.0, version: int = 0) -> None:
+    write_snapshot(path, PartnerPortfolio.from_partners(partners), cell_size_m, version)
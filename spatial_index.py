@@ -0,0 +1,396 @@
+# ~/Apps/genie/spatial_index.py
+from typing import Dict, Iterable, Iterator, List, MutableMapping, Optional, Sequence, Tuple
+from math import radians, degrees, cos, sin, asin, floor
+
+import numpy as np
+
+from models import Location, Partner
+from distance import EARTH_RADIUS_M, haversine_many, haversine_matrix, to_arrays
+
+# Point kinds stored in the index
+ACTIVE_CUSTOMER = 0
+INACTIVE_CUSTOMER = 1
+RECENT_LEAD = 2
+SPLITTER = 3
+
+CUSTOMER_KINDS = (ACTIVE_CUSTOMER, INACTIVE_CUSTOMER)
+# What BusinessFilter.get_locations considers: customers + recent leads, no splitters
+REFERENCE_KINDS = (ACTIVE_CUSTOMER, INACTIVE_CUSTOMER, RECENT_LEAD)
+ALL_KINDS = (ACTIVE_CUSTOMER, INACTIVE_CUSTOMER, RECENT_LEAD, SPLITTER)
+
+Cell = Tuple[int, int]
+
+def point_groups(partner: Partner) -> List[Tuple[int, List[Location]]]:
+    return [
+        (ACTIVE_CUSTOMER, [c.location for c in partner.active_customers]),
+        (INACTIVE_CUSTOMER, [c.location for c in partner.inactive_but_geographically_relevant_customers]),
+        (RECENT_LEAD, [l.location for l in partner.recent_leads_interested_in]),
+        (SPLITTER, list(partner.splitters)),
+    ]
+
+def cap_extent(lat: float, radius_m: float) -> Tuple[float, float]:
+    # (dlat, dlng) in degrees of the bounding box of the spherical cap around a point at lat.
+    # dlng widens with latitude, so use the exact asin form instead of a flat-earth approximation.
+    ang = radius_m / EARTH_RADIUS_M
+    cos_lat = cos(radians(lat))
+    if cos_lat <= sin(ang):
+        return degrees(ang), 180.0  # Cap touches a pole, every longitude is in play
+    return degrees(ang), degrees(asin(sin(ang) / cos_lat))
+
+def cells_within(loc: Location, radius_m: float, cell_deg: float) -> Iterator[Cell]:
+    # Every cell of a cell_deg grid overlapping the bounding box of the cap around loc
+    dlat, dlng = cap_extent(loc.lat, radius_m)
+    row_lo, row_hi = floor((loc.lat - dlat) / cell_deg), floor((loc.lat + dlat) / cell_deg)
+    col_lo, col_hi = floor((loc.lng - dlng) / cell_deg), floor((loc.lng + dlng) / cell_deg)
+    for row in range(row_lo, row_hi + 1):
+        for col in range(col_lo, col_hi + 1):
+            yield (row, col)
+
+def concat_ranges(starts: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    # [starts[0], starts[0]+counts[0]) ++ [starts[1], ...) ... without a Python loop
+    total = int(counts.sum())
+    offsets = np.cumsum(counts) - counts
+    return np.arange(total, dtype=np.int64) + np.repeat(starts - offsets, counts)
+
+def pack_cell(row: int, col: int) -> int:
+    # One sortable int64 per cell: ordering the keys orders cells by (row, col)
+    return (row << 32) | (col + (1 << 31))
+
+def unpack_cell(key: int) -> Cell:
+    return (key >> 32, (key & 0xFFFFFFFF) - (1 << 31))
+
+def build_cells(lats: np.ndarray, lngs: np.ndarray, cell_deg: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # Grid cells in CSR form: (sorted packed cell keys, start offsets, point ids grouped by cell).
+    # Cell i holds points[start[i]:start[i+1]], in ascending point id order.
+    rows = np.floor(lats / cell_deg).astype(np.int64)
+    cols = np.floor(lngs / cell_deg).astype(np.int64)
+    keys = (rows << 32) | (cols + (1 << 31))
+    points = np.argsort(keys, kind='stable')
+    keys = keys[points]
+    first = np.flatnonzero(np.concatenate(([True], keys[1:] != keys[:-1]))) if len(keys) else np.empty(0, dtype=np.int64)
+    return keys[first], np.append(first, len(keys)).astype(np.int64), points.astype(np.int64)
+
+class CellMap(MutableMapping):
+    # GridIndex.cells over CSR arrays from build_cells (e.g. straight out of a mapped snapshot),
+    # so opening an index doesn't build a dict of every cell. Lookups binary-search the sorted
+    # keys and are remembered; changes and removals go to the same overlay dict.
+    def __init__(self, keys: np.ndarray, start: np.ndarray, points: np.ndarray) -> None:
+        self.keys = keys
+        self.start = start
+        self.points = points
+        self._overlay: Dict[Cell, Optional[np.ndarray]] = {}  # None: no such cell
+
+    def _base(self, cell: Cell) -> Optional[np.ndarray]:
+        key = pack_cell(*cell)
+        i = int(np.searchsorted(self.keys, key))
+        if i == len(self.keys) or self.keys[i] != key:
+            return None
+        return self.points[self.start[i]:self.start[i + 1]]
+
+    def get(self, cell: Cell, default: Optional[np.ndarray] = None) -> Optional[np.ndarray]:
+        if cell in self._overlay:
+            ids = self._overlay[cell]
+        else:
+            ids = self._overlay[cell] = self._base(cell)
+        return default if ids is None else ids
+
+    def __getitem__(self, cell: Cell) -> np.ndarray:
+        ids = self.get(cell)
+        if ids is None:
+            raise KeyError(cell)
+        return ids
+
+    def __contains__(self, cell: object) -> bool:
+        return self.get(cell) is not None
+
+    def __setitem__(self, cell: Cell, ids: np.ndarray) -> None:
+        self._overlay[cell] = ids
+
+    def __delitem__(self, cell: Cell) -> None:
+        self[cell]  # KeyError if it isn't there
+        self._overlay[cell] = None
+
+    def __iter__(self) -> Iterator[Cell]:
+        for key in self.keys.tolist():
+            cell = unpack_cell(key)
+            if cell not in self._overlay:
+                yield cell
+        for cell, ids in list(self._overlay.items()):
+            if ids is not None:
+                yield cell
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+class PointTable:
+    # Every partner point as flat columns; a point id is a position in these arrays.
+    # A layout (layout_ids) lists the live point ids ordered by partner and then by kind,
+    # so the points of one partner (and of one partner+kind) are contiguous runs.
+    # Points can be added, removed or re-kinded in place; the layout is then rebuilt
+    # lazily, the next time something asks for it.
+    def __init__(self, partners: Sequence[Partner]) -> None:
+        owners: List[int] = []
+        kinds: List[int] = []
+        locs: List[Location] = []
+        for i, partner in enumerate(partners):
+            for kind, group in point_groups(partner):
+                owners.extend([i] * len(group))
+                kinds.extend([kind] * len(group))
+                locs.extend(group)
+        lats, lngs = to_arrays(locs)
+        self._init_columns(partners, lats, lngs, np.array(owners, dtype=np.int64), np.array(kinds, dtype=np.int8))
+
+    @classmethod
+    def from_columns(cls, partners: Sequence[Partner], lats: np.ndarray, lngs: np.ndarray,
+                     owners: np.ndarray, kinds: np.ndarray) -> "PointTable":
+        # Wrap existing columns (e.g. a PartnerPortfolio or a mapped snapshot) without touching
+        # the partner objects. Points must already be ordered by owner and then by kind.
+        table = cls.__new__(cls)
+        table._init_columns(partners, lats, lngs, owners, kinds)
+        return table
+
+    def _init_columns(self, partners: Sequence[Partner], lats: np.ndarray, lngs: np.ndarray,
+                      owners: np.ndarray, kinds: np.ndarray) -> None:
+        self.partners = partners
+        # Partner object -> index. A lazily materialized partner sequence keeps this itself.
+        self.position: Dict[int, int] = getattr(partners, 'position', None)
+        if self.position is None:
+            self.position = {id(p): i for i, p in enumerate(partners)}
+        self._buffers = {
+            'lats': lats,
+            'lngs': lngs,
+            'owners': owners,
+            'kinds': kinds,
+            'alive': np.ones(len(lats), dtype=bool),
+        }
+        self.size = len(lats)
+        self._expose()
+        # Built in partner/kind order, so the initial layout is the identity
+        self._set_layout(np.arange(self.size, dtype=np.int64))
+
+    def _expose(self) -> None:
+        # Public columns are exact-length views over the (possibly larger) buffers
+        self.lats = self._buffers['lats'][:self.size]
+        self.lngs = self._buffers['lngs'][:self.size]
+        self.owners = self._buffers['owners'][:self.size]
+        self.kinds = self._buffers['kinds'][:self.size]
+        self.alive = self._buffers['alive'][:self.size]
+
+    def _set_layout(self, layout_ids: np.ndarray) -> None:
+        # partner i owns layout positions [point_start[i], point_start[i+1]) and segments
+        # [seg_offset[i], seg_offset[i+1]); segment s starts at layout position seg_start[s]
+        owners = self.owners[layout_ids]
+        key = owners * len(ALL_KINDS) + self.kinds[layout_ids]
+        seg_start = np.flatnonzero(np.concatenate(([True], key[1:] != key[:-1]))) if len(key) else np.empty(0, dtype=np.int64)
+        n = len(self.partners)
+        self.layout_ids = layout_ids
+        self.point_start = np.concatenate(([0], np.cumsum(np.bincount(owners, minlength=n)))).astype(np.int64)
+        self.seg_offset = np.concatenate(([0], np.cumsum(np.bincount(owners[seg_start], minlength=n)))).astype(np.int64)
+        self.seg_start = seg_start.astype(np.int64)
+        self.seg_kind = self.kinds[layout_ids[seg_start]].astype(np.int64)
+        self._layout_dirty = False
+
+    def ensure_layout(self) -> None:
+        if self._layout_dirty:
+            live = np.flatnonzero(self.alive)
+            order = np.lexsort((self.kinds[live], self.owners[live]))  # Stable: by owner, then kind
+            self._set_layout(live[order])
+
+    def add_point(self, partner_idx: int, kind: int, loc: Location) -> int:
+        if self.size == len(self._buffers['lats']):
+            # Amortized O(1) appends: double the capacity
+            capacity = max(16, 2 * self.size)
+            for name, buf in self._buffers.items():
+                grown = np.zeros(capacity, dtype=buf.dtype)
+                grown[:self.size] = buf[:self.size]
+                self._buffers[name] = grown
+        point_id = self.size
+        self._buffers['lats'][point_id] = loc.lat
+        self._buffers['lngs'][point_id] = loc.lng
+        self._buffers['owners'][point_id] = partner_idx
+        self._buffers['kinds'][point_id] = kind
+        self._buffers['alive'][point_id] = True
+        self.size += 1
+        self._expose()
+        self._layout_dirty = True
+        return point_id
+
+    def find_point(self, partner_idx: int, kind: int, loc: Location) -> int:
+        # Id of a live point of this partner/kind at loc
+        if self._layout_dirty:
+            ids = np.arange(self.size)
+        else:
+            ids = self.layout_ids[self.point_start[partner_idx]:self.point_start[partner_idx + 1]]
+        return self._match_point(ids, partner_idx, kind, loc)
+
+    def _match_point(self, ids: np.ndarray, partner_idx: int, kind: int, loc: Location) -> int:
+        hit = ids[(self.owners[ids] == partner_idx) & (self.kinds[ids] == kind) & self.alive[ids] &
+                  (self.lats[ids] == loc.lat) & (self.lngs[ids] == loc.lng)]
+        if len(hit) == 0:
+            raise KeyError(f"No kind {kind} point at {loc} for partner index {partner_idx}")
+        return int(hit[0])
+
+    def remove_point(self, partner_idx: int, kind: int, loc: Location) -> int:
+        point_id = self.find_point(partner_idx, kind, loc)
+        self.alive[point_id] = False
+        self._layout_dirty = True
+        return point_id
+
+    def change_kind(self, partner_idx: int, old_kind: int, new_kind: int, loc: Location) -> int:
+        point_id = self.find_point(partner_idx, old_kind, loc)
+        self.kinds[point_id] = new_kind
+        self._layout_dirty = True
+        return point_id
+
+    def partner_point_ids(self, partner_idx: np.ndarray) -> np.ndarray:
+        self.ensure_layout()
+        return self.layout_ids[concat_ranges(self.point_start[partner_idx], np.diff(self.point_start)[partner_idx])]
+
+    def partner_bounds(self, kinds: Sequence[int] = ALL_KINDS) -> np.ndarray:
+        # Per-partner bounding box (lat_lo, lat_hi, lng_lo, lng_hi) of its points of the given
+        # kinds -> shape (partners, 4), NaN rows for partners with none
+        self.ensure_layout()
+        ids = self.layout_ids
+        if len(kinds) < len(ALL_KINDS):
+            ids = ids[np.isin(self.kinds[ids], kinds)]
+        out = np.full((len(self.partners), 4), np.nan)
+        if len(ids) == 0:
+            return out
+        owners = self.owners[ids]  # Still grouped by owner
+        starts = np.flatnonzero(np.concatenate(([True], owners[1:] != owners[:-1])))
+        lats, lngs = self.lats[ids], self.lngs[ids]
+        out[owners[starts]] = np.column_stack((
+            np.minimum.reduceat(lats, starts), np.maximum.reduceat(lats, starts),
+            np.minimum.reduceat(lngs, starts), np.maximum.reduceat(lngs, starts),
+        ))
+        return out
+
+    def nearest_by_kind(self, lats: np.ndarray, lngs: np.ndarray, partner_idx: np.ndarray) -> np.ndarray:
+        # Min distance from each of m leads to each kind of point of each listed partner,
+        # from one (m, points) distance matrix -> shape (m, len(partner_idx), 4), inf if none
+        out = np.full((len(lats), len(partner_idx), len(ALL_KINDS)), np.inf)
+        ids = self.partner_point_ids(partner_idx)
+        if len(ids) == 0:
+            return out
+        dists = haversine_matrix(lats, lngs, self.lats[ids], self.lngs[ids])
+
+        # Re-base each partner's segments onto its position inside ids
+        counts = np.diff(self.point_start)[partner_idx]
+        nsegs = np.diff(self.seg_offset)[partner_idx]
+        segs = concat_ranges(self.seg_offset[partner_idx], nsegs)
+        shift = np.repeat(self.point_start[partner_idx] - (np.cumsum(counts) - counts), nsegs)
+        local_partner = np.repeat(np.arange(len(partner_idx)), nsegs)
+        mins = np.minimum.reduceat(dists, self.seg_start[segs] - shift, axis=1)
+        out[:, local_partner, self.seg_kind[segs]] = mins
+        return out
+
+class GridIndex(PointTable):
+    # Uniform lat/lng grid over every partner point. Built once from the partner
+    # lists; a radius query only walks the cells overlapping the query's bounding box.
+    # Point deltas only touch the one cell the point lives in.
+    def __init__(self, partners: Sequence[Partner], cell_size_m: float = 250.0) -> None:
+        super().__init__(partners)
+        self._init_cells(cell_size_m)
+
+    @classmethod
+    def from_columns(cls, partners: Sequence[Partner], lats: np.ndarray, lngs: np.ndarray,
+                     owners: np.ndarray, kinds: np.ndarray, cell_size_m: float = 250.0,
+                     cells: Optional[MutableMapping[Cell, np.ndarray]] = None) -> "GridIndex":
+        # cells, if given, must have been built over these same columns with this cell size
+        index = super().from_columns(partners, lats, lngs, owners, kinds)
+        index._init_cells(cell_size_m, cells)
+        return index
+
+    def _init_cells(self, cell_size_m: float, cells: Optional[MutableMapping[Cell, np.ndarray]] = None) -> None:
+        self.cell_size_m = cell_size_m
+        self.cell_deg = degrees(cell_size_m / EARTH_RADIUS_M)
+        if cells is None:
+            keys, start, points = build_cells(self.lats, self.lngs, self.cell_deg)
+            bounds = start.tolist()
+            cells = {unpack_cell(key): points[a:b] for key, a, b in zip(keys.tolist(), bounds[:-1], bounds[1:])}
+        self.cells = cells
+
+    def cell_of(self, loc: Location) -> Cell:
+        return (floor(loc.lat / self.cell_deg), floor(loc.lng / self.cell_deg))
+
+    def add_point(self, partner_idx: int, kind: int, loc: Location) -> int:
+        point_id = super().add_point(partner_idx, kind, loc)
+        cell = self.cell_of(loc)
+        self.cells[cell] = np.append(self.cells.get(cell, np.empty(0, dtype=np.int64)), point_id)
+        return point_id
+
+    def find_point(self, partner_idx: int, kind: int, loc: Location) -> int:
+        return self._match_point(self.cells.get(self.cell_of(loc), np.empty(0, dtype=np.int64)), partner_idx, kind, loc)
+
+    def remove_point(self, partner_idx: int, kind: int, loc: Location) -> int:
+        point_id = super().remove_point(partner_idx, kind, loc)
+        cell = self.cell_of(loc)
+        remaining = self.cells[cell][self.cells[cell] != point_id]
+        if len(remaining):
+            self.cells[cell] = remaining
+        else:
+            del self.cells[cell]
+        return point_id
+
+    def cells_within(self, loc: Location, radius_m: float) -> Iterator[Cell]:
+        return cells_within(loc, radius_m, self.cell_deg)
+
+    def candidates(self, loc: Location, radius_m: float, kinds: Sequence[int] = ALL_KINDS) -> np.ndarray:
+        # Point ids from the covering cells: a superset of the points within radius_m
+        hits = [self.cells[cell] for cell in self.cells_within(loc, radius_m) if cell in self.cells]
+        if not hits:
+            return np.empty(0, dtype=np.int64)
+        ids = np.concatenate(hits)
+        if len(kinds) < len(ALL_KINDS):
+            ids = ids[np.isin(self.kinds[ids], kinds)]
+        return ids
+
+    def query(self, loc: Location, radius_m: float, kinds: Sequence[int] = ALL_KINDS) -> Tuple[np.ndarray, np.ndarray]:
+        # (point ids, distances) of the points really within radius_m
+        return self.within(loc, self.candidates(loc, radius_m, kinds), radius_m)
+
+    def within(self, loc: Location, ids: np.ndarray, radius_m: float) -> Tuple[np.ndarray, np.ndarray]:
+        # (point ids, distances) of the given points that are within radius_m
+        dists = haversine_many(loc, self.lats[ids], self.lngs[ids])
+        keep = dists <= radius_m
+        return ids[keep], dists[keep]
+
+    def chunk_queries(self, locs: List[Location], radius_m: float, max_matrix_elems: int,
+                      block: int = 4) -> Iterator[Tuple[List[int], np.ndarray]]:
+        # Groups query positions into chunks whose (queries x candidate points) matrix stays under
+        # max_matrix_elems. Queries are visited block by block (block x block cells) so a chunk's
+        # leads share most of their cells, and a chunk is closed once its candidate set grows past
+        # twice the widest single query in it, i.e. once batching stops paying for itself.
+        def order_key(j: int) -> Tuple[int, int, int, int]:
+            row, col = self.cell_of(locs[j])
+            return (row // block, col // block, row, col)
+
+        chunk: List[int] = []
+        chunk_cells: Dict[Cell, None] = {}
+        size = widest = 0
+        for j in sorted(range(len(locs)), key=order_key):
+            cells = [c for c in self.cells_within(locs[j], radius_m) if c in self.cells]
+            own_size = sum(len(self.cells[c]) for c in cells)
+            new_size = size + sum(len(self.cells[c]) for c in cells if c not in chunk_cells)
+            if chunk and ((len(chunk) + 1) * new_size > max_matrix_elems or new_size > 2 * max(widest, own_size)):
+                yield chunk, self.ids_in(chunk_cells)
+                chunk, chunk_cells, size, widest = [], {}, 0, 0
+                new_size = own_size
+            chunk.append(j)
+            chunk_cells.update(dict.fromkeys(cells))
+            size = new_size
+            widest = max(widest, own_size)
+        if chunk:
+            yield chunk, self.ids_in(chunk_cells)
+
+    def ids_in(self, cells: Iterable[Cell]) -> np.ndarray:
+        hits = [self.cells[cell] for cell in cells]
+        return np.concatenate(hits) if hits else np.empty(0, dtype=np.int64)
+
+def min_by_owner(owners: np.ndarray, dists: np.ndarray) -> Dict[int, float]:
+    # Owner -> smallest distance among its points
+    found: Dict[int, float] = {}
+    for owner, d in zip(owners.tolist(), dists.tolist()):
+        if d < found.get(owner, float('inf')):
+            found[owner] = d
+    return found
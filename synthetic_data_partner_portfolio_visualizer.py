@@ -1,88 +1,145 @@
 # ~/Apps/genie/synthetic_data_partner_portfolio_visualizer.py
-from typing import List
+from typing import Dict, List, Optional, Tuple
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import json
 import os
-import shutil
-import matplotlib.pyplot as plt
+
+import numpy as np
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
 from matplotlib.patches import Circle
-from math import radians, cos
 
 from models import Partner, Lead, Location
+from distance import to_arrays
+
+RENDER_VERSION = 1  # Bump when the map layout changes, so every cached map gets redrawn
+CACHE_FILE = '.render_cache.json'
+
+# (account id, output path, lead location, customer / splitter / interested-lead lat+lng arrays)
+Job = Tuple[int, str, Location, Tuple[np.ndarray, np.ndarray], Tuple[np.ndarray, np.ndarray], Tuple[np.ndarray, np.ndarray]]
+
+class PortfolioMapTemplate:
+    # One Agg figure with the static parts (lead star, 100/200/500m circles, labels) drawn once.
+    # Each render adds the partner's scatters, saves, and takes them off again.
+    def __init__(self) -> None:
+        self.fig = Figure()
+        FigureCanvasAgg(self.fig)
+        self.ax = self.fig.add_subplot()
+        ax = self.ax
+        # New lead at (0,0) in red star
+        self.lead_marker = ax.scatter(0, 0, c='red', marker='*', s=200, label='New Lead')
+        ax.add_patch(Circle((0, 0), 500, color='black', fill=False, linewidth=2))
+        ax.add_patch(Circle((0, 0), 200, color='black', fill=False, linewidth=1, linestyle='--'))
+        ax.add_patch(Circle((0, 0), 100, color='black', fill=False, linewidth=1, linestyle='--'))
+        ax.set_xlabel('Meters East')
+        ax.set_ylabel('Meters North')
+        ax.set_aspect('equal')
+
+    def render(self, job: Job) -> None:
+        account_id, path, lead_loc, customers, splitters, interest_leads = job
+        ax = self.ax
+        deg_to_m_lat = 111000  # approx meters per degree lat
+        deg_to_m_lng = 111000 * np.cos(np.radians(lead_loc.lat))  # meters per degree lng at this lat
+
+        added = []
+        extent = 0.0
+        for (lats, lngs), color, label in (
+            (customers, 'blue', 'Customers'),
+            (splitters, 'green', 'Splitters'),
+            (interest_leads, 'orange', 'Interested Leads'),
+        ):
+            if len(lats) == 0:
+                continue
+            xs = (lngs - lead_loc.lng) * deg_to_m_lng
+            ys = (lats - lead_loc.lat) * deg_to_m_lat
+            added.append(ax.scatter(xs, ys, c=color, alpha=0.6, s=20, label=label))
+            extent = max(extent, float(np.abs(xs).max()), float(np.abs(ys).max()))
+
+        # Same z-order and legend order as drawing the lead last
+        self.lead_marker.remove()
+        ax.add_collection(self.lead_marker)
+
+        # Auto-set limits based on points, min 750m
+        max_dist = max(extent * 1.1, 750)
+        ax.set_xlim(-max_dist, max_dist)
+        ax.set_ylim(-max_dist, max_dist)
+        ax.set_title(f'Portfolio Map for Partner {account_id}')
+        legend = ax.legend()
+
+        self.fig.savefig(path)
+        legend.remove()
+        for artist in added:
+            artist.remove()
+
+_template: Optional[PortfolioMapTemplate] = None
+
+def _render_jobs(jobs: List[Job]) -> int:
+    # Runs in the pool workers (and in-process for small runs); one template per process
+    global _template
+    if _template is None:
+        _template = PortfolioMapTemplate()
+    for job in jobs:
+        _template.render(job)
+    return len(jobs)
 
 class SyntheticDataPartnerPortfolioVisualizer:
     def __init__(self, partners: List[Partner]) -> None:
         self.partners = partners
 
-    def visualize(self, lead: Lead) -> None:
-        dir_path = "synthetic_partner_portfolio_maps"
-        if os.path.exists(dir_path):
-            shutil.rmtree(dir_path)
-        os.makedirs(dir_path)
-
-        ref_lat_rad = radians(lead.location.lat)
-        deg_to_m_lat = 111000  # approx meters per degree lat
-        deg_to_m_lng = 111000 * cos(ref_lat_rad)  # meters per degree lng at this lat
+    def visualize(self, lead: Lead, dir_path: str = "synthetic_partner_portfolio_maps",
+                  workers: Optional[int] = None, chunk_size: Optional[int] = None) -> None:
+        # Maps are cached by content: a partner is only redrawn when its points, the lead or
+        # RENDER_VERSION changed, and maps of partners that are gone get deleted. Rendering is
+        # spread over a process pool (workers=1 renders in this process).
+        os.makedirs(dir_path, exist_ok=True)
+        cache_path = os.path.join(dir_path, CACHE_FILE)
+        try:
+            with open(cache_path) as f:
+                cached: Dict[str, str] = json.load(f)
+        except (OSError, ValueError):
+            cached = {}
 
+        digests: Dict[str, str] = {}
+        jobs: List[Job] = []
         for partner in self.partners:
-            fig, ax = plt.subplots()
-
-            # Customers (active + inactive) in blue
-            customer_locs = (
+            customers = to_arrays(
                 [c.location for c in partner.active_customers] +
                 [c.location for c in partner.inactive_but_geographically_relevant_customers]
             )
-            customer_xs = [(loc.lng - lead.location.lng) * deg_to_m_lng for loc in customer_locs]
-            customer_ys = [(loc.lat - lead.location.lat) * deg_to_m_lat for loc in customer_locs]
-            if customer_xs:
-                ax.scatter(customer_xs, customer_ys, c='blue', alpha=0.6, s=20, label='Customers')
-
-            # Splitters in green
-            splitter_xs = [(loc.lng - lead.location.lng) * deg_to_m_lng for loc in partner.splitters]
-            splitter_ys = [(loc.lat - lead.location.lat) * deg_to_m_lat for loc in partner.splitters]
-            if splitter_xs:
-                ax.scatter(splitter_xs, splitter_ys, c='green', alpha=0.6, s=20, label='Splitters')
-
-            # Recent leads of interest in orange
-            interest_lead_locs = [l.location for l in partner.recent_leads_interested_in]
-            interest_lead_xs = [(loc.lng - lead.location.lng) * deg_to_m_lng for loc in interest_lead_locs]
-            interest_lead_ys = [(loc.lat - lead.location.lat) * deg_to_m_lat for loc in interest_lead_locs]
-            if interest_lead_xs:
-                ax.scatter(interest_lead_xs, interest_lead_ys, c='orange', alpha=0.6, s=20, label='Interested Leads')
-
-            # New lead at (0,0) in red star
-            ax.scatter(0, 0, c='red', marker='*', s=200, label='New Lead')
-
-            # Add circles
-            circle_500 = Circle((0, 0), 500, color='black', fill=False, linewidth=2)
-            ax.add_patch(circle_500)
-            circle_200 = Circle((0, 0), 200, color='black', fill=False, linewidth=1, linestyle='--')
-            ax.add_patch(circle_200)
-            circle_100 = Circle((0, 0), 100, color='black', fill=False, linewidth=1, linestyle='--')
-            ax.add_patch(circle_100)
-
-            ax.set_xlabel('Meters East')
-            ax.set_ylabel('Meters North')
-            ax.set_title(f'Portfolio Map for Partner {partner.long_lco_account_id}')
-            ax.set_aspect('equal')
-
-            # Auto-set limits based on points, min 750m
-            all_xs = customer_xs + splitter_xs + interest_lead_xs + [0]
-            all_ys = customer_ys + splitter_ys + interest_lead_ys + [0]
-            if all_xs:
-                max_dist = max(
-                    max(abs(x) for x in all_xs if all_xs),
-                    max(abs(y) for y in all_ys if all_ys)
-                ) * 1.1
-                max_dist = max(max_dist, 750)
-                ax.set_xlim(-max_dist, max_dist)
-                ax.set_ylim(-max_dist, max_dist)
-            else:
-                ax.set_xlim(-750, 750)
-                ax.set_ylim(-750, 750)
-
-            ax.legend()
-
-            # Save plot
-            fig.savefig(os.path.join(dir_path, f'partner_{partner.long_lco_account_id}.png'))
-            plt.close(fig)
-
-        print(f"Partner portfolio maps saved to {dir_path}/")
+            splitters = to_arrays(partner.splitters)
+            interest_leads = to_arrays([l.location for l in partner.recent_leads_interested_in])
+
+            digest = hashlib.blake2b(digest_size=16)
+            digest.update(repr((RENDER_VERSION, partner.long_lco_account_id, tuple(lead.location))).encode())
+            for arr in customers + splitters + interest_leads:
+                digest.update(len(arr).to_bytes(8, 'little'))
+                digest.update(arr.tobytes())
+            name = f'partner_{partner.long_lco_account_id}.png'
+            digests[name] = digest.hexdigest()
+            path = os.path.join(dir_path, name)
+            if cached.get(name) != digests[name] or not os.path.exists(path):
+                jobs.append((partner.long_lco_account_id, path, lead.location, customers, splitters, interest_leads))
+
+        # Drop maps of partners that aren't in the portfolio anymore
+        for name in cached.keys() - digests.keys():
+            if os.path.exists(os.path.join(dir_path, name)):
+                os.remove(os.path.join(dir_path, name))
+
+        workers = min(workers or os.cpu_count() or 1, len(jobs))
+        # A few chunks per worker evens out partners of very different sizes
+        chunk_size = chunk_size or max(1, -(-len(jobs) // (4 * max(1, workers))))
+        chunks = [jobs[i:i + chunk_size] for i in range(0, len(jobs), chunk_size)]
+        if workers <= 1:
+            for chunk in chunks:
+                _render_jobs(chunk)
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                list(pool.map(_render_jobs, chunks))
+
+        tmp = cache_path + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(digests, f)
+        os.replace(tmp, cache_path)
+
+        print(f"Partner portfolio maps saved to {dir_path}/ ({len(jobs)} drawn, {len(digests) - len(jobs)} unchanged)")
@@ -1,14 +1,66 @@
 # ~/Apps/genie/synthetic_data_seeder.py
-from typing import List
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
 from datetime import date, timedelta
+import itertools
+import os
 import random
-from math import radians, sin, cos, sqrt, atan2, pi
+from math import radians, degrees, sin, cos, sqrt, pi, floor
 
 # Import the NamedTuples from models
 from models import Location, Lead, Customer, Partner
+from distance import EARTH_RADIUS_M, haversine, min_distance, to_arrays
+from spatial_index import Cell, cells_within
+
+CURRENT_DATE = date(2025, 7, 25)
+
+# (partner index, center, recent lead count, splitter count, customer count)
+PartnerJob = Tuple[int, Location, int, int, int]
+# (active customers, inactive customers, natural candidate?) per partner, for outlier planning
+CustomerSummary = Tuple[int, int, bool]
+# (active list?, position in that list, new location) of one relocated customer
+Move = Tuple[bool, int, Location]
+
+def check_ring_capacity(num: int, r_min: float, r_max: float, min_dist: float) -> None:
+    # Disks of radius min_dist/2 around the points can't overlap and must fit in the annulus
+    # grown by min_dist/2, at best at hexagonal packing density: anything more can never finish
+    if min_dist <= 0 or num <= 1:
+        return
+    area = pi * ((r_max + min_dist / 2)**2 - max(0.0, r_min - min_dist / 2)**2)
+    max_points = area * 2 / (sqrt(3) * min_dist**2)
+    if num > max_points:
+        raise ValueError(f"Can't place {num} points {min_dist}m apart between {r_min}m and {r_max}m (at most ~{int(max_points)} fit)")
+
+class SpacingGrid:
+    # Spatial hash of accepted points with min_dist-wide cells, so a spacing check only looks
+    # at the handful of points in the cells around the candidate instead of every point so far
+    def __init__(self, min_dist: float) -> None:
+        self.min_dist = min_dist
+        self.cell_deg = degrees(min_dist / EARTH_RADIUS_M) if min_dist > 0 else 0.0
+        self.cells: Dict[Cell, List[Location]] = {}
+
+    def fits(self, candidate: Location) -> bool:
+        if not self.cell_deg:
+            return True  # No spacing constraint
+        for cell in cells_within(candidate, self.min_dist, self.cell_deg):
+            for loc in self.cells.get(cell, ()):
+                if haversine(candidate, loc) < self.min_dist:
+                    return False
+        return True
+
+    def add(self, loc: Location) -> None:
+        if self.cell_deg:
+            cell = (floor(loc.lat / self.cell_deg), floor(loc.lng / self.cell_deg))
+            self.cells.setdefault(cell, []).append(loc)
 
 class SyntheticDataSeeder:
-    def __init__(self, center_lat: float, center_lng: float, radius: float = 1000.0):
+    # Every random draw comes from a stream derived from the root seed: one for the partner
+    # layout (centers and counts), one per partner for its points, one for the outliers. Partners
+    # don't share state, so seed(workers=...) can build them in parallel and the result is the
+    # same for any worker count. The global `random` module is never touched.
+    def __init__(self, center_lat: float, center_lng: float, radius: float = 1000.0, seed: int = 42):
         self.center_lat = center_lat
         self.center_lng = center_lng
         self.radius = radius
@@ -22,16 +74,31 @@ class SyntheticDataSeeder:
         self.splitter_cluster_sigma_m = 100.0
         self.outlier_rate = 0.02
         self.special_outlier_rate = 0.10
+        # Consecutive rejected candidates before a min_dist setting is declared too dense to place
+        self.max_rejections = 10000
 
-        # Set seed for reproducibility, you unpredictable moron
-        random.seed(42)
+        # Root of every stream, for reproducibility, you unpredictable moron
+        self.root_seed = seed
+        # One running stream for generate_*_locations calls made without an rng, so repeated
+        # calls keep drawing new points instead of restarting from the same seed
+        self.locations_rng = self.stream('locations')
 
-    def generate_locations(self, num: int, r_min: float, r_max: float, min_dist: float = 30.0) -> List[Location]:
+    def stream(self, *key: object) -> random.Random:
+        # Independent RNG for one part of the job. str seeds are hashed with sha512, so this
+        # doesn't depend on PYTHONHASHSEED or on which process asks.
+        return random.Random(":".join(map(str, (self.root_seed, *key))))
+
+    def generate_locations(self, num: int, r_min: float, r_max: float, min_dist: float = 30.0,
+                           rng: Optional[random.Random] = None) -> List[Location]:
+        rng = rng or self.locations_rng
+        check_ring_capacity(num, r_min, r_max, min_dist)
         locations = []
+        grid = SpacingGrid(min_dist)
+        rejections = 0
         center_lat_rad = radians(self.center_lat)
         while len(locations) < num:
-            theta = random.uniform(0, 2 * pi)
-            u = random.uniform(0, 1)
+            theta = rng.uniform(0, 2 * pi)
+            u = rng.uniform(0, 1)
             r_squared = u * (r_max**2 - r_min**2) + r_min**2
             r = sqrt(r_squared)
             delta_x = r * cos(theta)
@@ -44,50 +111,101 @@ class SyntheticDataSeeder:
                 lat=candidate_lat,
                 lng=candidate_lng
             )
-            if all(self.haversine(candidate, loc) >= min_dist for loc in locations):
+            if grid.fits(candidate):
+                grid.add(candidate)
                 locations.append(candidate)
+                rejections = 0
+            else:
+                rejections = self._rejected(rejections, len(locations), num, min_dist)
         return locations
 
-    def generate_gaussian_locations(self, num: int, center: Location, sigma_m: float, min_dist: float = 5.0) -> List[Location]:
+    def generate_gaussian_locations(self, num: int, center: Location, sigma_m: float, min_dist: float = 5.0,
+                                    rng: Optional[random.Random] = None) -> List[Location]:
+        rng = rng or self.locations_rng
         locations = []
+        grid = SpacingGrid(min_dist)
+        rejections = 0
         center_lat_rad = radians(center.lat)
         sigma_lat = sigma_m / 111000.0
         sigma_lng = sigma_lat / cos(center_lat_rad) if cos(center_lat_rad) != 0 else sigma_lat
         while len(locations) < num:
-            delta_lat = random.gauss(0, sigma_lat)
-            delta_lng = random.gauss(0, sigma_lng)
+            delta_lat = rng.gauss(0, sigma_lat)
+            delta_lng = rng.gauss(0, sigma_lng)
             candidate_lat = round(center.lat + delta_lat, 6)
             candidate_lng = round(center.lng + delta_lng, 6)
             candidate = Location(
                 lat=candidate_lat,
                 lng=candidate_lng
             )
-            if all(self.haversine(candidate, loc) >= min_dist for loc in locations):
+            if grid.fits(candidate):
+                grid.add(candidate)
                 locations.append(candidate)
+                rejections = 0
+            else:
+                rejections = self._rejected(rejections, len(locations), num, min_dist)
         return locations
 
+    def _rejected(self, rejections: int, placed: int, num: int, min_dist: float) -> int:
+        rejections += 1
+        if rejections >= self.max_rejections:
+            raise ValueError(
+                f"Gave up after {rejections} rejected candidates in a row with {placed}/{num} points placed; "
+                f"min_dist={min_dist}m is too dense for this area"
+            )
+        return rejections
+
     def haversine(self, loc1: Location, loc2: Location) -> float:
-        R = 6371000  # Earth radius in meters
-        lat1, lon1 = radians(loc1.lat), radians(loc1.lng)
-        lat2, lon2 = radians(loc2.lat), radians(loc2.lng)
-        dlat = lat2 - lat1
-        dlon = lon2 - lon1
-        a = sin(dlat / 2)**2 + cos(lat1) * cos(lat2) * sin(dlon / 2)**2
-        c = 2 * atan2(sqrt(a), sqrt(1 - a))
-        return R * c
-
-    def seed(self) -> List[Partner]:
+        return haversine(loc1, loc2)
+
+    def seed(self, workers: Optional[int] = 1) -> List[Partner]:
+        # workers > 1 (None: all cores) builds the partners on a process pool; same output either way
+        jobs = self.partner_jobs()
+        partners = list(ordered_map(self.generate_partner, jobs, workers))
+        moves = self.plan_outliers([self.summarize(p) for p in partners])
+        for i, partner in enumerate(partners):
+            self.relocate(partner, moves.get(i, ()))
+        return partners
+
+    def iter_partners(self, workers: Optional[int] = 1) -> Iterator[Partner]:
+        # Same partners as seed(), one at a time, without ever holding more than a few chunks of
+        # them. Two passes over the per-partner streams: the first only keeps customer counts and
+        # natural-candidate flags to plan the outliers, the second regenerates each partner and
+        # applies its moves on the way out. Costs twice the generation time.
+        jobs = self.partner_jobs()
+        moves = self.plan_outliers(list(ordered_map(self.summarize_job, jobs, workers)))
+        for i, partner in enumerate(ordered_map(self.generate_partner, jobs, workers)):
+            yield self.relocate(partner, moves.pop(i, ()))
+
+    def seed_to_disk(self, directory: str, partners_per_file: int = 10_000, workers: Optional[int] = 1) -> List[str]:
+        # iter_partners() into numbered snapshots of partners_per_file partners each (see
+        # snapshot.py; each file is its own portfolio and index). Returns the paths in order.
+        from snapshot import save_partners
+        os.makedirs(directory, exist_ok=True)
+        partners = self.iter_partners(workers)
+        paths = []
+        while True:
+            chunk = list(itertools.islice(partners, partners_per_file))
+            if not chunk:
+                return paths
+            path = os.path.join(directory, f"part-{len(paths):05d}.snap")
+            save_partners(path, chunk)
+            paths.append(path)
+
+    def partner_jobs(self) -> List[PartnerJob]:
+        # The layout: every partner's center and point counts, from the layout stream
+        layout = self.stream('layout')
+
         # Decide random % of partners to have centers outside
-        random_perc = random.randint(0, 50)
+        random_perc = layout.randint(0, 50)
         num_outside = round(self.num_partners * random_perc / 100)
         partner_indices = list(range(self.num_partners))
-        random.shuffle(partner_indices)
+        layout.shuffle(partner_indices)
         outside_indices = set(partner_indices[:num_outside])
         inside_indices = set(partner_indices[num_outside:])
 
         # Generate partner centers
-        partner_centers_inside = self.generate_locations(len(inside_indices), 0.0, self.radius, min_dist=100.0)
-        partner_centers_outside = self.generate_locations(len(outside_indices), self.radius, self.outer_radius, min_dist=100.0)
+        partner_centers_inside = self.generate_locations(len(inside_indices), 0.0, self.radius, min_dist=100.0, rng=layout)
+        partner_centers_outside = self.generate_locations(len(outside_indices), self.radius, self.outer_radius, min_dist=100.0, rng=layout)
 
         # Function to generate uneven counts summing to total
         def generate_counts(total: int, n: int) -> List[int]:
@@ -95,7 +213,7 @@ class SyntheticDataSeeder:
                 return [0] * n
             base = total // n
             variation = max(1, base // 2)
-            counts = [random.randint(max(0, base - variation), base + variation) for _ in range(n - 1)]
+            counts = [layout.randint(max(0, base - variation), base + variation) for _ in range(n - 1)]
             counts.append(total - sum(counts))
             if counts[-1] < 0:
                 counts[-1] = 0
@@ -106,35 +224,7 @@ class SyntheticDataSeeder:
         customer_counts = generate_counts(self.customers, self.num_partners)
         splitter_counts = generate_counts(self.splitter_locations, self.num_partners)
 
-        # Helper to generate fake Indian mobile
-        def fake_mobile():
-            return "+91" + "".join(random.choice("0123456789") for _ in range(9))
-
-        # Current date
-        current_date = date(2025, 7, 25)
-
-        # Generate customer with given location and address
-        def generate_customer(is_active: bool, location: Location, address: str) -> Customer:
-            if is_active:
-                expiry = current_date + timedelta(days=random.randint(1, 730))
-            else:
-                expiry = current_date - timedelta(days=random.randint(1, 365))
-            return Customer(
-                mobile=fake_mobile(),
-                address=address,
-                plan_expiry_dt=expiry,
-                location=location,
-                installation_speed_in_hrs=random.randint(2, 150)
-            )
-
-        # Generate lead with given location
-        def generate_lead(location: Location) -> Lead:
-            return Lead(
-                mobile=fake_mobile(),
-                location=location
-            )
-
-        partners = []
+        jobs: List[PartnerJob] = []
         inside_idx = outside_idx = 0
         for i in range(self.num_partners):
             if i in outside_indices:
@@ -143,131 +233,155 @@ class SyntheticDataSeeder:
             else:
                 partner_center = partner_centers_inside[inside_idx]
                 inside_idx += 1
+            jobs.append((i, partner_center, lead_counts[i], splitter_counts[i], customer_counts[i]))
+        return jobs
 
-            # Generate recent leads
-            lead_locs = self.generate_gaussian_locations(lead_counts[i], partner_center, self.lead_cluster_sigma_m)
-            recent_leads = [generate_lead(loc) for loc in lead_locs]
-
-            # Generate splitters
-            splitters = self.generate_gaussian_locations(splitter_counts[i], partner_center, self.splitter_cluster_sigma_m)
-
-            # Generate customers
-            customer_locs = self.generate_gaussian_locations(customer_counts[i], partner_center, self.customer_cluster_sigma_m)
-            # Uneven active/inactive: roughly half, but varied
-            num_cust = customer_counts[i]
-            if num_cust > 0:
-                base_active = num_cust // 2
-                variation = max(1, base_active // 2)
-                num_active = random.randint(max(0, base_active - variation), min(num_cust, base_active + variation))
-            else:
-                num_active = 0
-            active_locs = random.sample(customer_locs, num_active)
-            inactive_locs = [loc for loc in customer_locs if loc not in active_locs]
-            active_customers = [generate_customer(True, loc, f"Partner {i} Active Location") for loc in active_locs]
-            inactive_customers = [generate_customer(False, loc, f"Partner {i} Inactive Location") for loc in inactive_locs]
-
-            partner = Partner(
-                long_lco_account_id=1 + i,
-                zone=f"Zone{i+1}",
-                active_customers=active_customers,
-                inactive_but_geographically_relevant_customers=inactive_customers,
-                recent_leads_interested_in=recent_leads,
-                splitters=splitters,
-                tenure=random.randint(1, 10)
-            )
-            partners.append(partner)
-
-        # Now handle outliers, including special cases for the 10% requirement
-        all_customers = []
-        for p in partners:
-            all_customers.extend(p.active_customers)
-            all_customers.extend(p.inactive_but_geographically_relevant_customers)
-        total_cust = len(all_customers)
-        num_outliers = round(self.outlier_rate * total_cust)
+    def generate_partner(self, job: PartnerJob) -> Partner:
+        i, partner_center, lead_count, splitter_count, customer_count = job
+        rng = self.stream('partner', i)
+
+        # Generate recent leads
+        lead_locs = self.generate_gaussian_locations(lead_count, partner_center, self.lead_cluster_sigma_m, rng=rng)
+        recent_leads = [Lead(mobile=fake_mobile(rng), location=loc) for loc in lead_locs]
+
+        # Generate splitters
+        splitters = self.generate_gaussian_locations(splitter_count, partner_center, self.splitter_cluster_sigma_m, rng=rng)
 
-        # Compute natural candidates (partners with any point <=500m from lead)
+        # Generate customers
+        customer_locs = self.generate_gaussian_locations(customer_count, partner_center, self.customer_cluster_sigma_m, rng=rng)
+        # Uneven active/inactive: roughly half, but varied
+        if customer_count > 0:
+            base_active = customer_count // 2
+            variation = max(1, base_active // 2)
+            num_active = rng.randint(max(0, base_active - variation), min(customer_count, base_active + variation))
+        else:
+            num_active = 0
+        active_locs = rng.sample(customer_locs, num_active)
+        chosen = set(active_locs)
+        inactive_locs = [loc for loc in customer_locs if loc not in chosen]
+        active_customers = [generate_customer(rng, True, loc, f"Partner {i} Active Location") for loc in active_locs]
+        inactive_customers = [generate_customer(rng, False, loc, f"Partner {i} Inactive Location") for loc in inactive_locs]
+
+        return Partner(
+            long_lco_account_id=1 + i,
+            zone=f"Zone{i+1}",
+            active_customers=active_customers,
+            inactive_but_geographically_relevant_customers=inactive_customers,
+            recent_leads_interested_in=recent_leads,
+            splitters=splitters,
+            tenure=rng.randint(1, 10)
+        )
+
+    def summarize(self, partner: Partner) -> CustomerSummary:
+        # What outlier planning needs from a partner
         lead_loc = Location(lat=self.center_lat, lng=self.center_lng)
-        natural_candidates = []
-        for p in partners:
-            all_locs = (
-                [c.location for c in p.active_customers] +
-                [c.location for c in p.inactive_but_geographically_relevant_customers] +
-                [l.location for l in p.recent_leads_interested_in] +
-                p.splitters
-            )
-            if all_locs:
-                min_d = min(self.haversine(lead_loc, loc) for loc in all_locs)
-                if min_d <= 500:
-                    natural_candidates.append(p)
+        all_locs = (
+            [c.location for c in partner.active_customers] +
+            [c.location for c in partner.inactive_but_geographically_relevant_customers] +
+            [l.location for l in partner.recent_leads_interested_in] +
+            partner.splitters
+        )
+        # Natural candidate: any point <=500m from lead
+        natural = bool(all_locs) and min_distance(lead_loc, *to_arrays(all_locs)) <= 500
+        return len(partner.active_customers), len(partner.inactive_but_geographically_relevant_customers), natural
+
+    def summarize_job(self, job: PartnerJob) -> CustomerSummary:
+        return self.summarize(self.generate_partner(job))
 
-        n_natural = len(natural_candidates)
+    def plan_outliers(self, summaries: List[CustomerSummary]) -> Dict[int, List[Move]]:
+        # Which customers move where, from per-partner summaries only: a few of the non-candidate
+        # partners get one customer within 100m of the center (the 10% requirement), then others
+        # are sent 2000-10000m away. Customers are numbered globally, partner by partner, actives
+        # first, so picks are indices and nothing holds the customers themselves.
+        rng = self.stream('outliers')
+        totals = [num_active + num_inactive for num_active, num_inactive, _ in summaries]
+        first = list(itertools.accumulate(totals, initial=0))  # Global index of each partner's first customer
+        total_cust = first[-1]
+        num_outliers = round(self.outlier_rate * total_cust)
+
+        n_natural = sum(natural for _, _, natural in summaries)
         # Calculate num_special for >=10% where closest is outlier
         if n_natural == 0:
             num_special = 0
         else:
             num_special = max(1, int((self.special_outlier_rate * n_natural) / (1 - self.special_outlier_rate)))
 
-        non_candidates = [p for p in partners if p not in natural_candidates]
+        non_candidates = [i for i, (_, _, natural) in enumerate(summaries) if not natural]
         if len(non_candidates) < num_special:
             num_special = len(non_candidates)
-        special_partners = random.sample(non_candidates, num_special) if num_special > 0 else []
+        special_partners = rng.sample(non_candidates, num_special) if num_special > 0 else []
+
+        moves: Dict[int, List[Move]] = {}
+
+        def move(g: int, loc: Location) -> None:
+            i = bisect_right(first, g) - 1
+            j = g - first[i]
+            num_active = summaries[i][0]
+            moves.setdefault(i, []).append((True, j, loc) if j < num_active else (False, j - num_active, loc))
 
-        # Apply special outliers: move one customer per special partner close to lead
-        outlier_customers = []
-        for sp in special_partners:
-            sp_customers = sp.active_customers + sp.inactive_but_geographically_relevant_customers
-            if not sp_customers:
+        # Special outliers: one customer per special partner close to lead
+        moved = []
+        for i in special_partners:
+            if not totals[i]:
                 continue
-            cust = random.choice(sp_customers)
-            # Generate location within 100m of lead
-            close_locs = self.generate_locations(1, 0.0, 100.0, min_dist=0.0)
-            new_loc = close_locs[0]
-            new_cust = Customer(
-                mobile=cust.mobile,
-                address=cust.address,
-                plan_expiry_dt=cust.plan_expiry_dt,
-                location=new_loc,
-                installation_speed_in_hrs=cust.installation_speed_in_hrs
-            )
-            if cust in sp.active_customers:
-                idx = sp.active_customers.index(cust)
-                sp.active_customers[idx] = new_cust
-            else:
-                idx = sp.inactive_but_geographically_relevant_customers.index(cust)
-                sp.inactive_but_geographically_relevant_customers[idx] = new_cust
-            outlier_customers.append(new_cust)
+            g = first[i] + rng.randrange(totals[i])
+            # Location within 100m of lead
+            move(g, self.generate_locations(1, 0.0, 100.0, min_dist=0.0, rng=rng)[0])
+            moved.append(g)
 
-        # Apply remaining regular outliers: move to far away (2000-10000m)
-        remaining_outliers = num_outliers - len(outlier_customers)
+        # Remaining regular outliers: far away (2000-10000m), among the customers not moved yet
+        remaining_outliers = min(num_outliers - len(moved), total_cust - len(moved))
         if remaining_outliers > 0:
-            possible_cust = [c for c in all_customers if c not in outlier_customers]
-            if len(possible_cust) < remaining_outliers:
-                remaining_outliers = len(possible_cust)
-            selected = random.sample(possible_cust, remaining_outliers)
-            for cust in selected:
-                far_locs = self.generate_locations(1, 2000.0, 10000.0, min_dist=0.0)
-                new_loc = far_locs[0]
-                new_cust = Customer(
-                    mobile=cust.mobile,
-                    address=cust.address,
-                    plan_expiry_dt=cust.plan_expiry_dt,
-                    location=new_loc,
-                    installation_speed_in_hrs=cust.installation_speed_in_hrs
-                )
-                # Replace in partner
-                replaced = False
-                for p in partners:
-                    if cust in p.active_customers:
-                        idx = p.active_customers.index(cust)
-                        p.active_customers[idx] = new_cust
-                        replaced = True
-                        break
-                    elif cust in p.inactive_but_geographically_relevant_customers:
-                        idx = p.inactive_but_geographically_relevant_customers.index(cust)
-                        p.inactive_but_geographically_relevant_customers[idx] = new_cust
-                        replaced = True
+            moved.sort()
+            # sample() over a range never materializes it
+            for g in rng.sample(range(total_cust - len(moved)), remaining_outliers):
+                for m in moved:  # s-th unmoved customer -> global index
+                    if m > g:
                         break
-                if replaced:
-                    outlier_customers.append(new_cust)
+                    g += 1
+                move(g, self.generate_locations(1, 2000.0, 10000.0, min_dist=0.0, rng=rng)[0])
+        return moves
 
-        return partners
+    def relocate(self, partner: Partner, moves: Sequence[Move]) -> Partner:
+        # Applies plan_outliers moves to a partner's customer lists in place
+        for active, j, loc in moves:
+            customers = partner.active_customers if active else partner.inactive_but_geographically_relevant_customers
+            customers[j] = customers[j]._replace(location=loc)
+        return partner
+
+def map_chunk(fn: Callable[[Any], Any], items: Sequence[Any]) -> List[Any]:
+    return [fn(item) for item in items]
+
+def ordered_map(fn: Callable[[Any], Any], items: Sequence[Any], workers: Optional[int] = 1,
+                chunk: int = 64) -> Iterator[Any]:
+    # fn over items, results in order. With workers > 1 (None: all cores) chunks run on a process
+    # pool, at most two per worker ahead of the consumer, so results never pile up in memory.
+    workers = min(workers or os.cpu_count() or 1, -(-len(items) // chunk))
+    if workers <= 1:
+        yield from map(fn, items)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending: Deque[Future] = deque()
+        for start in range(0, len(items), chunk):
+            pending.append(pool.submit(map_chunk, fn, items[start:start + chunk]))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+def fake_mobile(rng: random.Random) -> str:
+    # Fake Indian mobile: 9 uniform digits, drawn as one number
+    return f"+91{rng.randrange(10**9):09d}"
+
+def generate_customer(rng: random.Random, is_active: bool, location: Location, address: str) -> Customer:
+    if is_active:
+        expiry = CURRENT_DATE + timedelta(days=rng.randint(1, 730))
+    else:
+        expiry = CURRENT_DATE - timedelta(days=rng.randint(1, 365))
+    return Customer(
+        mobile=fake_mobile(rng),
+        address=address,
+        plan_expiry_dt=expiry,
+        location=location,
+        installation_speed_in_hrs=rng.randint(2, 150)
+    )